@@ -19,6 +19,8 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     jwt.init_app(app)
     app.redis_client = redis.from_url(app.config['REDIS_URL'], decode_responses=True)
+    # valores binários do cache (msgpack/zlib) não podem passar pelo decode
+    app.redis_binary_client = redis.from_url(app.config['REDIS_URL'], decode_responses=False)
     
     # REGISTRO DO DB
     from app.models import database
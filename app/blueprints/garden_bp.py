@@ -2,7 +2,8 @@
 Blueprints/rotas às plantas do usuário (seu jardim)
 São:
 (prefixo /api/v1/garden/)
-- /identify -> cria uma planta
+- /identify -> cria uma planta (?async=1 -> enfileira)
+- /identify/jobs/<job_id> -> status da identificação assíncrona
 - /plants -> suas plantas
 - /plants/<plant_id> -> vê, edita, tira uma planta
 - /plants/<plant_id>/track-watering -> tira ou coloca tag de busca no celery
@@ -10,63 +11,52 @@ São:
 - /plants/<plant_id>/analyze-health -> se parecer doente, chama pro gemini ajuda da saude
 """
 
-import json
 from flask import Blueprint, request, current_app
-from werkzeug.exceptions import BadRequest, NotFound
+from werkzeug.exceptions import BadRequest, NotFound, RequestEntityTooLarge
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.extensions import db
 from app.models.database import User, PlantGuide, UserPlant
-from app.services.plant_id_service import PlantIdService
-from app.utils.response_utils import make_success_response, make_error_response
+from app.services.client_registry import get_plant_id_service
+from app.utils.response_utils import (
+    make_success_response,
+    make_error_response,
+    make_etag,
+    etag_matches,
+    make_not_modified_response,
+    with_cache_headers
+)
 from app.utils.security_utils import check_daily_limit
-from app.tasks import enrich_plant_details_task, enrich_health_data_task
+from app.tasks import enrich_plant_details_task, enrich_health_data_task, process_identification_job
 from datetime import datetime
-from app.utils.achievement_utils import grant_achievement_if_not_exists
 from app.tasks import update_watering_streak
 from app.utils.location_utils import get_fallback_location
+from app.utils.watering_utils import refresh_next_watering_due
+from app.utils.plant_id_cache_utils import cached_plant_id_call
+from app.utils.image_utils import call_with_normalized_image
+from app.utils.upload_utils import read_image_upload
+from app.utils.projection_utils import project_identification, parse_fields_param
+from app.utils.disease_plan_utils import get_disease_plan
+from app.utils.garden_utils import add_identified_plant_to_garden
+from app.utils.guide_cache_utils import get_guide_data_since, guide_version
+from app.utils.garden_list_utils import fetch_garden_page, parse_list_fields, garden_list_version
+from app.utils.garden_sync_utils import get_garden_changes, record_plant_tombstone
+from app.utils.identify_job_utils import create_identify_job, get_identify_job, JOB_PENDING, JOB_COMPLETED, JOB_FAILED
 
 
-# Define o tempo de vida do cache em segundos (7 dias)
-CACHE_TTL = 60 * 60 * 24 * 7
-
 garden_bp = Blueprint('garden_bp', __name__, url_prefix='/api/v1/garden')
 
-def _get_guide_data(entity_id: str) -> dict | None:
-    """
-    Função auxiliar "burra": busca dados do guia botânico APENAS
-    no cache (Redis -> Postgres). Retorna None se não encontrar.
-    NÃO CHAMA O GEMINI.
-    """
-    
-    # Tenta no Redis
-    try:
-        cached_guide = current_app.redis_client.get(f"guide:{entity_id}")
-        if cached_guide:
-            return json.loads(cached_guide)
-    except Exception as e:
-        current_app.logger.error(f"Erro ao acessar o cache Redis: {e}")
-        # Continua para o DB se o Redis falhar
-
-    # Tenta no Postgres
-    guide_from_db = PlantGuide.query.get(entity_id)
-    
-    # Verifica se os caches no DB estão preenchidos
-    if guide_from_db and guide_from_db.details_cache and guide_from_db.nutritional_cache:
-        plant_guide_data = {
-            "details": guide_from_db.details_cache,
-            "nutritional": guide_from_db.nutritional_cache
-        }
-        
-        # Re-popula o cache do Redis (se falhou ou estava vazio)
-        try:
-            current_app.redis_client.set(f"guide:{entity_id}", json.dumps(plant_guide_data), ex=CACHE_TTL)
-        except Exception as e:
-            current_app.logger.error(f"Erro ao repopular o cache Redis: {e}")
+def _project_identification_response(identification: dict) -> dict:
+    """Aplica ?fields= / ?verbose=1 (padrão: visão compacta) ao payload do Plant.id."""
+    return project_identification(
+        identification,
+        fields=parse_fields_param(request.args.get('fields')),
+        verbose=request.args.get('verbose', '').lower() in ('1', 'true'),
+        top_n=current_app.config.get('IDENTIFY_TOP_SUGGESTIONS', 3)
+    )
 
-        return plant_guide_data
-    
-    # Cache MISS total (ou caches do DB estão vazios)
-    return None
+def _image_too_large_response():
+    max_mb = current_app.config.get('MAX_CONTENT_LENGTH', 0) / (1024 * 1024)
+    return make_error_response(f"A imagem excede o limite de {max_mb:.0f}MB.", "PAYLOAD_TOO_LARGE", 413)
 
 
 @garden_bp.route('/identify', methods=['POST'])
@@ -75,19 +65,22 @@ def identify_and_add_plant():
     """
     Endpoint de identificação: recebe imagem e localização (opcional),
     identifica, salva a URL da imagem e adiciona ao jardim.
+    A imagem pode vir em base64 (JSON), multipart ou binário cru.
+    identification_data vem compacto (top sugestões); use ?verbose=1 para o
+    payload completo do Plant.id ou ?fields=a.b,c para escolher os campos.
+    Com ?async=1 apenas guarda a imagem, enfileira a identificação no
+    celery e responde 202 com o job_id (ver /identify/jobs/<job_id>).
     """
+    upload = None
     try:
         current_user_id = get_jwt_identity()
         user = User.query.get(current_user_id)
         if not user:
              raise NotFound("Usuário não encontrado.")
-        data = request.get_json() 
-        image_b64 = data.get('image')
-        if not image_b64:
-            raise BadRequest("A imagem (em base64) é obrigatória.")
+        upload, fields = read_image_upload()
         
-        latitude = data.get('latitude')
-        longitude = data.get('longitude')
+        latitude = fields['latitude']
+        longitude = fields['longitude']
 
         if latitude is None or longitude is None:
             current_app.logger.info(f"Localização não fornecida. Verificando perfil {user.id}...")
@@ -103,64 +96,35 @@ def identify_and_add_plant():
             else:
                 current_app.logger.info("Usuário sem estado, usando fallback padrão (Brasília).")
 
-        # Identificação da Planta
-        plant_service = PlantIdService(api_key=current_app.config['PLANT_ID_API_KEY'])
-        identification = plant_service.identify_plant(image_b64, latitude, longitude)
-        
-        best_match = identification['result']['classification']['suggestions'][0]
-        entity_id = best_match['details']['entity_id']
-        scientific_name = best_match['name']
-        
-        # Extrai a URL da imagem do Plant.id
-        image_url_from_plantid = identification.get('input', {}).get('images', [None])[0]
-
-        # Salva no Guia Global (se não existir)
-        guide_from_db = PlantGuide.query.get(entity_id)
-        if not guide_from_db:
-            guide_from_db = PlantGuide(
-                entity_id=entity_id,
-                scientific_name=scientific_name
-                # Caches 'details', 'nutritional', 'health' começam como NULL
+        if request.args.get('async', '').lower() in ('1', 'true'):
+            job_id = create_identify_job(current_user_id, upload.to_base64(), latitude, longitude)
+            process_identification_job.delay(job_id)
+            return make_success_response(
+                {"job_id": job_id, "status": JOB_PENDING},
+                "Identificação enfileirada. Consulte o status pelo job_id.",
+                202
             )
-            db.session.add(guide_from_db)
 
-        user_plant = UserPlant.query.filter_by(user_id=current_user_id, plant_entity_id=entity_id).first()
-        if not user_plant:
-            # --- LÓGICA DE CONQUISTA ---
-            # Verifica o número de plantas ANTES de adicionar a nova
-            plant_count = user.garden.count()
-            if plant_count == 0:
-                grant_achievement_if_not_exists(user, 'first_plant')
-            if plant_count == 9:
-                grant_achievement_if_not_exists(user, 'ten_plants')
-
-        # Salva no Jardim do Usuário
-        user_plant = UserPlant.query.filter_by(user_id=current_user_id, plant_entity_id=entity_id).first()
-        if not user_plant:
-            user_plant = UserPlant(
-                user_id=current_user_id,
-                plant_entity_id=entity_id,
-                nickname=scientific_name,
-                primary_image_url=image_url_from_plantid
+        # Identificação da Planta
+        # Reenvios da mesma foto saem do cache, sem nova chamada paga ao Plant.id
+        plant_service = get_plant_id_service()
+        identification, from_cache = cached_plant_id_call(
+            "identify", current_user_id, upload, latitude, longitude,
+            lambda: call_with_normalized_image(
+                upload, lambda upload_b64: plant_service.identify_plant(upload_b64, latitude, longitude)
             )
-            db.session.add(user_plant)
-        else:
-            # Se já tem a planta, atualiza a imagem principal
-            user_plant.primary_image_url = image_url_from_plantid
-        
-        db.session.commit()
+        )
+        if from_cache:
+            current_app.logger.info(f"Identificação servida pelo cache para o usuário {user.id}.")
 
-        final_response = {
-            "user_plant_id": user_plant.id,
-            "nickname": user_plant.nickname,
-            "scientific_name": scientific_name,
-            "tracked_watering": user_plant.tracked_watering,
-            "primary_image_url": user_plant.primary_image_url,
-            "identification_data": identification
-        }
+        final_response = add_identified_plant_to_garden(user, identification)
+        db.session.commit()
+        final_response["identification_data"] = _project_identification_response(identification)
         
         return make_success_response(final_response, "Planta identificada e adicionada ao seu jardim.", 201)
 
+    except RequestEntityTooLarge:
+        return _image_too_large_response()
     except BadRequest as e:
         db.session.rollback()
         return make_error_response(str(e), "BAD_REQUEST", 400)
@@ -168,66 +132,174 @@ def identify_and_add_plant():
         db.session.rollback()
         current_app.logger.error(f"Erro em /identify: {e}")
         return make_error_response(f"Ocorreu um erro interno ao processar a planta.", "INTERNAL_SERVER_ERROR", 500)
+    finally:
+        if upload:
+            upload.close()
+
+
+@garden_bp.route('/identify/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_identify_job_status(job_id):
+    """
+    Status de uma identificação assíncrona (PENDING, RUNNING, COMPLETED,
+    FAILED). Lê apenas o Redis, sem tocar no Postgres.
+    """
+    try:
+        job = get_identify_job(job_id)
+        if not job or job.get('user_id') != str(get_jwt_identity()):
+            raise NotFound("Identificação não encontrada (ou expirada).")
+
+        result = job.get('result')
+        if result and 'identification_data' in result:
+            result['identification_data'] = _project_identification_response(result['identification_data'])
+
+        job_data = {
+            "job_id": job_id,
+            "status": job.get('status'),
+            "result": result,
+            "error": job.get('error')
+        }
+
+        if job.get('status') == JOB_COMPLETED:
+            return make_success_response(job_data, "Planta identificada e adicionada ao seu jardim.")
+        return make_success_response(job_data, "Identificação em andamento." if job.get('status') != JOB_FAILED else "A identificação falhou.")
+
+    except NotFound as e:
+        return make_error_response(str(e), "NOT_FOUND", 404)
+    except Exception as e:
+        current_app.logger.error(f"Erro em /identify/jobs: {e}")
+        return make_error_response(f"Ocorreu um erro interno: {str(e)}", "INTERNAL_SERVER_ERROR", 500)
 
 
 @garden_bp.route('/plants', methods=['GET'])
 @jwt_required()
 def get_user_plants():
-    """Retorna todas as plantas do jardim do usuário."""
+    """
+    Retorna as plantas do jardim do usuário, da mais nova para a mais antiga.
+    Sem parâmetros devolve o jardim inteiro. ?limit= (e o ?cursor= recebido em
+    meta.next_cursor) pagina por keyset; ?fields= escolhe os campos.
+    """
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        
-        plants_list = []
-        for plant in user.garden.all():
-            plants_list.append({
-                "id": plant.id,
-                "nickname": plant.nickname,
-                "scientific_name": plant.plant_info.scientific_name,
-                "last_watered": plant.last_watered.isoformat() if plant.last_watered else None,
-                "tracked_watering": plant.tracked_watering,
-                "primary_image_url": plant.primary_image_url 
-            })
-            
-        return make_success_response(plants_list, "Jardim carregado com sucesso.")
+        fields = parse_list_fields(parse_fields_param(request.args.get('fields')))
+        cursor = request.args.get('cursor')
+
+        limit = request.args.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise BadRequest("O parâmetro 'limit' deve ser um número inteiro.")
+        if limit is None and cursor:
+            limit = current_app.config.get('GARDEN_PAGE_DEFAULT_LIMIT', 50)
+        if limit is not None:
+            if limit < 1:
+                raise BadRequest("O parâmetro 'limit' deve ser maior que zero.")
+            limit = min(limit, current_app.config.get('GARDEN_PAGE_MAX_LIMIT', 200))
+
+        # 304 antes de carregar as plantas, se o jardim não mudou
+        etag = make_etag(current_user_id, *garden_list_version(current_user_id))
+        cache_control = current_app.config.get('GARDEN_LIST_CACHE_CONTROL', 'private, no-cache')
+        if etag_matches(etag):
+            return make_not_modified_response(etag, cache_control)
+
+        plants_list, next_cursor = fetch_garden_page(current_user_id, fields=fields, limit=limit, cursor=cursor)
+
+        meta = None
+        if limit is not None:
+            meta = {"next_cursor": next_cursor, "limit": limit}
+        return with_cache_headers(
+            make_success_response(plants_list, "Jardim carregado com sucesso.", meta=meta),
+            etag,
+            cache_control
+        )
+    except BadRequest as e:
+        return make_error_response(str(e), "BAD_REQUEST", 400)
     except Exception as e:
         current_app.logger.error(f"Erro em /plants: {e}")
         return make_error_response("Erro ao carregar o jardim.", "INTERNAL_SERVER_ERROR", 500)
 
 
+@garden_bp.route('/changes', methods=['GET'])
+@jwt_required()
+def get_garden_changes_since():
+    """
+    Sync incremental do jardim: plantas novas/alteradas, guias reescritos e
+    plantas removidas desde ?since=<next_token anterior>. Sem 'since'
+    (ou com token expirado) devolve tudo, com full_sync=true.
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        changes = get_garden_changes(current_user_id, request.args.get('since'))
+        return make_success_response(changes, "Alterações do jardim carregadas.")
+    except BadRequest as e:
+        return make_error_response(str(e), "BAD_REQUEST", 400)
+    except Exception as e:
+        current_app.logger.error(f"Erro em /changes: {e}")
+        return make_error_response("Erro ao carregar as alterações do jardim.", "INTERNAL_SERVER_ERROR", 500)
+
+
 @garden_bp.route('/plants/<uuid:plant_id>', methods=['GET'])
 @jwt_required()
 def get_plant_details(plant_id):
     """Busca os detalhes de uma planta específica no jardim do usuário."""
     try:
         current_user_id = get_jwt_identity()
-        user_plant = UserPlant.query.filter_by(id=plant_id, user_id=current_user_id).first()
+        # só as colunas da tela + os carimbos de versão; o guia (JSONBs) vem do cache
+        user_plant = db.session.query(
+            UserPlant.id,
+            UserPlant.nickname,
+            UserPlant.added_at,
+            UserPlant.last_watered,
+            UserPlant.care_notes,
+            UserPlant.tracked_watering,
+            UserPlant.primary_image_url,
+            UserPlant.plant_entity_id,
+            UserPlant.updated_at,
+            PlantGuide.updated_at.label('guide_updated_at')
+        ).join(PlantGuide, UserPlant.plant_entity_id == PlantGuide.entity_id).filter(
+            UserPlant.id == plant_id,
+            UserPlant.user_id == current_user_id
+        ).first()
         
         if not user_plant:
             raise NotFound("Planta não encontrada no seu jardim.")
 
-        guide_from_db = user_plant.plant_info
+        # 304 antes de buscar o guia e serializar
+        etag = make_etag(user_plant.id, user_plant.updated_at, user_plant.guide_updated_at)
+        cache_control = current_app.config.get('PLANT_DETAILS_CACHE_CONTROL', 'private, no-cache')
+        if etag_matches(etag):
+            return make_not_modified_response(etag, cache_control)
+
+        # o guia em cache nunca é mais velho que o do banco; o ETag da resposta
+        # usa a versão servida (pode ser mais nova que a lida acima)
+        guide_data = get_guide_data_since(user_plant.plant_entity_id, user_plant.guide_updated_at) or {}
+        etag = make_etag(user_plant.id, user_plant.updated_at, guide_version(guide_data) or user_plant.guide_updated_at)
 
         response_data = {
             "id": user_plant.id,
             "nickname": user_plant.nickname,
-            "scientific_name": guide_from_db.scientific_name,
+            "scientific_name": guide_data.get("scientific_name"),
             "added_at": user_plant.added_at.isoformat(),
             "last_watered": user_plant.last_watered.isoformat() if user_plant.last_watered else None,
             "care_notes": user_plant.care_notes,
             "tracked_watering": user_plant.tracked_watering,
             "primary_image_url": user_plant.primary_image_url,
-            "has_details": guide_from_db.details_cache is not None,
-            "has_nutritional": guide_from_db.nutritional_cache is not None,
-            "has_health_info": guide_from_db.health_cache is not None,
+            "has_details": guide_data.get("details") is not None,
+            "has_nutritional": guide_data.get("nutritional") is not None,
+            "has_health_info": guide_data.get("health") is not None,
             
             # para o flutter / json de guide
-            "guide_details": guide_from_db.details_cache,
-            "guide_nutritional": guide_from_db.nutritional_cache,
-            "guide_health": guide_from_db.health_cache
+            "guide_details": guide_data.get("details"),
+            "guide_nutritional": guide_data.get("nutritional"),
+            "guide_health": guide_data.get("health")
         }
         
-        return make_success_response(response_data, "Detalhes da planta carregados.")
+        return with_cache_headers(
+            make_success_response(response_data, "Detalhes da planta carregados."),
+            etag,
+            cache_control
+        )
     except NotFound as e:
         return make_error_response(str(e), "NOT_FOUND", 404)
     except Exception as e:
@@ -257,10 +329,13 @@ def update_plant_details(plant_id):
 
         if 'last_watered' in data:
             user_plant.last_watered = datetime.fromisoformat(data['last_watered']) if data['last_watered'] else None
-            # Dispara um worker para recalcular o streak e conceder badges
-            update_watering_streak.delay(user_id=current_user_id)
+            refresh_next_watering_due(user_plant)
             
         db.session.commit()
+
+        if 'last_watered' in data:
+            # Dispara um worker para recalcular o streak e conceder badges
+            update_watering_streak.delay(user_id=current_user_id)
         
         response_data = {
             "id": user_plant.id,
@@ -292,6 +367,8 @@ def delete_plant(plant_id):
         if not user_plant:
             raise NotFound("Planta não encontrada no seu jardim.")
         
+        # avisa o sync incremental do app (/garden/changes)
+        record_plant_tombstone(current_user_id, user_plant.id)
         db.session.delete(user_plant)
         db.session.commit()
         
@@ -315,6 +392,7 @@ def track_plant_watering(plant_id):
             raise NotFound("Planta não encontrada no seu jardim.")
         
         user_plant.tracked_watering = True
+        refresh_next_watering_due(user_plant)
         db.session.commit()
         
         return make_success_response(
@@ -339,6 +417,7 @@ def untrack_plant_watering(plant_id):
             raise NotFound("Planta não encontrada no seu jardim.")
         
         user_plant.tracked_watering = False
+        refresh_next_watering_due(user_plant)
         db.session.commit()
         
         return make_success_response(
@@ -394,19 +473,16 @@ def trigger_deep_analysis(plant_id):
 @check_daily_limit(limit=3)
 def trigger_health_analysis(plant_id):
     """
-    Recebe UMA NOVA imagem, faz avaliação no Plant.id e dispara 
-    worker do Gemini se encontrar doença.
+    Recebe UMA NOVA imagem (base64, multipart ou binário), faz avaliação
+    no Plant.id e dispara worker do Gemini se encontrar doença.
     """
+    upload = None
     try:
         current_user_id = get_jwt_identity()
-        data = request.get_json()
-        image_b64 = data.get('image')
-
-        if not image_b64:
-            raise BadRequest("A imagem (em base64) é obrigatória para análise de saúde.")
+        upload, fields = read_image_upload("A imagem (em base64) é obrigatória para análise de saúde.")
         
-        latitude = data.get('latitude')
-        longitude = data.get('longitude')
+        latitude = fields['latitude']
+        longitude = fields['longitude']
 
         user_plant = UserPlant.query.filter_by(id=plant_id, user_id=current_user_id).first()
         if not user_plant:
@@ -414,8 +490,13 @@ def trigger_health_analysis(plant_id):
             
         guide = user_plant.plant_info
         
-        plant_service = PlantIdService(api_key=current_app.config['PLANT_ID_API_KEY'])
-        health_assessment = plant_service.assess_health(image_b64, latitude, longitude)
+        plant_service = get_plant_id_service()
+        health_assessment, _ = cached_plant_id_call(
+            "health", current_user_id, upload, latitude, longitude,
+            lambda: call_with_normalized_image(
+                upload, lambda upload_b64: plant_service.assess_health(upload_b64, latitude, longitude)
+            )
+        )
 
         diseases = health_assessment.get('result', {}).get('disease', {}).get('suggestions', [])
         
@@ -433,9 +514,10 @@ def trigger_health_analysis(plant_id):
 
         disease_name = high_prob_disease['name']
 
-        if guide.health_cache and guide.health_cache.get('disease_name') == disease_name:
+        cached_plan = get_disease_plan(guide.entity_id, disease_name)
+        if cached_plan is not None:
              return make_success_response(
-                {"health_assessment": health_assessment, "status": "COMPLETED", "cached_plan": guide.health_cache},
+                {"health_assessment": health_assessment, "status": "COMPLETED", "cached_plan": cached_plan},
                 "Plano de tratamento para esta doença já foi gerado."
             )
         
@@ -453,6 +535,8 @@ def trigger_health_analysis(plant_id):
             status_code=202
         )
 
+    except RequestEntityTooLarge:
+        return _image_too_large_response()
     except BadRequest as e:
         return make_error_response(str(e), "BAD_REQUEST", 400)
     except NotFound as e:
@@ -460,4 +544,7 @@ def trigger_health_analysis(plant_id):
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Erro em /analyze-health: {e}")
-        return make_error_response(f"Ocorreu um erro interno: {str(e)}", "INTERNAL_SERVER_ERROR", 500)
\ No newline at end of file
+        return make_error_response(f"Ocorreu um erro interno: {str(e)}", "INTERNAL_SERVER_ERROR", 500)
+    finally:
+        if upload:
+            upload.close()
\ No newline at end of file
@@ -11,7 +11,14 @@ from app.models.database import User
 from app.extensions import db
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.exceptions import BadRequest, NotFound
-from app.utils.response_utils import make_success_response, make_error_response
+from app.utils.response_utils import (
+    make_success_response,
+    make_error_response,
+    make_etag,
+    etag_matches,
+    make_not_modified_response,
+    with_cache_headers
+)
 
 profile_bp = Blueprint('profile_bp', __name__, url_prefix='/api/v1/profile')
 
@@ -24,11 +31,29 @@ def get_my_profile():
     """
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = User.query.with_entities(
+            User.id,
+            User.email,
+            User.bio,
+            User.profile_picture_url,
+            User.country,
+            User.state,
+            User.subscription_status,
+            User.subscription_expires_at,
+            User.watering_streak,
+            User.created_at,
+            User.updated_at
+        ).filter(User.id == current_user_id).first()
 
         if not user:
             raise NotFound("Usuário não encontrado.")
 
+        # 304 antes de serializar, se o perfil não mudou
+        etag = make_etag(user.id, user.updated_at)
+        cache_control = current_app.config.get('PROFILE_CACHE_CONTROL', 'private, max-age=60, must-revalidate')
+        if etag_matches(etag):
+            return make_not_modified_response(etag, cache_control)
+
         # Serializa os dados do perfil para enviar como JSON
         profile_data = {
             "id": user.id,
@@ -43,7 +68,11 @@ def get_my_profile():
             "created_at": user.created_at.isoformat()
         }
         
-        return make_success_response(profile_data, "Perfil carregado com sucesso.")
+        return with_cache_headers(
+            make_success_response(profile_data, "Perfil carregado com sucesso."),
+            etag,
+            cache_control
+        )
 
     except NotFound as e:
         return make_error_response(str(e), "NOT_FOUND", 404)
@@ -5,10 +5,48 @@ usando o terminal para testes e seeding.
 """
 
 import click
+import random
+import statistics
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
 from flask import current_app
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
 from app.extensions import db
-from app.models.database import Achievement
+from app.models.database import Achievement, User, UserPlant, PlantGuide
 from app.utils.achievement_utils import ACHIEVEMENT_DEFINITIONS
+from app.utils.watering_utils import (
+    refresh_next_watering_due_for_ids,
+    refresh_next_watering_due_for_entity,
+    find_inconsistent_next_watering_due,
+    extract_watering_frequency_days
+)
+from app.services.gemini_service import GeminiService, AsyncGeminiService
+from app.utils.gemini_stub_utils import GeminiStubServer, SAMPLE_DETAILS, SAMPLE_NUTRITIONAL, SAMPLE_DISEASE
+from app.utils.fcm_stub_utils import FcmStubServer
+from app.services.push_notification_service import enqueue_pushes, drain_push_queue, claim_push_batch
+from app.utils.fcm_token_utils import invalidate_stale_tokens
+from app.utils.metrics_utils import get_metrics, list_metric_groups, reset_metrics
+from app.utils.projection_utils import project_identification
+from app.utils.garden_list_utils import fetch_garden_page
+from app.utils.cache_codec_utils import encode_value, decode_value, zstandard
+from app.models.schemas import PlantInfo, NutritionalInfo, DiseaseInfo
+from app.utils.guide_cache_utils import (
+    GUIDE_CACHE_METRICS_GROUP,
+    flush_guide_cache_stats,
+    summarize_guide_cache_stats,
+    get_guide_data,
+    set_guide_cache,
+    guide_payload
+)
+from app.services.client_registry import (
+    HTTP_CLIENTS_METRICS_GROUP,
+    flush_http_client_stats,
+    summarize_http_client_stats
+)
 import redis
 
 def register_commands(app):
@@ -82,4 +120,673 @@ def register_commands(app):
             click.echo("   - Se estiverem certos, a rede pode estar bloqueando a porta.")
             click.echo(f"   - Detalhe: {e}")
         except Exception as e:
-            click.secho(f"Um erro inesperado ocorreu: {e}", fg='red', bold=True)
\ No newline at end of file
+            click.secho(f"Um erro inesperado ocorreu: {e}", fg='red', bold=True)
+
+
+    @app.cli.command("backfill-next-watering")
+    @click.option("--batch-size", default=1000, show_default=True, help="Plantas atualizadas por transação.")
+    def backfill_next_watering_command(batch_size):
+        """
+        Preenche (ou recalcula) o next_watering_due de todas as plantas
+        do jardim, em lotes ordenados pelo id.
+        """
+        click.secho("Iniciando o backfill de next_watering_due...", fg="green")
+
+        try:
+            updated_total = 0
+            last_id = None
+            while True:
+                query = db.session.query(UserPlant.id).order_by(UserPlant.id)
+                if last_id is not None:
+                    query = query.filter(UserPlant.id > last_id)
+                ids = [row.id for row in query.limit(batch_size).all()]
+                if not ids:
+                    break
+
+                updated_total += refresh_next_watering_due_for_ids(ids)
+                db.session.commit()
+                last_id = ids[-1]
+                click.echo(f"  + {updated_total} plantas atualizadas...")
+
+            click.secho(f"Sucesso! {updated_total} plantas com next_watering_due recalculado.", fg='green')
+
+        except Exception as e:
+            db.session.rollback()
+            click.secho(f"Erro no backfill: {e}", fg='red')
+        finally:
+            db.session.remove()
+
+
+    @app.cli.command("check-next-watering")
+    @click.option("--fix", is_flag=True, help="Corrige as plantas inconsistentes encontradas.")
+    @click.option("--show", default=20, show_default=True, help="Quantidade de exemplos exibidos.")
+    def check_next_watering_command(fix, show):
+        """
+        Verificador de consistência: compara o next_watering_due salvo
+        com o valor calculado a partir do guia de cada planta.
+        """
+        click.echo("Verificando a consistência de next_watering_due...")
+
+        try:
+            inconsistent_count = find_inconsistent_next_watering_due().count()
+
+            if inconsistent_count == 0:
+                click.secho("Tudo certo! Nenhuma planta inconsistente.", fg='green')
+                return
+
+            click.secho(f"{inconsistent_count} plantas inconsistentes encontradas.", fg='yellow')
+            for row in find_inconsistent_next_watering_due(limit=show):
+                click.echo(f"  - {row.id} ({row.plant_entity_id}): salvo={row.next_watering_due} esperado={row.expected_next_watering_due}")
+
+            if fix:
+                ids = [row.id for row in find_inconsistent_next_watering_due()]
+                fixed = refresh_next_watering_due_for_ids(ids)
+                db.session.commit()
+                click.secho(f"{fixed} plantas corrigidas.", fg='green')
+
+        except Exception as e:
+            db.session.rollback()
+            click.secho(f"Erro na verificação: {e}", fg='red')
+        finally:
+            db.session.remove()
+
+
+    @app.cli.command("normalize-watering-frequency")
+    @click.option("--batch-size", default=200, show_default=True, help="Guias processados por transação.")
+    @click.option("--force", is_flag=True, help="Reprocessa também guias que já têm o intervalo salvo.")
+    def normalize_watering_frequency_command(batch_size, force):
+        """
+        Preenche plant_guide.watering_frequency_days a partir do details_cache
+        (campo numérico ou texto livre 'water' dos guias antigos) e recalcula
+        a próxima rega das plantas de cada espécie atualizada.
+        """
+        click.secho("Normalizando o intervalo de rega dos guias...", fg="green")
+
+        try:
+            parsed_count = 0
+            unparsed = []
+            last_id = None
+            while True:
+                query = db.session.query(
+                    PlantGuide.entity_id,
+                    PlantGuide.details_cache['water'].astext.label('water'),
+                    PlantGuide.details_cache['watering_frequency_days'].label('watering_frequency_days')
+                ).filter(PlantGuide.details_cache.isnot(None))
+                if not force:
+                    query = query.filter(PlantGuide.watering_frequency_days.is_(None))
+                if last_id is not None:
+                    query = query.filter(PlantGuide.entity_id > last_id)
+                rows = query.order_by(PlantGuide.entity_id).limit(batch_size).all()
+                if not rows:
+                    break
+
+                for row in rows:
+                    frequency_days = extract_watering_frequency_days({
+                        "water": row.water,
+                        "watering_frequency_days": row.watering_frequency_days
+                    })
+                    if frequency_days is None:
+                        unparsed.append((row.entity_id, row.water))
+                        continue
+
+                    db.session.query(PlantGuide).filter(PlantGuide.entity_id == row.entity_id).update(
+                        {PlantGuide.watering_frequency_days: frequency_days},
+                        synchronize_session=False
+                    )
+                    refresh_next_watering_due_for_entity(row.entity_id)
+                    parsed_count += 1
+
+                db.session.commit()
+                last_id = rows[-1].entity_id
+
+            click.secho(f"Sucesso! {parsed_count} guias normalizados.", fg='green')
+            if unparsed:
+                click.secho(f"{len(unparsed)} guias sem intervalo reconhecível:", fg='yellow')
+                for entity_id, water in unparsed:
+                    click.echo(f"  - {entity_id}: {water!r}")
+
+        except Exception as e:
+            db.session.rollback()
+            click.secho(f"Erro na normalização: {e}", fg='red')
+        finally:
+            db.session.remove()
+
+
+    @app.cli.command("show-metrics")
+    @click.argument("group", required=False)
+    @click.option("--reset", is_flag=True, help="Zera os contadores do grupo depois de exibir.")
+    def show_metrics_command(group, reset):
+        """
+        Exibe os contadores operacionais salvos no Redis
+        (ex: singleflight -> chamadas ao Gemini economizadas).
+        """
+        groups = [group] if group else list_metric_groups()
+        if not groups:
+            click.secho("Nenhuma métrica registrada ainda.", fg='cyan')
+            return
+
+        for name in groups:
+            click.secho(f"[{name}]", bold=True)
+            metrics = get_metrics(name)
+            for field in sorted(metrics):
+                click.echo(f"  {field}: {metrics[field]}")
+            if reset:
+                reset_metrics(name)
+                click.secho("  (zerado)", fg='yellow')
+
+
+    @app.cli.command("show-http-clients")
+    def show_http_clients_command():
+        """
+        Exibe, por cliente externo (gemini, plant_id), requisições, conexões
+        novas, handshakes TLS e a taxa de reuso das conexões keep-alive.
+        """
+        flush_http_client_stats()
+        summary = summarize_http_client_stats(get_metrics(HTTP_CLIENTS_METRICS_GROUP))
+        if not summary:
+            click.secho("Nenhuma requisição externa registrada ainda.", fg='cyan')
+            return
+
+        for client_name, stats in sorted(summary.items()):
+            click.secho(f"[{client_name}]", bold=True)
+            click.echo(f"  clientes criados:  {stats.get('client_inits', 0)}")
+            click.echo(f"  requisições:       {stats.get('requests', 0)}")
+            click.echo(f"  conexões novas:    {stats.get('new_connections', 0)}")
+            click.echo(f"  handshakes TLS:    {stats.get('tls_handshakes', 0)}")
+            reuse_rate = stats['reuse_rate']
+            click.echo(f"  reuso de conexão:  {'-' if reuse_rate is None else f'{reuse_rate:.1%}'}")
+
+
+    @app.cli.command("show-guide-cache")
+    def show_guide_cache_command():
+        """
+        Exibe a taxa de acerto de cada camada do cache do guia botânico
+        (memória do processo, Redis, Postgres) e as invalidações recebidas.
+        """
+        flush_guide_cache_stats()
+        summary = summarize_guide_cache_stats(get_metrics(GUIDE_CACHE_METRICS_GROUP))
+        if not summary["reads"]:
+            click.secho("Nenhuma leitura de guia registrada ainda.", fg='cyan')
+            return
+
+        click.secho(f"Leituras de guia: {summary['reads']}", bold=True)
+        labels = {
+            "local_hit": "memória",
+            "redis_hit": "redis",
+            "stale_hit": "redis (valor velho)",
+            "refill_wait_hit": "redis (após esperar)",
+            "db_hit": "postgres",
+            "miss": "sem guia",
+        }
+        for field, label in labels.items():
+            click.echo(f"  {label:<22} {summary.get(field, 0):>8}  ({summary[f'{field}_rate']:.1%})")
+        click.echo(f"  recargas antecipadas:  {summary.get('early_refresh', 0)}")
+        click.echo(f"  invalidações recebidas: {summary.get('invalidations_received', 0)}")
+
+
+    @app.cli.command("invalidate-stale-fcm-tokens")
+    @click.option("--days", type=int, default=None, help="Idade mínima do token (padrão: FCM_STALE_DAYS).")
+    @click.option("--batch-size", type=int, default=None, help="Usuários por UPDATE (padrão: FCM_INVALIDATION_BATCH_SIZE).")
+    @click.option("--dry-run", is_flag=True, help="Apenas reporta quantos tokens seriam invalidados.")
+    def invalidate_stale_fcm_tokens_command(days, batch_size, dry_run):
+        """
+        Invalida em massa os tokens FCM antigos (mesma lógica da task semanal).
+        """
+        days = days or current_app.config.get('FCM_STALE_DAYS', 60)
+        batch_size = batch_size or current_app.config.get('FCM_INVALIDATION_BATCH_SIZE', 1000)
+        stale_before = datetime.utcnow() - timedelta(days=days)
+
+        try:
+            report = invalidate_stale_tokens(stale_before, batch_size=batch_size, dry_run=dry_run)
+
+            if report["dry_run"]:
+                click.secho(f"(dry-run) {report['stale']} tokens sem atualização há mais de {days} dias.", fg='yellow')
+                for user_id, updated_at in report["sample"]:
+                    click.echo(f"  - {user_id}: atualizado em {updated_at}")
+            else:
+                click.secho(f"Sucesso! {report['invalidated']} tokens invalidados em {report['batches']} lotes.", fg='green')
+
+        except Exception as e:
+            db.session.rollback()
+            click.secho(f"Erro ao invalidar tokens: {e}", fg='red')
+        finally:
+            db.session.remove()
+
+
+    @app.cli.command("check-push-queue")
+    @click.option("--pushes", default=600, show_default=True, help="Notificações entregáveis na fila de teste.")
+    def check_push_queue_command(pushes):
+        """
+        Checagem da fila de push contra o stub local do FCM: um worker
+        "morre" com um lote em processamento, tokens instáveis falham uma
+        vez, tokens inválidos e não registrados falham de vez. Confere que
+        cada notificação entregável chega exatamente uma vez e que nada
+        fica preso na fila (usa uma fila de teste no Redis do app).
+        """
+        redis_client = current_app.redis_client
+        queue = f"push:check:{uuid.uuid4().hex}"
+        deliverable = [f"ok-{i}" for i in range(pushes)] + [f"flaky-{i}" for i in range(5)]
+        undeliverable = [f"unregistered-{i}" for i in range(5)] + [f"invalid-{i}" for i in range(5)]
+        tokens = deliverable + undeliverable
+        random.shuffle(tokens)
+
+        try:
+            with FcmStubServer() as stub:
+                enqueue_pushes([{"fcm_token": token, "title": "Checagem", "body": token} for token in tokens], queue=queue)
+
+                # worker que pegou um lote e morreu antes do ack
+                claimed = claim_push_batch(redis_client, queue, "crashed-worker")
+                redis_client.zadd(f"{queue}:consumers", {"crashed-worker": 0})
+                click.echo(f"{len(tokens)} notificações enfileiradas, {len(claimed)} presas com um worker morto.")
+
+                drains = []
+                for _ in range(2):
+                    drains.append(drain_push_queue(queue=queue, firebase_app=stub.firebase_app, invalidate_unregistered=False))
+                for index, summary in enumerate(drains, start=1):
+                    click.echo(
+                        f"  dreno {index}: {summary['sent']} enviadas, {summary['retried']} para nova tentativa, "
+                        f"{summary['recovered']} devolvidas à fila, {summary['failed']} falhas, "
+                        f"{summary['unregistered']} não registradas"
+                    )
+
+                problems = []
+                missing = [token for token in deliverable if stub.delivered[token] != 1]
+                if missing:
+                    problems.append(f"{len(missing)} notificações não entregues exatamente uma vez (ex: {missing[:3]})")
+                if any(stub.delivered[token] for token in undeliverable):
+                    problems.append("notificações para tokens inválidos foram entregues")
+                leftover = {
+                    key: redis_client.llen(key)
+                    for key in (queue, f"{queue}:retry", f"{queue}:processing:crashed-worker")
+                }
+                if any(leftover.values()):
+                    problems.append(f"itens presos nas filas: {leftover}")
+                if redis_client.zcard(f"{queue}:consumers"):
+                    problems.append("consumidores não removidos do registro")
+
+                if problems:
+                    for problem in problems:
+                        click.secho(f"  - {problem}", fg='red')
+                    raise click.ClickException("A fila de push não se comportou como esperado.")
+                click.secho(f"Tudo certo! {len(deliverable)} entregues exatamente uma vez, nada preso na fila.", fg='green')
+        finally:
+            redis_client.delete(queue, f"{queue}:retry", f"{queue}:consumers", f"{queue}:processing:crashed-worker")
+
+
+    @app.cli.command("benchmark-gemini-modes")
+    @click.option("--plant", default="Monstera deliciosa", show_default=True, help="Nome científico usado no prompt.")
+    @click.option("--runs", default=3, show_default=True, help="Repetições por modo.")
+    @click.option("--base-url", default=None, help="URL de um stub do Gemini já rodando (padrão: sobe um stub local).")
+    @click.option("--latency", default=0.5, show_default=True, help="Latência fixa (s) do stub local por chamada.")
+    @click.option("--real", is_flag=True, help="Usa a API real do Gemini (consome cota!).")
+    def benchmark_gemini_modes_command(plant, runs, base_url, latency, real):
+        """
+        Compara latência e tokens da análise profunda em duas chamadas
+        sequenciais ('split'), duas chamadas concorrentes ('concurrent') e
+        uma chamada única ('combined').
+        """
+        if real:
+            stub = nullcontext(None)
+        elif base_url:
+            stub = nullcontext(base_url)
+        else:
+            stub = GeminiStubServer(base_latency=latency)
+
+        with stub as stub_url:
+            click.echo(f"Gemini: {stub_url or 'API real'}")
+            api_key = current_app.config['GEMINI_API_KEY'] if real else "stub"
+
+            max_concurrency = current_app.config.get('GEMINI_MAX_CONCURRENCY', 4)
+            modes = {
+                "split": (GeminiService, lambda service: (service.get_details_about_plant(plant), service.get_nutritional_details(plant))),
+                "concurrent": (AsyncGeminiService, lambda service: service.get_details_and_nutritional_sync(plant)),
+                "combined": (GeminiService, lambda service: service.get_deep_analysis(plant)),
+            }
+            for mode, (service_class, run_analysis) in modes.items():
+                if service_class is AsyncGeminiService:
+                    service = AsyncGeminiService(api_key=api_key, base_url=stub_url, max_concurrency=max_concurrency)
+                else:
+                    service = GeminiService(api_key=api_key, base_url=stub_url)
+                started = time.perf_counter()
+                for _ in range(runs):
+                    run_analysis(service)
+                elapsed_ms = (time.perf_counter() - started) * 1000 / runs
+                if service_class is AsyncGeminiService:
+                    service.close()
+
+                calls = len(service.usage_log) / runs
+                prompt_tokens = sum(entry["prompt_tokens"] for entry in service.usage_log) / runs
+                output_tokens = sum(entry["output_tokens"] for entry in service.usage_log) / runs
+                total_tokens = sum(entry["total_tokens"] for entry in service.usage_log) / runs
+
+                click.secho(f"[{mode}]", bold=True)
+                click.echo(f"  chamadas/análise: {calls:.0f}")
+                click.echo(f"  latência média:   {elapsed_ms:.0f}ms")
+                click.echo(f"  tokens prompt:    {prompt_tokens:.0f}")
+                click.echo(f"  tokens resposta:  {output_tokens:.0f}")
+                click.echo(f"  tokens total:     {total_tokens:.0f}")
+
+
+    @app.cli.command("benchmark-identify-projection")
+    @click.option("--suggestions", default=10, show_default=True, help="Sugestões no payload simulado do Plant.id.")
+    @click.option("--similar-images", default=2, show_default=True, help="Imagens similares por sugestão.")
+    @click.option("--runs", default=500, show_default=True, help="Serializações por visão.")
+    def benchmark_identify_projection_command(suggestions, similar_images, runs):
+        """
+        Compara tamanho e tempo de serialização do identification_data
+        completo (?verbose=1) contra a visão compacta padrão do /identify.
+        """
+        identification = _sample_identification(suggestions, similar_images)
+        top_n = current_app.config.get('IDENTIFY_TOP_SUGGESTIONS', 3)
+
+        views = {
+            "completo (verbose)": lambda: project_identification(identification, verbose=True),
+            "compacto (padrão)": lambda: project_identification(identification, top_n=top_n),
+            "fields=result.classification.suggestions.name": lambda: project_identification(
+                identification, fields=["result.classification.suggestions.name"]
+            ),
+        }
+        for name, build_view in views.items():
+            payload = current_app.json.dumps(build_view())
+            started = time.perf_counter()
+            for _ in range(runs):
+                current_app.json.dumps(build_view())
+            elapsed_us = (time.perf_counter() - started) * 1_000_000 / runs
+
+            click.secho(f"[{name}]", bold=True)
+            click.echo(f"  tamanho:            {len(payload.encode('utf-8')) / 1024:.1f}KB")
+            click.echo(f"  projeção + dumps:   {elapsed_us:.0f}µs")
+
+
+    @app.cli.command("benchmark-cache-codecs")
+    @click.option("--runs", default=2000, show_default=True, help="Codificações/decodificações por codec.")
+    @click.option("--redis-memory", is_flag=True, help="Grava chaves temporárias e mede o MEMORY USAGE no Redis.")
+    def benchmark_cache_codecs_command(runs, redis_memory):
+        """
+        Compara tamanho, tempo de encode/decode e memória por chave do valor
+        guide:{entity_id} em cada codec (JSON antigo, msgpack, msgpack + zlib/zstd),
+        usando amostras validadas por PlantInfo / NutritionalInfo / DiseaseInfo.
+        """
+        guide_data = {
+            "scientific_name": "Monstera deliciosa",
+            "details": PlantInfo.model_validate(SAMPLE_DETAILS).model_dump(),
+            "nutritional": NutritionalInfo.model_validate(SAMPLE_NUTRITIONAL).model_dump(),
+            "health": DiseaseInfo.model_validate(SAMPLE_DISEASE).model_dump()
+        }
+
+        variants = {
+            "json (antigo)": {"codec": "json"},
+            "msgpack": {"codec": "msgpack", "compression": "none"},
+            "msgpack + zlib": {"codec": "msgpack", "compression": "zlib", "min_compress_bytes": 0},
+        }
+        if zstandard is not None:
+            variants["msgpack + zstd"] = {"codec": "msgpack", "compression": "zstd", "min_compress_bytes": 0}
+        else:
+            click.secho("zstandard não instalado: variante zstd ignorada.", fg='yellow')
+
+        for name, options in variants.items():
+            encoded = encode_value(guide_data, **options)
+            if decode_value(encoded) != guide_data:
+                raise click.ClickException(f"O codec '{name}' não reproduz o valor original.")
+
+            started = time.perf_counter()
+            for _ in range(runs):
+                encode_value(guide_data, **options)
+            encode_us = (time.perf_counter() - started) * 1_000_000 / runs
+
+            started = time.perf_counter()
+            for _ in range(runs):
+                decode_value(encoded)
+            decode_us = (time.perf_counter() - started) * 1_000_000 / runs
+
+            click.secho(f"[{name}]", bold=True)
+            click.echo(f"  tamanho:  {len(encoded)} bytes")
+            click.echo(f"  encode:   {encode_us:.1f}µs")
+            click.echo(f"  decode:   {decode_us:.1f}µs")
+
+            if redis_memory:
+                key = f"benchmark:cache_codec:{name}"
+                current_app.redis_binary_client.set(key, encoded, ex=60)
+                click.echo(f"  memória:  {current_app.redis_binary_client.memory_usage(key)} bytes (MEMORY USAGE)")
+                current_app.redis_binary_client.delete(key)
+
+
+    @app.cli.command("loadtest-guide-cache")
+    @click.option("--species", default=50, show_default=True, help="Quantidade de guias prontos usados no teste.")
+    @click.option("--threads", default=8, show_default=True, help="Leitores simultâneos.")
+    @click.option("--duration", default=30, show_default=True, help="Duração do teste em segundos.")
+    @click.option("--ttl", default=10, show_default=True, help="TTL do guia no Redis durante o teste (segundos).")
+    @click.option("--naive", is_flag=True, help="Desliga jitter, XFetch, mutex e valor velho (comportamento antigo).")
+    def loadtest_guide_cache_command(species, threads, duration, ttl, naive):
+        """
+        Cenário de carga para a expiração do cache do guia: aquece todas as
+        chaves ao mesmo tempo com TTL curto e lê continuamente enquanto elas
+        expiram, exibindo por segundo quantas leituras foram ao Postgres.
+        Compare com --naive para ver o pico de consultas sem a proteção.
+        A camada em memória fica desligada para que toda leitura passe pelo Redis.
+        """
+        entity_ids = [
+            row.entity_id for row in db.session.query(PlantGuide.entity_id).filter(
+                PlantGuide.details_cache.isnot(None),
+                PlantGuide.nutritional_cache.isnot(None)
+            ).limit(species)
+        ]
+        if not entity_ids:
+            raise click.ClickException("Nenhum guia pronto no banco para o teste.")
+
+        overrides = {"GUIDE_CACHE_TTL": ttl, "GUIDE_LOCAL_CACHE_ENABLED": False}
+        if naive:
+            overrides.update({
+                "GUIDE_CACHE_TTL_JITTER": 0,
+                "GUIDE_XFETCH_BETA": 0,
+                "GUIDE_CACHE_STALE_SECONDS": 0,
+                "GUIDE_REFILL_LOCK_MS": 0,
+            })
+        previous = {key: current_app.config.get(key) for key in overrides}
+        current_app.config.update(overrides)
+
+        app_object = current_app._get_current_object()
+        stop = threading.Event()
+        reads = [0] * threads
+
+        def reader(index):
+            with app_object.app_context():
+                while not stop.is_set():
+                    get_guide_data(random.choice(entity_ids))
+                    reads[index] += 1
+                db.session.remove()
+
+        def db_queries() -> int:
+            flush_guide_cache_stats()
+            metrics = get_metrics(GUIDE_CACHE_METRICS_GROUP)
+            return metrics.get("db_hit", 0) + metrics.get("miss", 0)
+
+        try:
+            # aquece tudo de uma vez, como num lançamento
+            for guide in PlantGuide.query.filter(PlantGuide.entity_id.in_(entity_ids)):
+                set_guide_cache(guide.entity_id, guide_payload(guide))
+
+            workers = [threading.Thread(target=reader, args=(index,), daemon=True) for index in range(threads)]
+            for worker in workers:
+                worker.start()
+
+            mode = "sem proteção (--naive)" if naive else "com proteção"
+            click.secho(f"{len(entity_ids)} guias, {threads} leitores, TTL {ttl}s, {mode}", bold=True)
+            click.echo("  seg   leituras/s   consultas ao postgres/s")
+
+            last_queries = db_queries()
+            last_reads = 0
+            per_second = []
+            for second in range(1, duration + 1):
+                time.sleep(1)
+                queries = db_queries()
+                total_reads = sum(reads)
+                per_second.append(queries - last_queries)
+                click.echo(f"  {second:>3}   {total_reads - last_reads:>10}   {queries - last_queries:>10}")
+                last_queries, last_reads = queries, total_reads
+        finally:
+            stop.set()
+            current_app.config.update(previous)
+
+        click.secho(
+            f"Postgres: pico de {max(per_second)} consultas/s, média de {sum(per_second) / len(per_second):.1f}/s.",
+            fg='green'
+        )
+
+
+    @app.cli.command("benchmark-garden-pagination")
+    @click.option("--sizes", default="50,500,5000", show_default=True, help="Tamanhos de jardim (separados por vírgula).")
+    @click.option("--limit", default=50, show_default=True, help="Tamanho da página.")
+    @click.option("--runs", default=20, show_default=True, help="Execuções por medição (mostra a mediana).")
+    def benchmark_garden_pagination_command(sizes, limit, runs):
+        """
+        Mede a latência da lista do jardim (jardim inteiro, primeira página e
+        uma página do meio via cursor) para jardins de tamanhos crescentes.
+        Cria um usuário e plantas temporários e desfaz tudo no final.
+        """
+        def median_ms(call) -> float:
+            timings = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                call()
+                timings.append((time.perf_counter() - started) * 1000)
+            return statistics.median(timings)
+
+        click.echo(f"{'plantas':>8}  {'jardim inteiro':>15}  {'1ª página':>10}  {'página do meio':>15}")
+        for size in (int(value) for value in sizes.split(",")):
+            with _seed_temp_garden(size, prefix="benchmark") as user:
+                # cursor de uma página no meio do jardim
+                middle_cursor = None
+                pages_to_middle = max(size // limit // 2, 1)
+                for _ in range(pages_to_middle):
+                    _, middle_cursor = fetch_garden_page(user.id, limit=limit, cursor=middle_cursor)
+                    if middle_cursor is None:
+                        break
+
+                full_ms = median_ms(lambda: fetch_garden_page(user.id))
+                first_ms = median_ms(lambda: fetch_garden_page(user.id, limit=limit))
+                middle_ms = median_ms(lambda: fetch_garden_page(user.id, limit=limit, cursor=middle_cursor))
+            click.echo(f"{size:>8}  {full_ms:>13.2f}ms  {first_ms:>8.2f}ms  {middle_ms:>13.2f}ms")
+
+
+    @app.cli.command("check-garden-list-queries")
+    @click.option("--plants", default=50, show_default=True, help="Plantas do jardim grande.")
+    def check_garden_list_queries_command(plants):
+        """
+        Regressão de N+1 no GET /garden/plants: conta os comandos SQL da
+        rota (listener before_cursor_execute) para um jardim de 1 planta e
+        outro de --plants, com e sem ?limit=, e exige que sejam iguais.
+        Cria usuários e plantas temporários e desfaz tudo no final.
+        """
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        client = app.test_client()
+        counts = {}
+        for size in (1, plants):
+            with _seed_temp_garden(size, prefix="check") as user:
+                headers = {"Authorization": f"Bearer {create_access_token(identity=str(user.id))}"}
+                for query_string in ("", "?limit=10"):
+                    statements.clear()
+                    event.listen(db.engine, "before_cursor_execute", count_statement)
+                    try:
+                        response = client.get(f"/api/v1/garden/plants{query_string}", headers=headers)
+                    finally:
+                        event.remove(db.engine, "before_cursor_execute", count_statement)
+                    if response.status_code != 200:
+                        raise click.ClickException(f"GET /plants{query_string} respondeu {response.status_code}.")
+                    counts[(size, query_string)] = len(statements)
+
+        failed = False
+        for query_string in ("", "?limit=10"):
+            small, large = counts[(1, query_string)], counts[(plants, query_string)]
+            label = f"/plants{query_string or ' (jardim inteiro)'}"
+            if small == large:
+                click.echo(f"  {label}: {small} comandos SQL com 1 e com {plants} plantas")
+            else:
+                failed = True
+                click.secho(f"  {label}: {small} comandos SQL com 1 planta, {large} com {plants}", fg='red')
+
+        if failed:
+            raise click.ClickException("O número de consultas cresce com o tamanho do jardim (N+1).")
+        click.secho("Tudo certo! A lista do jardim usa o mesmo número de consultas para qualquer tamanho.", fg='green')
+
+
+@contextmanager
+def _seed_temp_garden(size: int, prefix: str = "temp"):
+    """
+    Usuário temporário com um jardim de `size` plantas (added_at decrescente)
+    de um guia também temporário, para os benchmarks e checagens do jardim.
+    Entrega o usuário e desfaz tudo (rollback) na saída.
+    """
+    try:
+        guide = PlantGuide(entity_id=f"{prefix}-{uuid.uuid4().hex[:12]}", scientific_name="Plantae temporaria")
+        user = User(email=f"{prefix}-{uuid.uuid4().hex}@plante.local", password_hash="-")
+        db.session.add_all([guide, user])
+        db.session.flush()
+
+        started_at = datetime.utcnow()
+        db.session.bulk_insert_mappings(UserPlant, [
+            {
+                "id": uuid.uuid4(),
+                "user_id": user.id,
+                "plant_entity_id": guide.entity_id,
+                "nickname": f"Planta {index}",
+                "added_at": started_at - timedelta(minutes=index),
+                "tracked_watering": False,
+            }
+            for index in range(size)
+        ])
+        db.session.flush()
+        yield user
+    finally:
+        db.session.rollback()
+
+
+def _sample_identification(suggestions: int, similar_images: int) -> dict:
+    """Payload no formato do Plant.id v3 (identification) para os benchmarks."""
+    return {
+        "access_token": "sample-access-token",
+        "model_version": "plant_id:4.1.0",
+        "custom_id": None,
+        "input": {
+            "latitude": -15.78,
+            "longitude": -47.93,
+            "similar_images": True,
+            "images": ["https://plant.id/media/imgs/sample.jpg"],
+            "datetime": "2025-11-07T12:00:00.000000+00:00"
+        },
+        "result": {
+            "is_plant": {"probability": 0.99, "threshold": 0.5, "binary": True},
+            "classification": {
+                "suggestions": [
+                    {
+                        "id": f"suggestion-{index}",
+                        "name": f"Planta exemplo {index}",
+                        "probability": round(0.9 / (index + 1), 4),
+                        "similar_images": [
+                            {
+                                "id": f"image-{index}-{image}",
+                                "url": f"https://plant-id.ams3.cdn.digitaloceanspaces.com/similar_images/{index}/{image}.jpg",
+                                "url_small": f"https://plant-id.ams3.cdn.digitaloceanspaces.com/similar_images/{index}/{image}.small.jpg",
+                                "license_name": "CC BY-SA 4.0",
+                                "license_url": "https://creativecommons.org/licenses/by-sa/4.0/",
+                                "citation": "Autor de exemplo",
+                                "similarity": 0.7
+                            }
+                            for image in range(similar_images)
+                        ],
+                        "details": {"language": "pt", "entity_id": f"entity-{index}"}
+                    }
+                    for index in range(suggestions)
+                ]
+            }
+        },
+        "status": "COMPLETED",
+        "sla_compliant_client": True,
+        "sla_compliant_system": True,
+        "created": 1730980800.0,
+        "completed": 1730980801.2
+    }
@@ -16,6 +16,8 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # muda a cada gravação do usuário (ETag do GET /profile/me)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     # para as notificações push
     fcm_token = db.Column(db.Text, nullable=True)
@@ -43,6 +45,17 @@ class User(db.Model):
     garden = db.relationship('UserPlant', back_populates='owner', lazy='dynamic', cascade="all, delete-orphan")
     achievements = db.relationship('UserAchievement', back_populates='user', lazy='dynamic', cascade="all, delete-orphan")
 
+    # hash: busca por igualdade do token (invalidação) sem varrer a tabela;
+    # parcial: só tokens ativos entram na verificação de tokens antigos
+    __table_args__ = (
+        db.Index('ix_users_fcm_token', 'fcm_token', postgresql_using='hash'),
+        db.Index(
+            'ix_users_fcm_token_updated_at',
+            'fcm_token_updated_at',
+            postgresql_where=db.text('fcm_token IS NOT NULL')
+        ),
+    )
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
 
@@ -56,19 +69,51 @@ class PlantGuide(db.Model):
     scientific_name = db.Column(db.String(150), nullable=False)
     last_gemini_update = db.Column(db.DateTime)
     details_cache = db.Column(JSONB)
+    # intervalo de rega em dias extraído do details_cache (numérico, p/ o celery)
+    watering_frequency_days = db.Column(db.Integer, nullable=True)
     nutritional_cache = db.Column(JSONB)
+    # último plano de tratamento gerado para a espécie (o histórico por
+    # doença fica em PlantDiseasePlan)
     health_cache = db.Column(JSONB, nullable=True)
+    # muda a cada gravação do guia (sync incremental do app: /garden/changes)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    disease_plans = db.relationship('PlantDiseasePlan', back_populates='guide', lazy='dynamic', cascade="all, delete-orphan")
+
+class PlantDiseasePlan(db.Model):
+    __tablename__ = 'plant_disease_plans'
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    entity_id = db.Column(db.String(50), db.ForeignKey('plant_guide.entity_id'), nullable=False)
+    disease_name = db.Column(db.String(200), nullable=False)
+    plan = db.Column(JSONB, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    guide = db.relationship('PlantGuide', back_populates='disease_plans')
+
+    # Um plano por (espécie, doença), gerado uma vez e servido a todos os usuários.
+    # O nome vem do Plant.id com caixa variável ("Oídio"/"oídio"): compara em minúsculas
+    __table_args__ = (
+        db.Index('uq_plant_disease_plan_name', 'entity_id', db.func.lower(disease_name), unique=True),
+    )
 
 class UserPlant(db.Model):
     __tablename__ = 'user_garden'
     
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     nickname = db.Column(db.String(100))
-    added_at = db.Column(db.DateTime, default=datetime.utcnow)
+    added_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     last_watered = db.Column(db.DateTime)
     care_notes = db.Column(db.Text)
     tracked_watering = db.Column(db.Boolean, default=False, nullable=False)
     primary_image_url = db.Column(db.String(512), nullable=True)
+
+    # Próxima rega calculada (last_watered/added_at + frequência do guia).
+    # Mantida pelo app para que o celery só consulte as plantas vencidas.
+    next_watering_due = db.Column(db.DateTime, nullable=True)
+    # muda a cada gravação da planta (sync incremental do app: /garden/changes)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
     # Chaves Estrangeiras que conectam tudo
     user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id'), nullable=False)
@@ -78,6 +123,39 @@ class UserPlant(db.Model):
     owner = db.relationship('User', back_populates='garden')
     plant_info = db.relationship('PlantGuide')
 
+    # Índice parcial: só as plantas monitoradas entram na varredura de rega
+    __table_args__ = (
+        db.Index(
+            'ix_user_garden_next_watering_due',
+            'next_watering_due',
+            'id',
+            postgresql_where=db.text('tracked_watering = true')
+        ),
+        # Ordenação e paginação por keyset da lista do jardim
+        db.Index('ix_user_garden_user_added_at', 'user_id', 'added_at', 'id'),
+        # "o que mudou desde X" do /garden/changes
+        db.Index('ix_user_garden_user_updated_at', 'user_id', 'updated_at'),
+    )
+
+class GardenTombstone(db.Model):
+    """
+    Registro de uma planta removida do jardim, para que o /garden/changes
+    avise o app. Apagado pela task prune_garden_tombstones depois de
+    GARDEN_TOMBSTONE_RETENTION_DAYS (clientes mais antigos que isso
+    recebem um sync completo).
+    """
+    __tablename__ = 'garden_tombstones'
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    # a planta já não existe: sem chave estrangeira
+    plant_id = db.Column(UUID(as_uuid=True), nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_garden_tombstones_user_deleted_at', 'user_id', 'deleted_at'),
+    )
+
 class Achievement(db.Model):
     __tablename__ = 'achievements'
     
@@ -46,6 +46,7 @@ class PlantInfo(BaseModel):
     taxonomy: TaxonomyInfo = Field(..., description="A classificação taxonômica completa da planta.")
     is_edible: bool = Field(..., description="A planta é comestível? True ou False.")
     water: str = Field(..., description="Quantas vezes por semana a planta deve ser regada.")
+    watering_frequency_days: int = Field(..., ge=1, description="Intervalo médio, em dias, entre uma rega e outra (ex: 3 para 'a cada 3 dias').")
     season: str = Field(..., description="Qual a melhor estação do ano para plantar essa planta.")
     sunlight: str = Field(..., description="Qual o nível de luz solar que a planta necessita.")
     soil: str = Field(..., description="Qual o tipo de solo ideal para essa planta crescer.")
@@ -64,3 +65,8 @@ class NutritionalInfo(BaseModel):
     food: FoodRecipe = Field(..., description="Uma receita que pode ser feita com a planta.")
     heal: MedicinalUse = Field(..., description="Informações sobre o uso medicinal da planta.")
     seasoning: str = Field(..., description="Se essa planta for usada como tempero, responda essa questão com: em que pratos se usa esse tempero.")
+
+class DeepAnalysisInfo(BaseModel):
+    """Esquema combinado da análise profunda: detalhes + nutrição numa única geração do Gemini."""
+    details: PlantInfo = Field(..., description="Informações profundas da planta.")
+    nutritional: NutritionalInfo = Field(..., description="Informações sobre alimentos, bebidas e usos medicinais da planta.")
@@ -0,0 +1,221 @@
+"""
+Registro dos clientes HTTP externos (Gemini e Plant.id) por processo.
+Cada processo (worker do celery, worker do gunicorn, terminal) cria os
+clientes uma única vez e reaproveita as conexões keep-alive, em vez de
+pagar DNS + handshake TLS a cada task ou requisição.
+
+Depois de um fork (celery prefork) o filho descarta os clientes herdados
+e cria os seus, já que sockets não podem ser compartilhados entre processos.
+
+Os contadores (requisições, conexões novas, handshakes TLS) ficam em memória
+e são enviados em lote para o grupo de métricas 'http_clients'
+(`flask show-http-clients`).
+"""
+
+import os
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from flask import current_app
+from app.services.gemini_service import GeminiService, AsyncGeminiService
+from app.services.plant_id_service import PlantIdService
+from app.utils.metrics_utils import MetricsBuffer
+
+HTTP_CLIENTS_METRICS_GROUP = "http_clients"
+
+_lock = threading.Lock()
+_clients = {}
+_owner_pid = os.getpid()
+_http_stats = MetricsBuffer(HTTP_CLIENTS_METRICS_GROUP, 'HTTP_CLIENT_METRICS_FLUSH_EVERY')
+
+
+# =====================================================
+# CONTADORES
+# =====================================================
+def record_http_event(client_name: str, field: str, amount: int = 1) -> None:
+    """Soma um evento ao contador em memória (enviado ao Redis em lote)."""
+    _http_stats.incr(f"{client_name}:{field}", amount)
+
+def flush_http_client_stats() -> None:
+    """Envia os contadores acumulados para o Redis (metrics:http_clients)."""
+    _http_stats.flush()
+
+def summarize_http_client_stats(metrics: dict) -> dict:
+    """
+    Agrupa os contadores por cliente e calcula a taxa de reuso de conexão
+    (requisições que não precisaram abrir conexão nova).
+    """
+    summary = {}
+    for key, value in metrics.items():
+        client_name, _, field = key.partition(":")
+        summary.setdefault(client_name, {})[field] = value
+
+    for stats in summary.values():
+        requests_count = stats.get("requests", 0)
+        new_connections = stats.get("new_connections", 0)
+        stats["reuse_rate"] = round(1 - new_connections / requests_count, 3) if requests_count else None
+    return summary
+
+
+# =====================================================
+# PLANT.ID (requests + urllib3)
+# =====================================================
+def _counting_pool_class(base_class, client_name: str):
+    """Pool do urllib3 que conta cada conexão nova (e handshake, no https)."""
+    def _new_conn(self):
+        record_http_event(client_name, "new_connections")
+        if self.scheme == "https":
+            record_http_event(client_name, "tls_handshakes")
+        return base_class._new_conn(self)
+
+    return type(f"Counting{base_class.__name__}", (base_class,), {"_new_conn": _new_conn})
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    def __init__(self, client_name: str, **kwargs):
+        # precisa existir antes do super().__init__, que chama init_poolmanager
+        self.client_name = client_name
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(HTTPConnectionPool, self.client_name),
+            "https": _counting_pool_class(HTTPSConnectionPool, self.client_name),
+        }
+
+    def send(self, request, **kwargs):
+        record_http_event(self.client_name, "requests")
+        return super().send(request, **kwargs)
+
+def _build_plant_id_service() -> PlantIdService:
+    config = current_app.config
+    adapter = _CountingHTTPAdapter(
+        "plant_id",
+        pool_connections=config.get('HTTP_POOL_CONNECTIONS', 4),
+        pool_maxsize=config.get('HTTP_POOL_MAXSIZE', 10),
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return PlantIdService(
+        api_key=config['PLANT_ID_API_KEY'],
+        session=session,
+        timeout=(config.get('PLANT_ID_CONNECT_TIMEOUT', 5), config.get('PLANT_ID_READ_TIMEOUT', 60)),
+    )
+
+
+# =====================================================
+# GEMINI (httpx)
+# =====================================================
+def _record_connection_event(client_name: str, event_name: str) -> None:
+    """Trace do httpcore: avisa quando o pool precisou abrir conexão."""
+    if event_name == "connection.connect_tcp.complete":
+        record_http_event(client_name, "new_connections")
+    elif event_name == "connection.start_tls.complete":
+        record_http_event(client_name, "tls_handshakes")
+
+def _gemini_trace(event_name: str, info: dict) -> None:
+    _record_connection_event("gemini", event_name)
+
+def _gemini_request_hook(request: httpx.Request) -> None:
+    record_http_event("gemini", "requests")
+    request.extensions["trace"] = _gemini_trace
+
+# o httpx.AsyncClient exige hooks e trace assíncronos
+async def _gemini_async_trace(event_name: str, info: dict) -> None:
+    _record_connection_event("gemini_async", event_name)
+
+async def _gemini_async_request_hook(request: httpx.Request) -> None:
+    record_http_event("gemini_async", "requests")
+    request.extensions["trace"] = _gemini_async_trace
+
+def gemini_http_options(asynchronous: bool = False) -> dict:
+    """Timeout (ms, como o google-genai espera) e o pool do httpx (síncrono ou assíncrono)."""
+    config = current_app.config
+    client_args = "async_client_args" if asynchronous else "client_args"
+    request_hook = _gemini_async_request_hook if asynchronous else _gemini_request_hook
+    return {
+        "timeout": int(config.get('GEMINI_TIMEOUT_SECONDS', 120) * 1000),
+        client_args: {
+            "limits": httpx.Limits(
+                max_connections=config.get('GEMINI_MAX_CONNECTIONS', 10),
+                max_keepalive_connections=config.get('GEMINI_MAX_KEEPALIVE_CONNECTIONS', 5),
+                keepalive_expiry=config.get('GEMINI_KEEPALIVE_EXPIRY', 30),
+            ),
+            "event_hooks": {"request": [request_hook]},
+        },
+    }
+
+def _build_gemini_service() -> GeminiService:
+    return GeminiService(
+        api_key=current_app.config['GEMINI_API_KEY'],
+        http_options=gemini_http_options(),
+    )
+
+def _build_async_gemini_service() -> AsyncGeminiService:
+    return AsyncGeminiService(
+        api_key=current_app.config['GEMINI_API_KEY'],
+        max_concurrency=current_app.config.get('GEMINI_MAX_CONCURRENCY', 4),
+        http_options=gemini_http_options(asynchronous=True),
+    )
+
+
+# =====================================================
+# REGISTRO
+# =====================================================
+_BUILDERS = {
+    "gemini": _build_gemini_service,
+    "gemini_async": _build_async_gemini_service,
+    "plant_id": _build_plant_id_service,
+}
+
+def _get_client(name: str):
+    global _owner_pid
+    client = _clients.get(name)
+    if client is not None and _owner_pid == os.getpid():
+        return client
+
+    created = False
+    with _lock:
+        if _owner_pid != os.getpid():
+            # processo filho que não passou pelo register_at_fork (ex: spawn manual)
+            _clients.clear()
+            _owner_pid = os.getpid()
+        if name not in _clients:
+            _clients[name] = _BUILDERS[name]()
+            created = True
+        client = _clients[name]
+
+    if created:
+        record_http_event(name, "client_inits")
+    return client
+
+def get_gemini_service() -> GeminiService:
+    """GeminiService compartilhado pelo processo (pool keep-alive do httpx)."""
+    return _get_client("gemini")
+
+def get_plant_id_service() -> PlantIdService:
+    """PlantIdService compartilhado pelo processo (requests.Session com pool)."""
+    return _get_client("plant_id")
+
+def get_async_gemini_service() -> AsyncGeminiService:
+    """
+    AsyncGeminiService compartilhado pelo processo: um event loop só, com o
+    pool assíncrono do httpx e o semáforo de GEMINI_MAX_CONCURRENCY.
+    """
+    return _get_client("gemini_async")
+
+def reset_clients() -> None:
+    """Descarta os clientes do processo (serão recriados no próximo uso)."""
+    global _lock, _owner_pid
+    # depois de um fork o lock pode ter sido copiado travado
+    _lock = threading.Lock()
+    _clients.clear()
+    _http_stats.reset()
+    _owner_pid = os.getpid()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_clients)
@@ -2,41 +2,127 @@
 Serviço de requisições para o Gemini.
 Os métodos de perguntas e modelos de resposta não
 são gerenciados aqui, apenas as requisições.
+
+GeminiService faz as chamadas de forma síncrona; AsyncGeminiService usa o
+cliente assíncrono (client.aio) para disparar prompts independentes ao
+mesmo tempo, limitados por um semáforo, e expõe uma fachada síncrona
+para as tasks do celery (um event loop persistente por serviço, numa thread).
 """
 
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import deque
 from google import genai
-from app.models.schemas import PlantInfo, DiseaseInfo, NutritionalInfo
+from app.models.schemas import PlantInfo, DiseaseInfo, NutritionalInfo, DeepAnalysisInfo
+
+GEMINI_MODEL = "gemini-2.5-flash"
+# O serviço pode viver o processo inteiro (client_registry), então o
+# histórico de uso guarda só as últimas chamadas
+USAGE_LOG_LIMIT = 500
+
+def _build_http_options(base_url: str = None, http_options: dict = None) -> dict | None:
+    options = dict(http_options or {})
+    if base_url:
+        options["base_url"] = base_url
+    return options or None
+
+def _details_prompt_items() -> str:
+    return (
+        "1. Uma lista de nomes populares. "
+        "2. Uma breve descrição da planta. "
+        "3. A taxonomia (classe, gênero, ordem, família, filo). "
+        "4. Se é comestível (true/false). "
+        "5. Frequência de rega por semana. "
+        "6. O intervalo médio entre regas, em dias, como um número inteiro. "
+        "7. Melhor estação para o plantio. "
+        "8. Nível de luz solar necessário. "
+        "9. Tipo de solo ideal. "
+        "10. Informações sobre a origem (país, região, habitat)."
+    )
+
+def _nutritional_prompt_items() -> str:
+    return (
+        "1. É possível fazer chá? Se sim, como fazer e quais os benefícios. "
+        "2. Uma receita (nome e ingredientes) de um alimento que pode ser feito com a planta. "
+        "3. Usos medicinais: se houver, explique como usar e os benefícios. "
+        "4. Se for usada como tempero, em que tipos de pratos combina."
+    )
+
+def _details_prompt(plant_name: str) -> str:
+    return (
+        f"Minha planta, de nome científico '{plant_name} está saudável. "
+        "Eu preciso das seguintes informações em português do Brasil: "
+        + _details_prompt_items()
+    )
+
+def _nutritional_prompt(plant_name: str) -> str:
+    return (
+        f"Minha planta, de nome científico '{plant_name} está saudável. "
+        "Eu preciso das seguintes informações em português do Brasil: "
+        + _nutritional_prompt_items()
+    )
+
+def _disease_prompt(plant_name: str, disease_name: str) -> str:
+    return (
+        f"Minha planta, de nome científico '{plant_name}', foi diagnosticada com a doença '{disease_name}'. "
+        "Por favor, forneça as seguintes informações em português do Brasil:\n"
+        "1. Os principais sintomas visíveis dessa doença.\n"
+        "2. Um plano de tratamento claro e prático.\n"
+        "3. Uma estimativa de tempo para a recuperação da planta."
+    )
+
+def _deep_analysis_prompt(plant_name: str) -> str:
+    return (
+        f"Minha planta, de nome científico '{plant_name}' está saudável. "
+        "Eu preciso das seguintes informações em português do Brasil, "
+        "separadas em dois blocos.\n"
+        "Bloco 'details': " + _details_prompt_items() + "\n"
+        "Bloco 'nutritional': " + _nutritional_prompt_items()
+    )
+
+def _generation_config(schema) -> dict:
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": schema,
+    }
+
+def _usage_entry(label: str, response, started: float) -> dict:
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "call": label,
+        "latency_ms": (time.perf_counter() - started) * 1000,
+        "prompt_tokens": getattr(usage, "prompt_token_count", None) or 0,
+        "output_tokens": getattr(usage, "candidates_token_count", None) or 0,
+        "total_tokens": getattr(usage, "total_token_count", None) or 0,
+    }
 
 class GeminiService:
-    def __init__(self, api_key: str):
-        self.client = genai.Client(api_key=api_key)
+    def __init__(self, api_key: str, base_url: str = None, http_options: dict = None):
+        # base_url permite apontar para um stub local (benchmarks/testes);
+        # http_options recebe timeout e client_args (pool do httpx)
+        self.client = genai.Client(api_key=api_key, http_options=_build_http_options(base_url, http_options))
+        # uso de tokens e latência das últimas chamadas feitas por esta instância
+        self.usage_log = deque(maxlen=USAGE_LOG_LIMIT)
+
+    def _generate(self, prompt: str, schema, label: str):
+        """Chama o Gemini com o schema de resposta e registra tokens/latência."""
+        started = time.perf_counter()
+        response = self.client.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=prompt,
+            config=_generation_config(schema),
+        )
+        self.usage_log.append(_usage_entry(label, response, started))
+        return response
 
     def get_details_about_plant(self, plant_name: str) -> PlantInfo:
         """
         Gera detalhes sobre uma planta usando o Gemini.
         """
-        prompt = (
-            f"Minha planta, de nome científico '{plant_name} está saudável. "
-            "Eu preciso das seguintes informações em português do Brasil: "
-            "1. Uma lista de nomes populares. "
-            "2. Uma breve descrição da planta. "
-            "3. A taxonomia (classe, gênero, ordem, família, filo). "
-            "4. Se é comestível (true/false). "
-            "5. Frequência de rega por semana. "
-            "6. Melhor estação para o plantio. "
-            "7. Nível de luz solar necessário. "
-            "8. Tipo de solo ideal."
-            "9. Informações sobre a origem (país, região, habitat)."
-        )
-
-        response = self.client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": PlantInfo,
-            },
-        )
+        response = self._generate(_details_prompt(plant_name), PlantInfo, "details")
         
         return PlantInfo.model_validate_json(response.text)
 
@@ -44,45 +130,137 @@ class GeminiService:
         """
         Gera um plano de tratamento para uma doença de planta usando o Gemini.
         """
-        prompt = (
-            f"Minha planta, de nome científico '{plant_name}', foi diagnosticada com a doença '{disease_name}'. "
-            "Por favor, forneça as seguintes informações em português do Brasil:\n"
-            "1. Os principais sintomas visíveis dessa doença.\n"
-            "2. Um plano de tratamento claro e prático.\n"
-            "3. Uma estimativa de tempo para a recuperação da planta."
-        )
-
-        response = self.client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": DiseaseInfo,
-            },
-        )
+        response = self._generate(_disease_prompt(plant_name, disease_name), DiseaseInfo, "disease")
         
         return DiseaseInfo.model_validate_json(response.text)
     
-    def get_nutritional_details(self, plant_name: str) -> PlantInfo:
+    def get_nutritional_details(self, plant_name: str) -> NutritionalInfo:
         """
         Gera detalhes alimentícios sobre uma planta usando o Gemini.
         """
-        prompt = (
-            f"Minha planta, de nome científico '{plant_name} está saudável. "
-            "Eu preciso das seguintes informações em português do Brasil: "
-            "1. É possível fazer chá? Se sim, como fazer e quais os benefícios. "
-            "2. Uma receita (nome e ingredientes) de um alimento que pode ser feito com a planta. "
-            "3. Usos medicinais: se houver, explique como usar e os benefícios. "
-            "4. Se for usada como tempero, em que tipos de pratos combina."
-        )
+        response = self._generate(_nutritional_prompt(plant_name), NutritionalInfo, "nutritional")
+        
+        return NutritionalInfo.model_validate_json(response.text)
 
-        response = self.client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": NutritionalInfo,
-            },
+    def get_deep_analysis(self, plant_name: str) -> DeepAnalysisInfo:
+        """
+        Gera detalhes e dados nutricionais numa única chamada ao Gemini,
+        enviando o contexto da planta uma vez só.
+        Levanta pydantic.ValidationError se a resposta não bater com o schema.
+        """
+        response = self._generate(_deep_analysis_prompt(plant_name), DeepAnalysisInfo, "deep_analysis")
+
+        return DeepAnalysisInfo.model_validate_json(response.text)
+
+
+class AsyncGeminiService:
+    """
+    Variante assíncrona (client.aio) do GeminiService. Prompts independentes
+    rodam ao mesmo tempo, com no máximo max_concurrency gerações em voo.
+    Os métodos *_sync são a fachada para quem não roda num event loop
+    (tasks do celery, comandos do terminal): todas as chamadas vão para um
+    único event loop de longa duração, numa thread do serviço, onde vivem o
+    cliente (e suas conexões) e o semáforo - então o limite vale para o
+    processo inteiro, mesmo com várias threads chamando ao mesmo tempo.
+    """
+
+    def __init__(self, api_key: str, base_url: str = None, max_concurrency: int = 4, http_options: dict = None):
+        self._client_options = {"api_key": api_key, "http_options": _build_http_options(base_url, http_options)}
+        self.max_concurrency = max_concurrency
+        self.usage_log = deque(maxlen=USAGE_LOG_LIMIT)
+        self.client = None
+        self._semaphore = None
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        _async_services.add(self)
+
+    async def _generate(self, prompt: str, schema, label: str):
+        async with self._semaphore:
+            started = time.perf_counter()
+            response = await self.client.aio.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=_generation_config(schema),
+            )
+        self.usage_log.append(_usage_entry(label, response, started))
+        return response
+
+    async def get_details_about_plant(self, plant_name: str) -> PlantInfo:
+        response = await self._generate(_details_prompt(plant_name), PlantInfo, "details")
+        return PlantInfo.model_validate_json(response.text)
+
+    async def get_nutritional_details(self, plant_name: str) -> NutritionalInfo:
+        response = await self._generate(_nutritional_prompt(plant_name), NutritionalInfo, "nutritional")
+        return NutritionalInfo.model_validate_json(response.text)
+
+    async def get_disease_treatment_plan(self, plant_name: str, disease_name: str) -> DiseaseInfo:
+        response = await self._generate(_disease_prompt(plant_name, disease_name), DiseaseInfo, "disease")
+        return DiseaseInfo.model_validate_json(response.text)
+
+    async def get_details_and_nutritional(self, plant_name: str) -> tuple[PlantInfo, NutritionalInfo]:
+        """Dispara os dois prompts da análise profunda ao mesmo tempo."""
+        return await asyncio.gather(
+            self.get_details_about_plant(plant_name),
+            self.get_nutritional_details(plant_name),
         )
-        
-        return NutritionalInfo.model_validate_json(response.text)
\ No newline at end of file
+
+    async def _setup(self):
+        # cliente e semáforo nascem no loop em que serão usados
+        self.client = genai.Client(**self._client_options)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Sobe (uma vez) o event loop do serviço numa thread daemon."""
+        if self._loop is not None:
+            return self._loop
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="gemini-async-loop", daemon=True)
+                thread.start()
+                asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+                self._thread = thread
+                self._loop = loop
+        return self._loop
+
+    def _run(self, coroutine_factory):
+        """Roda a corrotina no loop do serviço e espera o resultado."""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coroutine_factory(), loop).result()
+
+    def get_details_and_nutritional_sync(self, plant_name: str) -> tuple[PlantInfo, NutritionalInfo]:
+        """Fachada síncrona de get_details_and_nutritional (para o celery)."""
+        return self._run(lambda: self.get_details_and_nutritional(plant_name))
+
+    def close(self) -> None:
+        """Fecha o cliente e para o loop do serviço."""
+        with self._lock:
+            loop, thread, client = self._loop, self._thread, self.client
+            self._loop = self._thread = self.client = self._semaphore = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(client.aio.aclose(), loop).result(timeout=5)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+
+    def _reset_after_fork(self) -> None:
+        """
+        No filho de um fork a thread do loop não existe mais (e as conexões
+        são do pai): esquece tudo para o próximo uso subir um loop novo.
+        """
+        self._lock = threading.Lock()
+        self._loop = self._thread = self.client = self._semaphore = None
+
+
+_async_services = weakref.WeakSet()
+
+def _reset_async_services_after_fork() -> None:
+    for service in list(_async_services):
+        service._reset_after_fork()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_async_services_after_fork)
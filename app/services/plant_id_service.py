@@ -14,7 +14,11 @@ class PlantIdService:
 
     BASE_URL = "https://plant.id/api/v3/"
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, session: requests.Session = None, timeout=None):
+        # session com pool keep-alive (client_registry); sem ela, cada
+        # instância abre a própria sessão
+        self.session = session or requests.Session()
+        self.timeout = timeout
         self.api_key = api_key
         self.headers = {
             "Api-Key": self.api_key,
@@ -29,7 +33,7 @@ class PlantIdService:
         url = f"{self.BASE_URL}{endpoint}"
 
         try:
-            response = requests.request(method, url, headers=self.headers, json=data)
+            response = self.session.request(method, url, headers=self.headers, json=data, timeout=self.timeout)
             response.raise_for_status()
             return response.json()
 
@@ -2,22 +2,213 @@
 Serviços agenciadores do firebase messaging
 para permitir mandar as notificações no app
 de maneira controlada
+
+As notificações são enfileiradas no Redis (push:pending) e um worker as
+envia de 500 em 500 com o send_each do Firebase, limpando em massa os
+tokens não registrados.
+
+A fila é confiável: cada lote é movido (LMOVE) para uma lista de
+processamento do consumidor e só sai dela no ack, depois do envio. Se o
+worker morrer no meio, o próximo dreno devolve a lista órfã para a fila.
+Falhas transitórias (cota, indisponibilidade) vão para push:pending:retry
+e voltam à fila no próximo dreno, até PUSH_MAX_ATTEMPTS tentativas.
 """
 
-from firebase_admin import messaging
-from app.tasks import invalidate_fcm_token
+import json
+import time
+import uuid
+from flask import current_app
+from firebase_admin import exceptions, messaging
+from app.tasks import flush_push_queue, invalidate_fcm_tokens
+from app.utils.metrics_utils import incr_metrics
+
+# Limite do Firebase para o send_each
+FCM_BATCH_LIMIT = 500
+PENDING_PUSH_QUEUE = "push:pending"
+
+# Erros do FCM que valem uma nova tentativa (o resto é permanente)
+RETRYABLE_FCM_ERRORS = (
+    exceptions.UnavailableError,
+    exceptions.InternalError,
+    exceptions.DeadlineExceededError,
+    exceptions.ResourceExhaustedError,
+    exceptions.UnknownError,
+)
+
+def _stringify_data(data: dict | None) -> dict | None:
+    """O FCM só aceita strings como valores no 'data'."""
+    if not data:
+        return data
+    return {str(key): str(value) for key, value in data.items()}
+
+def build_message(fcm_token: str, title: str, body: str, data: dict = None) -> messaging.Message:
+    return messaging.Message(
+        notification=messaging.Notification(title=title, body=body),
+        token=fcm_token,
+        data=_stringify_data(data)
+    )
+
+def send_push_batch(pushes: list[dict], dry_run: bool = False, firebase_app=None,
+                    invalidate_unregistered: bool = True) -> tuple[dict, list[dict]]:
+    """
+    Envia uma lista de notificações ({fcm_token, title, body, data}) usando
+    o send_each do Firebase, em lotes de até 500. As falhas de cada mensagem
+    são mapeadas de volta ao token; tokens não registrados são invalidados
+    de uma vez só no final.
+    Retorna (resumo, notificações com falha transitória para tentar de novo).
+    """
+    summary = {"sent": 0, "failed": 0, "unregistered": 0, "batches": 0}
+    unregistered_tokens = set()
+    retry = []
+
+    for start in range(0, len(pushes), FCM_BATCH_LIMIT):
+        batch = pushes[start:start + FCM_BATCH_LIMIT]
+        messages = [
+            build_message(push['fcm_token'], push['title'], push['body'], push.get('data'))
+            for push in batch
+        ]
+
+        try:
+            batch_response = messaging.send_each(messages, dry_run=dry_run, app=firebase_app)
+        except Exception as e:
+            # nada foi confirmado: o lote inteiro volta para a fila
+            print(f"PUSH ERROR: Falha geral ao enviar lote de {len(messages)}: {e}")
+            retry.extend(batch)
+            continue
+
+        summary["batches"] += 1
+        for push, response in zip(batch, batch_response.responses):
+            if response.success:
+                summary["sent"] += 1
+            elif isinstance(response.exception, messaging.UnregisteredError):
+                unregistered_tokens.add(push['fcm_token'])
+            elif isinstance(response.exception, RETRYABLE_FCM_ERRORS):
+                retry.append(push)
+            else:
+                summary["failed"] += 1
+                print(f"PUSH ERROR: Falha ao enviar para {push['fcm_token'][:10]}...: {response.exception}")
+
+    if unregistered_tokens:
+        summary["unregistered"] = len(unregistered_tokens)
+        if invalidate_unregistered:
+            print(f"PUSH ERROR: {len(unregistered_tokens)} tokens não registrados. Disparando limpeza em massa.")
+            invalidate_fcm_tokens.delay(fcm_tokens=sorted(unregistered_tokens))
+
+    return summary, retry
+
+def enqueue_pushes(pushes: list[dict], queue: str = PENDING_PUSH_QUEUE) -> int:
+    """
+    Enfileira notificações ({fcm_token, title, body, data}) para o envio
+    em lote. Quem enfileira deve disparar tasks.flush_push_queue depois.
+    """
+    if not pushes:
+        return 0
+
+    payloads = [
+        json.dumps({**push, "enqueued_at": time.time()})
+        for push in pushes
+    ]
+    current_app.redis_client.rpush(queue, *payloads)
+    return len(payloads)
 
 def send_push_to_token(fcm_token: str, title: str, body: str, data: dict = None):
+    """
+    Compatibilidade por uma versão: o envio direto virou a fila em lote.
+    Enfileira a notificação e dispara o flush_push_queue.
+    """
+    enqueue_pushes([{"fcm_token": fcm_token, "title": title, "body": body, "data": data}])
+    flush_push_queue.delay()
+
+def _processing_key(queue: str, consumer: str) -> str:
+    return f"{queue}:processing:{consumer}"
+
+def _requeue_stalled(redis_client, queue: str, timeout_seconds: int) -> int:
+    """
+    Devolve à fila os lotes de consumidores que não dão sinal de vida há
+    timeout_seconds (worker morto no meio do envio) e as notificações
+    que aguardavam nova tentativa.
+    """
+    moved = 0
+    stalled = redis_client.zrangebyscore(f"{queue}:consumers", "-inf", time.time() - timeout_seconds)
+    for consumer in stalled:
+        processing = _processing_key(queue, consumer)
+        while redis_client.lmove(processing, queue, "LEFT", "RIGHT") is not None:
+            moved += 1
+        redis_client.zrem(f"{queue}:consumers", consumer)
+
+    while redis_client.lmove(f"{queue}:retry", queue, "LEFT", "RIGHT") is not None:
+        moved += 1
+    return moved
+
+def claim_push_batch(redis_client, queue: str, consumer: str) -> list[str]:
+    """Move até 500 notificações da fila para a lista de processamento do consumidor."""
+    redis_client.zadd(f"{queue}:consumers", {consumer: time.time()})
+    pipe = redis_client.pipeline(transaction=False)
+    for _ in range(FCM_BATCH_LIMIT):
+        pipe.lmove(queue, _processing_key(queue, consumer), "LEFT", "RIGHT")
+    return [raw for raw in pipe.execute() if raw is not None]
+
+def _ack_batch(redis_client, queue: str, consumer: str, retry_payloads: list[str]) -> None:
+    """Confirma o lote: limpa a lista de processamento e agenda as novas tentativas, atomicamente."""
+    pipe = redis_client.pipeline()
+    if retry_payloads:
+        pipe.rpush(f"{queue}:retry", *retry_payloads)
+    pipe.delete(_processing_key(queue, consumer))
+    pipe.execute()
+
+def drain_push_queue(dry_run: bool = False, queue: str = PENDING_PUSH_QUEUE, firebase_app=None,
+                     invalidate_unregistered: bool = True) -> dict:
+    """
+    Esvazia a fila push:pending enviando lotes de até 500 mensagens.
+    Vários workers podem drenar ao mesmo tempo (o LMOVE é atômico), cada
+    um com a sua lista de processamento (ver docstring do módulo).
+    """
+    config = current_app.config
+    redis_client = current_app.redis_client
+    max_attempts = config.get('PUSH_MAX_ATTEMPTS', 5)
+    consumer = uuid.uuid4().hex
+
+    totals = {"sent": 0, "failed": 0, "unregistered": 0, "batches": 0, "retried": 0, "recovered": 0}
+    totals["recovered"] = _requeue_stalled(redis_client, queue, config.get('PUSH_PROCESSING_TIMEOUT_SECONDS', 300))
+    oldest_wait = 0.0
+
     try:
-        message = messaging.Message(
-            notification=messaging.Notification(title=title, body=body),
-            token=fcm_token,
-            data=data
-        )
-        messaging.send(message)
-        print(f"PUSH: Enviado com sucesso para {fcm_token[:10]}...")
-    except messaging.UnregisteredError:
-        print(f"PUSH ERROR: Token {fcm_token[:10]}... não registrado. Disparando limpeza.")
-        invalidate_fcm_token.delay(fcm_token_to_remove=fcm_token)
-    except Exception as e:
-        print(f"PUSH ERROR: Falha geral ao enviar: {e}")
\ No newline at end of file
+        while True:
+            raw_pushes = claim_push_batch(redis_client, queue, consumer)
+            if not raw_pushes:
+                break
+
+            pushes = [json.loads(raw) for raw in raw_pushes]
+            summary, retry = send_push_batch(
+                pushes, dry_run=dry_run, firebase_app=firebase_app,
+                invalidate_unregistered=invalidate_unregistered
+            )
+            for key, value in summary.items():
+                totals[key] += value
+
+            retry_payloads = []
+            for push in retry:
+                attempts = push.get('attempts', 0) + 1
+                if attempts >= max_attempts:
+                    totals["failed"] += 1
+                    print(f"PUSH ERROR: {push['fcm_token'][:10]}... desistindo após {attempts} tentativas.")
+                    continue
+                retry_payloads.append(json.dumps({**push, "attempts": attempts}))
+            totals["retried"] += len(retry_payloads)
+            _ack_batch(redis_client, queue, consumer, retry_payloads)
+
+            # tempo entre o enfileiramento e a entrega (o mais antigo do lote)
+            enqueued = [push.get('enqueued_at') for push in pushes if push.get('enqueued_at')]
+            if enqueued:
+                oldest_wait = max(oldest_wait, time.time() - min(enqueued))
+    finally:
+        # se algo falhou no meio do lote, ele volta para a fila agora
+        processing = _processing_key(queue, consumer)
+        while redis_client.lmove(processing, queue, "LEFT", "RIGHT") is not None:
+            pass
+        redis_client.zrem(f"{queue}:consumers", consumer)
+
+    if totals["batches"] or totals["failed"] or totals["retried"]:
+        incr_metrics("push", totals)
+    totals["max_queue_wait_seconds"] = round(oldest_wait, 3)
+    return totals
@@ -8,177 +8,505 @@ em tempos de maneira extra-rapida (cache redis)
 import click
 from celery import shared_task
 from flask import current_app
+from sqlalchemy import String, cast, func, tuple_
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg, insert as pg_insert
+from pydantic import ValidationError
 from app.extensions import db
 from app.models.database import UserPlant, User, PlantGuide 
 from app.services.gemini_service import GeminiService
+from app.services.client_registry import get_gemini_service, get_async_gemini_service, get_plant_id_service
 import json
+import time
+import uuid
 from datetime import datetime, timedelta
 from app.utils.achievement_utils import grant_achievement_if_not_exists
+from app.utils.watering_utils import refresh_next_watering_due_for_entity, extract_watering_frequency_days
+from app.utils.fcm_token_utils import invalidate_tokens, invalidate_stale_tokens
+from app.utils.singleflight_utils import acquire_or_join, complete_flight, fail_flight, release_flight
+from app.utils.disease_plan_utils import get_disease_plan, save_disease_plan, cache_disease_plan, normalize_disease_name
+from app.utils.plant_id_cache_utils import cached_plant_id_call
+from app.utils.image_utils import call_with_normalized_image
+from app.utils.upload_utils import ImageUpload
+from app.utils.garden_utils import add_identified_plant_to_garden
+from app.utils.guide_cache_utils import set_guide_cache, guide_payload
+from app.utils.garden_sync_utils import prune_tombstones
+from app.utils.identify_job_utils import (
+    get_identify_job,
+    get_identify_job_image,
+    update_identify_job,
+    JOB_RUNNING,
+    JOB_COMPLETED,
+    JOB_FAILED
+)
+
+# Ids no resumo de rega: a mensagem do FCM tem limite de 4096 bytes, e cada
+# UUID em JSON ocupa ~40; o título, o corpo e as outras chaves usam o resto
+WATERING_DIGEST_MAX_IDS = 75
+WATERING_DIGEST_IDS_MAX_BYTES = 3000
+
+def _notify_species_owners(entity_id: str, title: str, body: str, chunk_size: int = 500):
+    """
+    Avisa os donos de uma espécie que monitoram a rega (os que a verificação
+    diária cobre) e têm token FCM que os dados do guia ficaram prontos.
+    Um push por usuário, mesmo com várias plantas da espécie (DISTINCT ON
+    user_id); percorre os donos em páginas (keyset por user_id).
+    """
+    owners_query = db.session.query(
+        User.id.label('user_id'),
+        User.fcm_token,
+        UserPlant.id.label('user_plant_id')
+    ).join(User, UserPlant.user_id == User.id
+    ).filter(
+        UserPlant.plant_entity_id == entity_id,
+        UserPlant.tracked_watering == True,
+        User.fcm_token.isnot(None)
+    ).distinct(User.id)
+
+    from app.services.push_notification_service import enqueue_pushes
+
+    notified = 0
+    for owners in _iter_keyset_chunks(owners_query, [User.id], lambda row: (row.user_id,), chunk_size):
+        notified += enqueue_pushes([
+            {
+                "fcm_token": owner.fcm_token,
+                "title": title,
+                "body": body,
+                "data": {
+                    "navigation_type": "plant_detail",
+                    "plant_id": str(owner.user_plant_id)
+                }
+            }
+            for owner in owners
+        ])
+
+    if notified:
+        flush_push_queue.delay()
+    return notified
+
+def _valid_user_ids(values) -> list[uuid.UUID]:
+    """Filtra ids de usuário válidos (as esperas do single-flight chegam como texto)."""
+    user_ids = []
+    for value in values:
+        try:
+            user_ids.append(uuid.UUID(str(value)))
+        except (TypeError, ValueError):
+            continue
+    return user_ids
+
+def _notify_users_of_species(user_ids, entity_id: str, title: str, body: str):
+    """Avisa usuários específicos (que possuem a espécie) que o guia ficou pronto."""
+    user_ids = _valid_user_ids(user_ids)
+    if not user_ids:
+        return 0
+
+    # um push por usuário, mesmo com várias plantas da espécie
+    recipients = db.session.query(
+        User.id.label('user_id'),
+        User.fcm_token,
+        UserPlant.id.label('user_plant_id')
+    ).join(User, UserPlant.user_id == User.id
+    ).filter(
+        UserPlant.plant_entity_id == entity_id,
+        User.id.in_(user_ids),
+        User.fcm_token.isnot(None)
+    ).distinct(User.id).order_by(User.id, UserPlant.added_at).all()
+
+    from app.services.push_notification_service import enqueue_pushes
+    notified = enqueue_pushes([
+        {
+            "fcm_token": recipient.fcm_token,
+            "title": title,
+            "body": body,
+            "data": {
+                "navigation_type": "plant_detail",
+                "plant_id": str(recipient.user_plant_id)
+            }
+        }
+        for recipient in recipients
+    ])
 
-# Define o tempo de vida do cache que será usado pela task de enrich
-DEFAULT_CACHE_TTL = 60 * 60 * 24 * 7 # 7 dias
+    if notified:
+        flush_push_queue.delay()
+    return notified
+
+def _generate_split_analysis(scientific_name: str) -> tuple[dict, dict]:
+    """Detalhes + nutrição em duas chamadas disparadas ao mesmo tempo."""
+    async_service = get_async_gemini_service()
+    details, nutritional = async_service.get_details_and_nutritional_sync(scientific_name)
+    return details.model_dump(), nutritional.model_dump()
+
+def _generate_deep_analysis(gemini_service: GeminiService, scientific_name: str) -> tuple[dict, dict]:
+    """
+    Gera detalhes + nutrição conforme GEMINI_DEEP_ANALYSIS_MODE:
+    - 'combined': uma única chamada com o schema DeepAnalysisInfo; se a
+      resposta não validar, cai para as duas chamadas concorrentes.
+    - 'concurrent': detalhes e nutrição ao mesmo tempo (cliente assíncrono).
+    - 'split': uma chamada para detalhes e depois outra para nutrição.
+    """
+    mode = current_app.config.get('GEMINI_DEEP_ANALYSIS_MODE', 'combined')
+
+    if mode == 'combined':
+        try:
+            analysis = gemini_service.get_deep_analysis(scientific_name)
+            return analysis.details.model_dump(), analysis.nutritional.model_dump()
+        except ValidationError as e:
+            click.secho(f"--- [CELERY WORKER - Enrich]: Resposta combinada inválida para {scientific_name}, usando chamadas separadas: {e}", fg='yellow')
+        return _generate_split_analysis(scientific_name)
+
+    if mode == 'concurrent':
+        return _generate_split_analysis(scientific_name)
+
+    details = gemini_service.get_details_about_plant(scientific_name)
+    nutritional = gemini_service.get_nutritional_details(scientific_name)
+    return details.model_dump(), nutritional.model_dump()
+
+def _notify_flight_failure(kind: str, key_parts: tuple, user_id_to_notify, entity_id: str, title: str, body: str):
+    """
+    Tentativas esgotadas: recolhe as esperas do single-flight e avisa elas
+    (e quem pediu) da falha, para ninguém ficar esperando um push que não vem.
+    O "*" da verificação de rega é descartado - a próxima verificação reenfileira.
+    """
+    try:
+        waiters = fail_flight(kind, *key_parts)
+        notified = _notify_users_of_species([user_id_to_notify, *waiters], entity_id, title=title, body=body)
+        click.secho(f"--- [CELERY WORKER - SingleFlight]: {notified} usuários avisados da falha em {kind} {entity_id} ({len(waiters)} em espera).", fg='yellow')
+    except Exception as e:
+        db.session.rollback()
+        click.secho(f"--- [CELERY WORKER - SingleFlight]: ERRO ao avisar esperas de {kind} {entity_id}: {e} ---", fg="red")
+
+def _details_ready(guide) -> bool:
+    return bool(guide and guide.details_cache and guide.nutritional_cache)
 
 @shared_task(name="tasks.enrich_plant_details_task", bind=True, max_retries=3, default_retry_delay=300)
-def enrich_plant_details_task(self, entity_id, scientific_name, user_id_to_notify: str):
+def enrich_plant_details_task(self, entity_id, scientific_name, user_id_to_notify: str = None, notify_owners: bool = False):
     """
     Busca no Gemini - detalhes da planta.
     - Atualiza DB
     - Atualiza Redis
     - Concede a conquista 'first_deep_analysis'
+    - notify_owners=True (verificação de rega): avisa todos os donos da espécie
+    Só um worker por espécie chama o Gemini (single-flight); os demais
+    entram na espera e são avisados pelo líder.
     """
     click.secho(f"--- [CELERY WORKER - Enrich]: Iniciando busca de detalhes para {scientific_name} ({entity_id}) ---", bold=True)
+    flight_token = None
     try:
         with current_app.app_context():
             guide = PlantGuide.query.get(entity_id)
-            if guide and guide.details_cache and guide.nutritional_cache:
+            if _details_ready(guide):
                  click.secho(f"--- [CELERY WORKER - Enrich]: Detalhes para {entity_id} já existem no DB. Abortando.", fg='cyan')
+                 # guias antigos: extrai o intervalo de rega do texto livre
+                 if guide.watering_frequency_days is None:
+                     guide.watering_frequency_days = extract_watering_frequency_days(guide.details_cache)
+                     db.session.flush()
+                 # garante que as plantas da espécie tenham a próxima rega calculada
+                 refresh_next_watering_due_for_entity(entity_id)
+                 db.session.commit()
                  return
 
-            gemini_service = GeminiService(api_key=current_app.config['GEMINI_API_KEY'])
-            details = gemini_service.get_details_about_plant(scientific_name)
-            nutritional = gemini_service.get_nutritional_details(scientific_name)
-
-            details_dict = details.model_dump()
-            nutritional_dict = nutritional.model_dump()
+            # "*" = ao terminar, avisar todos os donos da espécie
+            waiter = "*" if notify_owners else str(user_id_to_notify)
+            flight_token = acquire_or_join("details", entity_id, waiter=waiter)
+            if not flight_token:
+                click.secho(f"--- [CELERY WORKER - Enrich]: {entity_id} já está sendo gerado por outro worker. Aguardando o resultado dele.", fg='cyan')
+                return
 
+            # Outro líder pode ter terminado entre a checagem e a lease
             if guide:
+                db.session.refresh(guide)
+
+            if _details_ready(guide):
+                details_dict = guide.details_cache
+                nutritional_dict = guide.nutritional_cache
+            else:
+                gemini_service = get_gemini_service()
+                details_dict, nutritional_dict = _generate_deep_analysis(gemini_service, scientific_name)
+                frequency_days = extract_watering_frequency_days(details_dict)
+
+                if not guide:
+                    # dois líderes (ex: lease expirada) podem chegar aqui sem guia:
+                    # só um INSERT vence, e os dois gravam na mesma linha
+                    db.session.execute(
+                        pg_insert(PlantGuide).values(
+                            entity_id=entity_id,
+                            scientific_name=scientific_name
+                        ).on_conflict_do_nothing(index_elements=[PlantGuide.entity_id])
+                    )
+                    guide = db.session.get(PlantGuide, entity_id)
+
                 guide.details_cache = details_dict
                 guide.nutritional_cache = nutritional_dict
+                guide.watering_frequency_days = frequency_days
                 guide.last_gemini_update = datetime.utcnow()
-            else:
-                 guide = PlantGuide(
-                     entity_id=entity_id,
-                     scientific_name=scientific_name,
-                     details_cache=details_dict,
-                     nutritional_cache=nutritional_dict,
-                     last_gemini_update = datetime.utcnow()
-                 )
-                 db.session.add(guide)
-            
-            user = User.query.get(user_id_to_notify)
-            if user:
-                grant_achievement_if_not_exists(user, 'first_deep_analysis')
 
+                db.session.flush()
+                refresh_next_watering_due_for_entity(entity_id)
             db.session.commit()
+            # grava no Redis e avisa os processos para descartarem a cópia local
+            # antes de qualquer push: quem abrir a notificação já lê o guia novo
+            set_guide_cache(entity_id, guide_payload(guide))
 
-            user = User.query.get(user_id_to_notify) # Re-busca (ou usa o mesmo)
-            if user and user.fcm_token:
-                send_generic_push.delay(
-                    fcm_token=user.fcm_token,
-                    title="Análise Concluída!",
-                    body=f"Os detalhes profundos da sua '{guide.scientific_name}' estão prontos.",
-                    data={
-                        "navigation_type": "plant_detail",
-                        "plant_id": str(user.garden.filter_by(plant_entity_id=guide.entity_id).first().id)
-                    }
-                )
+            # Resultado salvo: libera a lease e pega quem estava esperando
+            waiters = complete_flight("details", entity_id, token=flight_token)
+            flight_token = None
 
-            combined_cache_data = {
-                "details": details_dict,
-                "nutritional": nutritional_dict
-            }
-            current_app.redis_client.set(f"guide:{entity_id}", json.dumps(combined_cache_data), ex=DEFAULT_CACHE_TTL)
-            
+            fan_out_to_owners = notify_owners or "*" in waiters
+            requesters = _valid_user_ids([user_id_to_notify, *waiters])
+
+            if requesters:
+                for user in User.query.filter(User.id.in_(requesters)).all():
+                    grant_achievement_if_not_exists(user, 'first_deep_analysis')
+                db.session.commit()
+
+            title = "Análise Concluída!"
+            body = f"Os detalhes profundos da sua '{guide.scientific_name}' estão prontos."
+            if fan_out_to_owners:
+                notified = _notify_species_owners(entity_id, title=title, body=body)
+            else:
+                notified = _notify_users_of_species(requesters, entity_id, title=title, body=body)
+            click.secho(f"--- [CELERY WORKER - Enrich]: {notified} donos de {entity_id} notificados ({len(waiters)} em espera).", fg='cyan')
             click.secho(f"--- [CELERY WORKER - Enrich]: Detalhes para {entity_id} salvos com sucesso no DB e Redis. ---", fg='green')
 
     except Exception as exc:
         click.secho(f"--- [CELERY WORKER - Enrich]: ERRO ao buscar detalhes para {entity_id}: {exc} ---", fg="red")
         db.session.rollback()
-        try:
-             self.retry(exc=exc)
-        except self.MaxRetriesExceededError:
+        if flight_token:
+            # as esperas continuam registradas para a próxima tentativa
+            release_flight("details", entity_id, token=flight_token)
+        # com exc=, o retry relança exc ao esgotar as tentativas (nunca
+        # MaxRetriesExceededError): a desistência é tratada antes dele
+        if self.request.retries >= self.max_retries:
             click.secho(f"--- [CELERY WORKER - Enrich]: MÁXIMO DE TENTATIVAS ATINGIDO para {entity_id}. Desistindo. ---", fg="red")
-        finally:
-             with current_app.app_context():
-                db.session.remove()
+            _notify_flight_failure(
+                "details", (entity_id,), user_id_to_notify, entity_id,
+                title="Análise Indisponível",
+                body=f"Não conseguimos gerar os detalhes da sua '{scientific_name}' agora. Tente novamente mais tarde."
+            )
+            raise
+        self.retry(exc=exc)
     finally:
          with current_app.app_context():
             db.session.remove()
 
+def _iter_keyset_chunks(base_query, key_columns: list, key_getter, chunk_size: int):
+    """
+    Percorre uma consulta em páginas ordenadas por key_columns (keyset),
+    devolvendo uma página por vez. Cada página é uma consulta curta, então
+    não seguramos uma transação de leitura longa nem a tabela inteira na memória.
+    """
+    last_key = None
+    while True:
+        query = base_query
+        if last_key is not None:
+            query = query.filter(tuple_(*key_columns) > tuple_(*last_key))
+
+        chunk = query.order_by(*key_columns).limit(chunk_size).all()
+        # encerra a transação de leitura entre uma página e outra
+        db.session.commit()
+
+        if not chunk:
+            return
+
+        yield chunk
+
+        if len(chunk) < chunk_size:
+            return
+        last_key = key_getter(chunk[-1])
+
+def _log_chunk_timing(label: str, chunk_number: int, size: int, fetched_in: float, processed_in: float):
+    click.secho(
+        f"--- [CELERY BEAT]: {label} página {chunk_number}: {size} registros "
+        f"(consulta {fetched_in * 1000:.1f}ms, total {processed_in * 1000:.1f}ms).",
+        fg="cyan"
+    )
+
 @shared_task(name="tasks.check_all_plants_for_watering")
 def check_all_plants_for_watering():
     """
     Verificação de rega, agendada pelo beat 1x/dia
     Identifica plantas que precisam de rega. Se faltar dados, dispara o 'enrich'.
+    - Vencidas: range scan no índice parcial de next_watering_due, agrupadas
+      no SQL num único resumo por usuário.
+    - Guia sem dados (next_watering_due e details_cache nulos): dispara o enrich.
+    Ambas são lidas em páginas (WATERING_SWEEP_CHUNK_SIZE) para a memória
+    do worker não crescer junto com o número de plantas monitoradas.
     """
     click.secho("--- [CELERY BEAT]: Iniciando verificação diária de rega... ---", bold=True, fg='blue')
+    from app.services.push_notification_service import enqueue_pushes
     
     with current_app.app_context():
         try:
-            plants_to_check = db.session.query(
-                UserPlant.id.label('user_plant_id'),
-                UserPlant.nickname,
-                UserPlant.last_watered,
-                UserPlant.added_at,
+            chunk_size = current_app.config.get('WATERING_SWEEP_CHUNK_SIZE', 500)
+            now = datetime.utcnow()
+
+            # Plantas vencidas, já agrupadas por usuário no SQL: uma linha por
+            # usuário com a contagem e as primeiras plantas (mais atrasadas
+            # primeiro). Cada página vira resumos enfileirados na hora, então
+            # a memória fica constante e uma queda no meio não perde os
+            # lembretes das páginas anteriores.
+            max_names = max(1, current_app.config.get('WATERING_DIGEST_MAX_NAMES', 3))
+            due_order = (UserPlant.next_watering_due, UserPlant.id)
+            due_query = db.session.query(
                 User.id.label('user_id'),
                 User.fcm_token,
-                PlantGuide.entity_id,
-                PlantGuide.scientific_name,
-                PlantGuide.details_cache
+                func.count(UserPlant.id).label('plant_count'),
+                array_agg(aggregate_order_by(cast(UserPlant.id, String), *due_order))[1:WATERING_DIGEST_MAX_IDS].label('plant_ids'),
+                array_agg(aggregate_order_by(
+                    func.coalesce(UserPlant.nickname, PlantGuide.scientific_name), *due_order
+                ))[1:max_names].label('names')
             ).join(User, UserPlant.user_id == User.id
             ).join(PlantGuide, UserPlant.plant_entity_id == PlantGuide.entity_id
             ).filter(
                 UserPlant.tracked_watering == True,
+                UserPlant.next_watering_due <= now,
                 User.fcm_token.isnot(None)
-            ).all()
-
-            click.secho(f"--- [CELERY BEAT]: Encontradas {len(plants_to_check)} plantas monitoradas para verificar.", fg="cyan")
-
-            for plant in plants_to_check:
-                frequency_days = None
-                
-                if plant.details_cache and isinstance(plant.details_cache, dict):
-                    frequency_days = plant.details_cache.get('watering_frequency_days')
-
-                if frequency_days is None:
-                    click.secho(f"--- [CELERY BEAT]: Planta {plant.nickname or plant.scientific_name} ({plant.entity_id}) sem dados de rega. Disparando busca no Gemini.", fg="yellow")
+            ).group_by(User.id, User.fcm_token)
+
+            total_due = 0
+            total_digests = 0
+            chunk_number = 0
+            chunk_started = time.perf_counter()
+            for due_users in _iter_keyset_chunks(
+                due_query,
+                [User.id],
+                lambda row: (row.user_id,),
+                chunk_size
+            ):
+                chunk_number += 1
+                fetched_in = time.perf_counter() - chunk_started
+
+                total_digests += enqueue_pushes([
+                    _build_watering_digest_push(row.fcm_token, {
+                        "plant_ids": list(row.plant_ids),
+                        "names": list(row.names),
+                        "count": row.plant_count
+                    })
+                    for row in due_users
+                ])
+                total_due += sum(row.plant_count for row in due_users)
+                _log_chunk_timing("Vencidas", chunk_number, len(due_users), fetched_in, time.perf_counter() - chunk_started)
+                chunk_started = time.perf_counter()
+
+            if total_digests:
+                click.secho(f"--- [CELERY BEAT]: {total_due} plantas com sede em {total_digests} resumos enfileirados. Disparando envio em lote.", fg="green")
+                flush_push_queue.delay()
+
+            # Espécies cujo guia ainda não tem dados do Gemini, uma vez por entity_id.
+            # Guias já enriquecidos nunca são re-enviados, mesmo sem intervalo de rega.
+            missing_query = db.session.query(
+                PlantGuide.entity_id,
+                PlantGuide.scientific_name
+            ).join(UserPlant, UserPlant.plant_entity_id == PlantGuide.entity_id
+            ).join(User, UserPlant.user_id == User.id
+            ).filter(
+                UserPlant.tracked_watering == True,
+                UserPlant.next_watering_due.is_(None),
+                PlantGuide.details_cache.is_(None),
+                User.fcm_token.isnot(None)
+            ).distinct()
+
+            total_missing = 0
+            chunk_number = 0
+            chunk_started = time.perf_counter()
+            for missing_guides in _iter_keyset_chunks(
+                missing_query,
+                [PlantGuide.entity_id],
+                lambda row: (row.entity_id,),
+                chunk_size
+            ):
+                chunk_number += 1
+                fetched_in = time.perf_counter() - chunk_started
+
+                for guide in missing_guides:
+                    click.secho(f"--- [CELERY BEAT]: Espécie {guide.scientific_name} ({guide.entity_id}) sem dados de rega. Disparando busca no Gemini.", fg="yellow")
+                    # Um único enrich por espécie; ao terminar ele avisa todos os donos
                     enrich_plant_details_task.delay(
-                        entity_id=plant.entity_id, 
-                        scientific_name=plant.scientific_name,
-                        user_id_to_notify=plant.user_id
+                        entity_id=guide.entity_id,
+                        scientific_name=guide.scientific_name,
+                        notify_owners=True
                     )
-                    continue 
 
-                last_watered_date = plant.last_watered or plant.added_at
-                due_date = last_watered_date.date() + timedelta(days=frequency_days)
-                
-                if datetime.utcnow().date() >= due_date:
-                    plant_display_name = plant.nickname or plant.scientific_name
-                    click.secho(f"--- [CELERY BEAT]: Planta {plant_display_name} precisa de rega. Disparando notificação.", fg="green")
-                    send_watering_notification.delay(
-                        fcm_token=plant.fcm_token,
-                        plant_name=plant_display_name,
-                        plant_id=str(plant.user_plant_id)
-                    )
+                total_missing += len(missing_guides)
+                _log_chunk_timing("Sem dados", chunk_number, len(missing_guides), fetched_in, time.perf_counter() - chunk_started)
+                chunk_started = time.perf_counter()
+
+            click.secho(f"--- [CELERY BEAT]: {total_due} plantas vencidas, {total_missing} espécies sem dados de rega.", fg="cyan")
         except Exception as e:
             click.secho(f"--- [CELERY BEAT]: ERRO na verificação diária: {e} ---", fg="red")
             db.session.rollback()
         finally:
             db.session.remove()
 
-# Envia notificacao
+def _build_watering_push(fcm_token: str, plant_name: str, plant_id: str) -> dict:
+    """Monta a notificação de rega de uma planta."""
+    return {
+        "fcm_token": fcm_token,
+        "title": "Plante - Lembrete de Rega",
+        "body": f"Sua planta '{plant_name}' está com sede! Não se esqueça de regá-la.",
+        "data": {
+            "navigation_type": "plant_detail",
+            "plant_id": plant_id
+        }
+    }
+
+def _build_watering_digest_push(fcm_token: str, digest: dict) -> dict:
+    """
+    Monta o resumo de rega de um usuário. Com uma planta só, mantém a
+    notificação antiga (plant_detail); com várias, cita até
+    WATERING_DIGEST_MAX_NAMES nomes e manda os ids em 'plant_ids' (até
+    WATERING_DIGEST_IDS_MAX_BYTES); os que ficaram de fora são contados em
+    'plant_ids_omitted'.
+    """
+    if digest["count"] == 1:
+        return _build_watering_push(fcm_token, digest["names"][0], digest["plant_ids"][0])
+
+    quoted_names = [f"'{name}'" for name in digest["names"]]
+    remaining = digest["count"] - len(quoted_names)
+    if remaining > 0:
+        named = ", ".join(quoted_names) + f" e mais {remaining} planta{'s' if remaining > 1 else ''}"
+    else:
+        named = ", ".join(quoted_names[:-1]) + f" e {quoted_names[-1]}"
+
+    plant_ids = list(digest["plant_ids"])
+    encoded_ids = json.dumps(plant_ids)
+    while len(encoded_ids) > WATERING_DIGEST_IDS_MAX_BYTES:
+        plant_ids.pop()
+        encoded_ids = json.dumps(plant_ids)
+
+    return {
+        "fcm_token": fcm_token,
+        "title": "Plante - Lembrete de Rega",
+        "body": f"Suas plantas {named} estão com sede! Não se esqueça de regá-las.",
+        "data": {
+            "navigation_type": "watering_digest",
+            "plant_count": str(digest["count"]),
+            "plant_ids": encoded_ids,
+            "plant_ids_omitted": str(digest["count"] - len(plant_ids))
+        }
+    }
+
+# compatibilidade por uma versão: mensagens já enfileiradas com os nomes
+# antigos ainda chegam durante o deploy; ambas só entram na fila em lote
 @shared_task(name="tasks.send_watering_notification")
 def send_watering_notification(fcm_token, plant_name, plant_id: str):
     """
-    Envia uma notificação de rega e trata erros FCM.
+    Enfileira a notificação de rega de uma planta (use o resumo do
+    check_all_plants_for_watering).
     """
     with current_app.app_context():
-        try:
-            title = "Plante - Lembrete de Rega"
-            body = f"Sua planta '{plant_name}' está com sede! Não se esqueça de regá-la."
-
-            navigation_data = {
-                "navigation_type": "plant_detail",
-                "plant_id": plant_id
-            }
-            
-            click.secho(f"--- [CELERY WORKER - Push]: ENVIANDO PUSH para {fcm_token[:10]}... sobre '{plant_name}' ---", bold=True)
+        from app.services.push_notification_service import enqueue_pushes
+        enqueue_pushes([_build_watering_push(fcm_token, plant_name, plant_id)])
+        flush_push_queue.delay()
 
-            from app.services.push_notification_service import send_push_to_token
-            send_push_to_token(fcm_token, title, body, data=navigation_data)
-            
-        except Exception as e: 
-            click.secho(f"--- [CELERY WORKER - Push]: Falha GERAL ao enviar push para {fcm_token[:10]}. Erro: {e} ---", fg="red")
+@shared_task(name="tasks.send_generic_push")
+def send_generic_push(fcm_token: str, title: str, body: str, data: dict = None):
+    """
+    Enfileira uma notificação genérica (use enqueue_pushes).
+    """
+    with current_app.app_context():
+        from app.services.push_notification_service import enqueue_pushes
+        enqueue_pushes([{"fcm_token": fcm_token, "title": title, "body": body, "data": data}])
+        flush_push_queue.delay()
 
 @shared_task(name="tasks.invalidate_fcm_token", bind=True, max_retries=3, default_retry_delay=60)
 def invalidate_fcm_token(self, fcm_token_to_remove):
@@ -189,13 +517,11 @@ def invalidate_fcm_token(self, fcm_token_to_remove):
     click.secho(f"--- [CELERY WORKER - Invalidate]: Tentando invalidar token {fcm_token_to_remove[:10]}... ---", bold=True, fg='magenta')
     with current_app.app_context():
         try:
-            user = User.query.filter_by(fcm_token=fcm_token_to_remove).first()
+            cleared_ids = invalidate_tokens([fcm_token_to_remove])
+            db.session.commit()
             
-            if user:
-                click.secho(f"--- [CELERY WORKER - Invalidate]: Token encontrado para user {user.id}. Invalidando.", fg='magenta')
-                user.fcm_token = None
-                user.fcm_token_updated_at = None
-                db.session.commit()
+            if cleared_ids:
+                click.secho(f"--- [CELERY WORKER - Invalidate]: Token encontrado para user {cleared_ids[0]}. Invalidado.", fg='magenta')
             else:
                 click.secho(f"--- [CELERY WORKER - Invalidate]: Token {fcm_token_to_remove[:10]}... não encontrado ou já invalidado.", fg='yellow')
                 
@@ -206,33 +532,99 @@ def invalidate_fcm_token(self, fcm_token_to_remove):
         finally:
             db.session.remove()
 
+@shared_task(name="tasks.invalidate_fcm_tokens", bind=True, max_retries=3, default_retry_delay=60)
+def invalidate_fcm_tokens(self, fcm_tokens: list):
+    """
+    Versão em massa do invalidate_fcm_token: limpa vários tokens
+    (ex: não registrados num envio em lote) com um único UPDATE.
+    """
+    click.secho(f"--- [CELERY WORKER - Invalidate]: Invalidando {len(fcm_tokens)} tokens em massa... ---", bold=True, fg='magenta')
+    with current_app.app_context():
+        try:
+            cleared_ids = invalidate_tokens(fcm_tokens)
+            db.session.commit()
+            click.secho(f"--- [CELERY WORKER - Invalidate]: {len(cleared_ids)} usuários tiveram o token invalidado.", fg='magenta')
+        except Exception as exc:
+            click.secho(f"--- [CELERY WORKER - Invalidate]: ERRO ao invalidar tokens: {exc} ---", fg="red")
+            db.session.rollback()
+            self.retry(exc=exc)
+        finally:
+            db.session.remove()
+
+@shared_task(name="tasks.flush_push_queue")
+def flush_push_queue():
+    """
+    Esvazia a fila de notificações pendentes (push:pending), enviando
+    em lotes de até 500 com o send_each do Firebase.
+    """
+    with current_app.app_context():
+        try:
+            from app.services.push_notification_service import drain_push_queue
+            summary = drain_push_queue(dry_run=current_app.config.get('FCM_DRY_RUN', False))
+            if summary["batches"] or summary["failed"] or summary["recovered"]:
+                click.secho(
+                    f"--- [CELERY WORKER - Push Lote]: {summary['sent']} enviadas, {summary['failed']} falhas, "
+                    f"{summary['retried']} para nova tentativa, {summary['recovered']} devolvidas à fila, "
+                    f"{summary['unregistered']} tokens inválidos em {summary['batches']} lotes "
+                    f"(espera máx. na fila {summary['max_queue_wait_seconds']}s). ---",
+                    fg="green"
+                )
+            return summary
+        except Exception as e:
+            click.secho(f"--- [CELERY WORKER - Push Lote]: Falha ao esvaziar a fila: {e} ---", fg="red")
+
 @shared_task(name="tasks.check_stale_fcm_tokens")
-def check_stale_fcm_tokens():
+def check_stale_fcm_tokens(dry_run: bool = False):
     """
-    Busca por tokens FCM que não foram atualizados
-    há muito tempo e dispara a invalidação para eles.
+    Invalida os tokens FCM que não foram atualizados há muito tempo
+    (FCM_STALE_DAYS), em lotes set-based de UPDATE ... RETURNING.
+    Com dry_run=True apenas reporta quantos seriam invalidados.
     """
 
     click.secho("--- [CELERY BEAT - Stale Check]: Iniciando verificação de tokens FCM antigos... ---", bold=True, fg='blue')
-    STALE_DAYS = 60
     
     with current_app.app_context():
         try:
-            stale_threshold = datetime.utcnow() - timedelta(days=STALE_DAYS)
-            
-            stale_users = User.query.filter(
-                User.fcm_token.isnot(None),
-                User.fcm_token_updated_at < stale_threshold
-            ).all()
+            stale_days = current_app.config.get('FCM_STALE_DAYS', 60)
+            stale_threshold = datetime.utcnow() - timedelta(days=stale_days)
 
-            click.secho(f"--- [CELERY BEAT - Stale Check]: Encontrados {len(stale_users)} tokens potencialmente antigos.", fg='cyan')
+            report = invalidate_stale_tokens(
+                stale_threshold,
+                batch_size=current_app.config.get('FCM_INVALIDATION_BATCH_SIZE', 1000),
+                dry_run=dry_run
+            )
 
-            for user in stale_users:
-                click.secho(f"--- [CELERY BEAT - Stale Check]: Token do user {user.id} ({user.fcm_token[:10]}...) parece antigo. Disparando invalidação.", fg='yellow')
-                invalidate_fcm_token.delay(fcm_token_to_remove=user.fcm_token)
+            if report["dry_run"]:
+                click.secho(f"--- [CELERY BEAT - Stale Check]: (dry-run) {report['stale']} tokens seriam invalidados.", fg='yellow')
+            else:
+                click.secho(f"--- [CELERY BEAT - Stale Check]: {report['invalidated']} tokens antigos invalidados em {report['batches']} lotes.", fg='cyan')
+            return report
                         
         except Exception as e:
             click.secho(f"--- [CELERY BEAT - Stale Check]: ERRO na verificação de tokens antigos: {e} ---", fg="red")
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+@shared_task(name="tasks.prune_garden_tombstones")
+def prune_garden_tombstones():
+    """
+    Apaga os tombstones de plantas removidas há mais de
+    GARDEN_TOMBSTONE_RETENTION_DAYS. Apps que não sincronizam desde
+    antes disso recebem um sync completo no /garden/changes.
+    """
+    click.secho("--- [CELERY BEAT - Tombstones]: Limpando registros de plantas removidas... ---", bold=True, fg='blue')
+
+    with current_app.app_context():
+        try:
+            retention_days = current_app.config.get('GARDEN_TOMBSTONE_RETENTION_DAYS', 30)
+            deleted = prune_tombstones(datetime.utcnow() - timedelta(days=retention_days))
+            db.session.commit()
+            click.secho(f"--- [CELERY BEAT - Tombstones]: {deleted} tombstones com mais de {retention_days} dias apagados.", fg='cyan')
+            return deleted
+        except Exception as e:
+            click.secho(f"--- [CELERY BEAT - Tombstones]: ERRO ao limpar tombstones: {e} ---", fg="red")
+            db.session.rollback()
         finally:
             db.session.remove()
 
@@ -240,8 +632,14 @@ def check_stale_fcm_tokens():
 def enrich_health_data_task(self, entity_id: str, scientific_name: str, disease_name: str, user_id_to_notify: str):
     """
     Busca o plano de tratamento de doença no Gemini.
+    O plano fica em plant_disease_plans (um por espécie + doença) e no Redis;
+    o health_cache do guia guarda só o último gerado.
+    Single-flight por (espécie, doença): pedidos simultâneos esperam o líder.
     """
     click.secho(f"--- [CELERY WORKER - Health]: Buscando plano de tratamento para {disease_name} em {scientific_name} ---", bold=True)
+    flight_token = None
+    # "Oídio" e "oídio" dividem o mesmo voo
+    flight_name = normalize_disease_name(disease_name)
     
     try:
         with current_app.app_context():
@@ -250,57 +648,117 @@ def enrich_health_data_task(self, entity_id: str, scientific_name: str, disease_
                 click.secho(f"--- [CELERY WORKER - Health]: PlantGuide {entity_id} não encontrado. Abortando.", fg='yellow')
                 return
 
-            if guide.health_cache and guide.health_cache.get('disease_name') == disease_name:
+            if get_disease_plan(entity_id, disease_name) is not None:
                 click.secho(f"--- [CELERY WORKER - Health]: Plano de tratamento para {disease_name} já existe. Abortando.", fg='cyan')
                 return
 
-            gemini_service = GeminiService(api_key=current_app.config['GEMINI_API_KEY'])
-            treatment_plan = gemini_service.get_disease_treatment_plan(scientific_name, disease_name)
-            
-            health_data = treatment_plan.model_dump()
-
-            guide.health_cache = health_data
-            guide.last_gemini_update = datetime.utcnow()
-            db.session.commit()
+            flight_token = acquire_or_join("health", entity_id, flight_name, waiter=str(user_id_to_notify))
+            if not flight_token:
+                click.secho(f"--- [CELERY WORKER - Health]: {disease_name} em {entity_id} já está sendo gerado por outro worker. Aguardando o resultado dele.", fg='cyan')
+                return
 
-            user = User.query.get(user_id_to_notify)
-            if user and user.fcm_token:
-                send_generic_push.delay(
-                    fcm_token=user.fcm_token,
-                    title="Plano de Saúde Pronto!",
-                    body=f"O plano de tratamento para '{disease_name}' na sua '{guide.scientific_name}' está pronto.",
-                    data={
-                        "navigation_type": "plant_detail",
-                        "plant_id": str(user.garden.filter_by(plant_entity_id=guide.entity_id).first().id)
-                    }
-                )
+            # outro líder pode ter terminado entre a verificação e o lease
+            health_data = get_disease_plan(entity_id, disease_name)
+            if health_data is None:
+                gemini_service = get_gemini_service()
+                treatment_plan = gemini_service.get_disease_treatment_plan(scientific_name, disease_name)
+                
+                health_data = treatment_plan.model_dump()
 
-            click.secho(f"--- [CELERY WORKER - Health]: Plano de tratamento para {disease_name} salvo com sucesso. ---", fg='green')
+                save_disease_plan(entity_id, disease_name, health_data)
+                guide.health_cache = health_data
+                guide.last_gemini_update = datetime.utcnow()
+                db.session.commit()
+                # o guia em cache (tela de detalhes) inclui o último plano; vai
+                # logo depois do commit, antes de qualquer outro passo que possa
+                # falhar (o retry sai cedo, pelo plano já salvo)
+                set_guide_cache(entity_id, guide_payload(guide))
+                cache_disease_plan(entity_id, disease_name, health_data)
+
+            waiters = complete_flight("health", entity_id, flight_name, token=flight_token)
+            flight_token = None
+
+            notified = _notify_users_of_species(
+                [user_id_to_notify, *waiters],
+                entity_id,
+                title="Plano de Saúde Pronto!",
+                body=f"O plano de tratamento para '{disease_name}' na sua '{guide.scientific_name}' está pronto."
+            )
+
+            click.secho(f"--- [CELERY WORKER - Health]: Plano de tratamento para {disease_name} salvo com sucesso ({notified} usuários avisados). ---", fg='green')
             
     except Exception as exc:
         click.secho(f"--- [CELERY WORKER - Health]: ERRO ao buscar plano de tratamento: {exc} ---", fg="red")
         db.session.rollback()
-        try:
-             self.retry(exc=exc)
-        except self.MaxRetriesExceededError:
+        if flight_token:
+            release_flight("health", entity_id, flight_name, token=flight_token)
+        if self.request.retries >= self.max_retries:
             click.secho(f"--- [CELERY WORKER - Health]: MÁXIMO DE TENTATIVAS ATINGIDO para {entity_id}. Desistindo. ---", fg="red")
-        finally:
-             with current_app.app_context():
-                db.session.remove()
+            _notify_flight_failure(
+                "health", (entity_id, flight_name), user_id_to_notify, entity_id,
+                title="Plano de Saúde Indisponível",
+                body=f"Não conseguimos gerar o plano de tratamento para '{disease_name}' agora. Tente novamente mais tarde."
+            )
+            raise
+        self.retry(exc=exc)
     finally:
          with current_app.app_context():
             db.session.remove()
 
 
-@shared_task(name="tasks.send_generic_push")
-def send_generic_push(fcm_token: str, title: str, body: str, data: dict = None):
-    """Envia uma notificação push genérica."""
-    with current_app.app_context():
-        try:
-            from app.services.push_notification_service import send_push_to_token
-            send_push_to_token(fcm_token, title, body, data)
-        except Exception as e:
-            click.secho(f"--- [CELERY WORKER - Push Genérico]: Falha ao enviar push: {e} ---", fg="red")
+@shared_task(name="tasks.process_identification_job", bind=True, max_retries=2, default_retry_delay=10)
+def process_identification_job(self, job_id: str):
+    """
+    Identificação assíncrona (/identify?async=1): lê a imagem guardada no
+    Redis, chama o Plant.id (com o cache por hash da imagem), adiciona a
+    planta ao jardim e publica o resultado no hash do job.
+    """
+    click.secho(f"--- [CELERY WORKER - Identify]: Processando o job {job_id} ---", bold=True)
+    try:
+        with current_app.app_context():
+            job = get_identify_job(job_id)
+            image_b64 = get_identify_job_image(job_id)
+            if not job or not image_b64 or job.get('status') in (JOB_COMPLETED, JOB_FAILED):
+                click.secho(f"--- [CELERY WORKER - Identify]: Job {job_id} expirado ou já finalizado. Abortando.", fg='yellow')
+                return
+
+            user = User.query.get(job['user_id'])
+            if not user:
+                update_identify_job(job_id, JOB_FAILED, error="Usuário não encontrado.")
+                return
+
+            update_identify_job(job_id, JOB_RUNNING)
+            latitude, longitude = job.get('latitude'), job.get('longitude')
+
+            plant_service = get_plant_id_service()
+            with ImageUpload.from_base64(image_b64) as upload:
+                identification, _ = cached_plant_id_call(
+                    "identify", user.id, upload, latitude, longitude,
+                    lambda: call_with_normalized_image(
+                        upload, lambda upload_b64: plant_service.identify_plant(upload_b64, latitude, longitude)
+                    )
+                )
+
+            result = add_identified_plant_to_garden(user, identification)
+            db.session.commit()
+            update_identify_job(job_id, JOB_COMPLETED, result=result)
+
+            click.secho(f"--- [CELERY WORKER - Identify]: Job {job_id} concluído ({result['scientific_name']}). ---", fg='green')
+
+    except Exception as exc:
+        click.secho(f"--- [CELERY WORKER - Identify]: ERRO no job {job_id}: {exc} ---", fg="red")
+        db.session.rollback()
+        # o retry(exc=) relança exc ao esgotar as tentativas: marca o job antes
+        if self.request.retries >= self.max_retries:
+            click.secho(f"--- [CELERY WORKER - Identify]: MÁXIMO DE TENTATIVAS ATINGIDO para o job {job_id}. Desistindo. ---", fg="red")
+            with current_app.app_context():
+                update_identify_job(job_id, JOB_FAILED, error="Não foi possível identificar a planta.")
+            raise
+        self.retry(exc=exc)
+    finally:
+         with current_app.app_context():
+            db.session.remove()
+
 
 @shared_task(name="tasks.update_watering_streak", bind=True)
 def update_watering_streak(self, user_id: str):
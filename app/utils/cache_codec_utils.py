@@ -0,0 +1,89 @@
+"""
+Codec dos valores grandes guardados no Redis (hoje, o guide:{entity_id}).
+
+Formato binário: cabeçalho de 3 bytes + corpo
+    0xC1 | versão | compressão (0 = nenhuma, 1 = zlib, 2 = zstd)
+seguido do msgpack (comprimido se passar de CACHE_COMPRESSION_MIN_BYTES).
+0xC1 nunca aparece no início de um JSON (nem é usado pelo msgpack), então
+valores sem o cabeçalho são lidos como o JSON antigo — as entradas gravadas
+antes do deploy continuam válidas até expirarem.
+
+O codec 'json' grava o formato antigo (texto, sem cabeçalho), para rollback.
+"""
+
+import json
+import zlib
+import msgpack
+from flask import current_app
+
+try:
+    import zstandard
+except ImportError:  # zstd é opcional; sem ele a compressão cai para zlib
+    zstandard = None
+
+CODEC_MAGIC = 0xC1
+CODEC_VERSION = 1
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+_COMPRESSION_IDS = {"none": COMPRESSION_NONE, "zlib": COMPRESSION_ZLIB, "zstd": COMPRESSION_ZSTD}
+
+CODECS = ("json", "msgpack")
+
+
+def _compress(body: bytes, compression: int) -> bytes:
+    if compression == COMPRESSION_ZLIB:
+        return zlib.compress(body, 6)
+    if compression == COMPRESSION_ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return body
+
+def _decompress(body: bytes, compression: int) -> bytes:
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(body)
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ValueError("Valor comprimido com zstd, mas o pacote zstandard não está instalado.")
+        return zstandard.ZstdDecompressor().decompress(body)
+    if compression == COMPRESSION_NONE:
+        return body
+    raise ValueError(f"Compressão desconhecida no cabeçalho do cache: {compression}")
+
+def encode_value(value, codec: str = "msgpack", compression: str = "zlib", min_compress_bytes: int = 1024) -> bytes:
+    """Serializa o valor no formato do codec (ver docstring do módulo)."""
+    if codec == "json":
+        return json.dumps(value).encode("utf-8")
+    if codec != "msgpack":
+        raise ValueError(f"Codec de cache desconhecido: {codec}")
+
+    body = msgpack.packb(value, use_bin_type=True)
+    compression_id = _COMPRESSION_IDS.get(compression, COMPRESSION_NONE)
+    if compression_id == COMPRESSION_ZSTD and zstandard is None:
+        compression_id = COMPRESSION_ZLIB
+    if len(body) < min_compress_bytes:
+        compression_id = COMPRESSION_NONE
+
+    return bytes((CODEC_MAGIC, CODEC_VERSION, compression_id)) + _compress(body, compression_id)
+
+def decode_value(raw: bytes | str):
+    """Lê tanto o formato binário quanto o JSON antigo."""
+    if isinstance(raw, str):
+        return json.loads(raw)
+    if not raw or raw[0] != CODEC_MAGIC:
+        return json.loads(raw)
+
+    version, compression_id = raw[1], raw[2]
+    if version != CODEC_VERSION:
+        raise ValueError(f"Versão de codec de cache não suportada: {version}")
+    return msgpack.unpackb(_decompress(raw[3:], compression_id), raw=False)
+
+def encode_cache_value(value) -> bytes:
+    """encode_value com o codec e a compressão configurados no app."""
+    config = current_app.config
+    return encode_value(
+        value,
+        codec=config.get('CACHE_CODEC', 'msgpack'),
+        compression=config.get('CACHE_COMPRESSION', 'zlib'),
+        min_compress_bytes=config.get('CACHE_COMPRESSION_MIN_BYTES', 1024)
+    )
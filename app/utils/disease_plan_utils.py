@@ -0,0 +1,82 @@
+"""
+Planos de tratamento por (espécie, doença). Cada par é gerado uma única vez
+pelo Gemini, salvo em plant_disease_plans e servido a todos os usuários por
+uma camada de leitura no Redis (disease_plan:{entity_id}:{doença}).
+O nome da doença é sempre o sugerido pelo Plant.id, comparado sem espaços
+nas pontas e em minúsculas (normalize_disease_name) no Redis e no Postgres.
+"""
+
+import json
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from app.extensions import db
+from app.models.database import PlantDiseasePlan
+from app.utils.metrics_utils import incr_metric
+
+DISEASE_PLAN_METRICS_GROUP = "disease_plan_cache"
+
+
+def normalize_disease_name(disease_name: str) -> str:
+    """Forma usada nas chaves e buscas: "Oídio " e "oídio" são a mesma doença."""
+    return disease_name.strip().lower()
+
+def _cache_key(entity_id: str, disease_name: str) -> str:
+    return f"disease_plan:{entity_id}:{normalize_disease_name(disease_name)}"
+
+def cache_disease_plan(entity_id: str, disease_name: str, plan: dict) -> None:
+    """Grava o plano no Redis. Chamar só depois do commit."""
+    try:
+        current_app.redis_client.set(
+            _cache_key(entity_id, disease_name),
+            json.dumps(plan),
+            ex=current_app.config.get('DISEASE_PLAN_CACHE_TTL', 60 * 60 * 24 * 7)
+        )
+    except Exception as e:
+        current_app.logger.warning(f"Falha ao gravar o plano de tratamento no Redis: {e}")
+
+def get_disease_plan(entity_id: str, disease_name: str) -> dict | None:
+    """
+    Busca o plano de tratamento (Redis -> Postgres). Retorna None se
+    ainda não foi gerado. NÃO CHAMA O GEMINI.
+    """
+    try:
+        cached = current_app.redis_client.get(_cache_key(entity_id, disease_name))
+        if cached:
+            incr_metric(DISEASE_PLAN_METRICS_GROUP, "redis_hit")
+            return json.loads(cached)
+    except Exception as e:
+        current_app.logger.error(f"Erro ao acessar o cache Redis: {e}")
+
+    plan = db.session.query(PlantDiseasePlan.plan).filter(
+        PlantDiseasePlan.entity_id == entity_id,
+        func.lower(PlantDiseasePlan.disease_name) == normalize_disease_name(disease_name)
+    ).scalar()
+
+    if plan is None:
+        incr_metric(DISEASE_PLAN_METRICS_GROUP, "miss")
+        return None
+
+    incr_metric(DISEASE_PLAN_METRICS_GROUP, "db_hit")
+    cache_disease_plan(entity_id, disease_name, plan)
+    return plan
+
+def save_disease_plan(entity_id: str, disease_name: str, plan: dict) -> None:
+    """
+    Insere ou atualiza o plano do par (espécie, doença) num único comando.
+    O conflito é pelo nome em minúsculas: a grafia salva é a do primeiro plano.
+    NÃO FAZ COMMIT - o chamador é responsável por isso.
+    """
+    now = datetime.utcnow()
+    statement = insert(PlantDiseasePlan).values(
+        entity_id=entity_id,
+        disease_name=disease_name.strip(),
+        plan=plan,
+        created_at=now,
+        updated_at=now
+    ).on_conflict_do_update(
+        index_elements=[PlantDiseasePlan.entity_id, func.lower(PlantDiseasePlan.disease_name)],
+        set_={"plan": plan, "updated_at": now}
+    )
+    db.session.execute(statement)
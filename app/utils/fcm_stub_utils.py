@@ -0,0 +1,127 @@
+"""
+Stub local da API do FCM (v1 messages:send), usado apenas pelas checagens
+do terminal (`flask check-push-queue`). O firebase_admin real fala com ele
+por HTTP, então o mapeamento de erros (UnregisteredError, QuotaExceededError...)
+é o mesmo da produção. O comportamento vem do prefixo do token:
+- unregistered-*  -> 404 UNREGISTERED (token inválido, não tenta de novo)
+- invalid-*       -> 400 INVALID_ARGUMENT (falha permanente)
+- flaky-*         -> 429 QUOTA_EXCEEDED na primeira vez, depois entrega
+- qualquer outro  -> entregue
+NUNCA é usado pelas rotas ou pelo celery.
+"""
+
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import firebase_admin
+from firebase_admin import credentials, messaging
+from google.auth.credentials import AnonymousCredentials
+
+_FCM_ERRORS = {
+    "unregistered-": (404, "NOT_FOUND", "UNREGISTERED"),
+    "invalid-": (400, "INVALID_ARGUMENT", "INVALID_ARGUMENT"),
+    "flaky-": (429, "RESOURCE_EXHAUSTED", "QUOTA_EXCEEDED"),
+}
+
+
+class _AnonymousCredential(credentials.Base):
+    """Credencial sem token: o stub não autentica."""
+
+    def get_credential(self):
+        return AnonymousCredentials()
+
+def _error_for(server, token: str) -> tuple | None:
+    for prefix, error in _FCM_ERRORS.items():
+        if not token.startswith(prefix):
+            continue
+        if prefix == "flaky-":
+            with server.lock:
+                server.attempts[token] += 1
+                if server.attempts[token] > 1:
+                    return None
+        return error
+    return None
+
+class _FcmStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        message = json.loads(self.rfile.read(length) or b"{}").get("message", {})
+        token = message.get("token", "")
+
+        error = _error_for(self.server, token)
+        if error:
+            status, grpc_status, fcm_code = error
+            payload = {"error": {
+                "code": status,
+                "message": f"Stub FCM: {fcm_code}",
+                "status": grpc_status,
+                "details": [{
+                    "@type": "type.googleapis.com/google.firebase.fcm.v1.FcmError",
+                    "errorCode": fcm_code
+                }]
+            }}
+        else:
+            status = 200
+            with self.server.lock:
+                self.server.delivered[token] += 1
+                message_id = sum(self.server.delivered.values())
+            payload = {"name": f"projects/plante-stub/messages/{message_id}"}
+
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FcmStubServer:
+    """
+    Sobe o stub numa porta livre em 127.0.0.1, numa thread, junto com um
+    app do firebase_admin apontado para ele.
+    Uso:
+        with FcmStubServer() as stub:
+            drain_push_queue(firebase_app=stub.firebase_app)
+            stub.delivered  # Counter token -> entregas
+    """
+
+    def __init__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _FcmStubHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.delivered = Counter()
+        self.server.attempts = Counter()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.firebase_app = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def delivered(self) -> Counter:
+        return self.server.delivered
+
+    def __enter__(self) -> "FcmStubServer":
+        self.thread.start()
+        self.firebase_app = firebase_admin.initialize_app(
+            _AnonymousCredential(),
+            options={"projectId": "plante-stub"},
+            name=f"fcm-stub-{id(self)}"
+        )
+        # o SDK não expõe a URL do FCM; só o stub a troca
+        service = messaging._get_messaging_service(self.firebase_app)
+        service._fcm_url = f"{self.base_url}/v1/projects/plante-stub/messages:send"
+        return self
+
+    def __exit__(self, *exc):
+        if self.firebase_app:
+            firebase_admin.delete_app(self.firebase_app)
+        self.server.shutdown()
+        self.server.server_close()
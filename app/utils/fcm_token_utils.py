@@ -0,0 +1,90 @@
+"""
+Invalidação de tokens FCM em massa. Tudo aqui é feito com UPDATEs
+set-based (UPDATE ... RETURNING) em vez de carregar os usuários um a um,
+apoiados pelos índices de users.fcm_token e users.fcm_token_updated_at.
+"""
+
+from datetime import datetime
+from sqlalchemy import select, update
+from app.extensions import db
+from app.models.database import User
+
+
+def invalidate_tokens(fcm_tokens: list[str]) -> list:
+    """
+    Limpa (fcm_token = NULL) os usuários que possuem algum dos tokens.
+    Retorna os ids afetados. NÃO FAZ COMMIT.
+    """
+    if not fcm_tokens:
+        return []
+
+    return db.session.execute(
+        update(User)
+        .where(User.fcm_token.in_(fcm_tokens))
+        .values(fcm_token=None, fcm_token_updated_at=None)
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+
+def _stale_filter(stale_before: datetime):
+    return (
+        User.fcm_token.isnot(None),
+        User.fcm_token_updated_at < stale_before
+    )
+
+def invalidate_stale_tokens(stale_before: datetime, batch_size: int = 1000, dry_run: bool = False, sample_size: int = 20) -> dict:
+    """
+    Invalida, em lotes de batch_size (um UPDATE ... RETURNING por lote,
+    cada um na sua transação), os tokens não atualizados desde stale_before.
+
+    Com dry_run=True nada é alterado: só conta e devolve alguns exemplos.
+    """
+    if dry_run:
+        total = db.session.query(User.id).filter(*_stale_filter(stale_before)).count()
+        sample = db.session.query(User.id, User.fcm_token_updated_at).filter(
+            *_stale_filter(stale_before)
+        ).order_by(User.fcm_token_updated_at).limit(sample_size).all()
+        return {
+            "dry_run": True,
+            "stale": total,
+            "invalidated": 0,
+            "batches": 0,
+            "sample": [(str(row.id), row.fcm_token_updated_at.isoformat()) for row in sample]
+        }
+
+    invalidated = 0
+    batches = 0
+    while True:
+        # SKIP LOCKED: não briga com quem está atualizando o token agora
+        batch_ids = (
+            select(User.id)
+            .where(*_stale_filter(stale_before))
+            .order_by(User.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        cleared_ids = db.session.execute(
+            update(User)
+            .where(User.id.in_(batch_ids))
+            .values(fcm_token=None, fcm_token_updated_at=None)
+            .returning(User.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.session.commit()
+
+        if not cleared_ids:
+            break
+
+        invalidated += len(cleared_ids)
+        batches += 1
+        if len(cleared_ids) < batch_size:
+            break
+
+    return {
+        "dry_run": False,
+        "stale": invalidated,
+        "invalidated": invalidated,
+        "batches": batches,
+        "sample": []
+    }
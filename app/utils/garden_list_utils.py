@@ -0,0 +1,109 @@
+"""
+Listagem do jardim (GET /garden/plants): uma única consulta por colunas,
+ordenada do mais novo para o mais antigo por (added_at, id) e paginada por
+keyset - a próxima página começa logo depois da última planta entregue, sem
+OFFSET, então o custo de cada página não cresce com o tamanho do jardim.
+O índice ix_user_garden_user_added_at (user_id, added_at, id) atende a
+ordenação.
+
+O cursor é opaco para o cliente: base64url de {"a": added_at, "i": id}.
+
+garden_list_version dá o carimbo de versão da lista (para o ETag) sem
+carregar as plantas.
+"""
+
+import base64
+import json
+from datetime import datetime
+from uuid import UUID
+from sqlalchemy import func, tuple_
+from werkzeug.exceptions import BadRequest
+from app.extensions import db
+from app.models.database import GardenTombstone, PlantGuide, UserPlant
+
+# Campos que a lista aceita em ?fields= -> coluna de origem
+GARDEN_LIST_COLUMNS = {
+    "id": UserPlant.id,
+    "nickname": UserPlant.nickname,
+    "scientific_name": PlantGuide.scientific_name,
+    "added_at": UserPlant.added_at,
+    "last_watered": UserPlant.last_watered,
+    "tracked_watering": UserPlant.tracked_watering,
+    "primary_image_url": UserPlant.primary_image_url,
+}
+# Resposta padrão (a mesma de antes da paginação)
+DEFAULT_GARDEN_LIST_FIELDS = ("id", "nickname", "scientific_name", "last_watered", "tracked_watering", "primary_image_url")
+
+
+def encode_cursor(added_at: datetime, plant_id) -> str:
+    raw = json.dumps({"a": added_at.isoformat(), "i": str(plant_id)})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(data["a"]), UUID(data["i"])
+    except (ValueError, KeyError, TypeError, UnicodeError):
+        raise BadRequest("Cursor de paginação inválido.")
+
+def parse_list_fields(fields: list[str] | None) -> tuple[str, ...]:
+    """Valida o ?fields= da lista; None -> campos padrão."""
+    if not fields:
+        return DEFAULT_GARDEN_LIST_FIELDS
+    unknown = [field for field in fields if field not in GARDEN_LIST_COLUMNS]
+    if unknown:
+        raise BadRequest(f"Campos desconhecidos: {', '.join(unknown)}.")
+    return tuple(dict.fromkeys(fields))
+
+def _serialize(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def fetch_garden_page(user_id, fields=DEFAULT_GARDEN_LIST_FIELDS, limit: int | None = None,
+                      cursor: str | None = None) -> tuple[list[dict], str | None]:
+    """
+    Retorna (plantas, next_cursor). Sem limit devolve o jardim inteiro
+    (next_cursor None). Só faz o JOIN com o guia se scientific_name foi pedido
+    e nunca carrega os JSONBs do guia.
+    """
+    # added_at e id sempre entram: são a chave do cursor
+    selected = dict.fromkeys(("id", "added_at", *fields))
+    query = db.session.query(*(GARDEN_LIST_COLUMNS[field].label(field) for field in selected))
+    if "scientific_name" in selected:
+        query = query.join(PlantGuide, UserPlant.plant_entity_id == PlantGuide.entity_id)
+
+    query = query.filter(UserPlant.user_id == user_id)
+    if cursor:
+        cursor_added_at, cursor_id = decode_cursor(cursor)
+        query = query.filter(tuple_(UserPlant.added_at, UserPlant.id) < tuple_(cursor_added_at, cursor_id))
+    query = query.order_by(UserPlant.added_at.desc(), UserPlant.id.desc())
+
+    if limit is None:
+        rows = query.all()
+        next_cursor = None
+    else:
+        # uma linha a mais só para saber se existe próxima página
+        rows = query.limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].added_at, rows[-1].id)
+
+    plants = [{field: _serialize(getattr(row, field)) for field in fields} for row in rows]
+    return plants, next_cursor
+
+def garden_list_version(user_id) -> tuple:
+    """
+    (quantidade de plantas, último updated_at, última remoção) do jardim,
+    numa consulta só pelos índices (user_id, updated_at) e
+    (user_id, deleted_at). Qualquer inclusão, edição ou remoção muda o valor.
+    """
+    last_deleted_at = db.session.query(func.max(GardenTombstone.deleted_at)).filter(
+        GardenTombstone.user_id == user_id
+    ).scalar_subquery()
+    row = db.session.query(
+        func.count(UserPlant.id),
+        func.max(UserPlant.updated_at),
+        last_deleted_at
+    ).filter(UserPlant.user_id == user_id).one()
+    return tuple(row)
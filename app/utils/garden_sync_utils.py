@@ -0,0 +1,123 @@
+"""
+Sync incremental do jardim para o cache do app (GET /garden/changes).
+
+O app guarda o next_token da última resposta e pergunta "o que mudou desde
+então": plantas criadas/alteradas (updated_at), guias das espécies do
+jardim que foram reescritos (enrich / plano de saúde) e plantas removidas
+(garden_tombstones). Sem token - ou com um token mais antigo que a
+retenção dos tombstones - a resposta é um sync completo.
+
+O token é opaco (base64url do instante) e recua GARDEN_SYNC_OVERLAP_SECONDS
+para não perder linhas de transações que commitaram depois da leitura;
+o app deve tratar upserts repetidos como idempotentes.
+"""
+
+import base64
+from datetime import datetime, timedelta
+from flask import current_app
+from werkzeug.exceptions import BadRequest
+from app.extensions import db
+from app.models.database import GardenTombstone, PlantGuide, UserPlant
+from app.utils.guide_cache_utils import get_guide_data_since
+
+
+def encode_sync_token(moment: datetime) -> str:
+    return base64.urlsafe_b64encode(moment.isoformat().encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_sync_token(token: str) -> datetime:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        return datetime.fromisoformat(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeError):
+        raise BadRequest("Token de sincronização inválido.")
+
+def record_plant_tombstone(user_id, plant_id) -> None:
+    """Registra a remoção de uma planta. Adiciona ao db.session, mas NÃO FAZ COMMIT."""
+    db.session.add(GardenTombstone(user_id=user_id, plant_id=plant_id))
+
+def _serialize_plant(row) -> dict:
+    return {
+        "id": row.id,
+        "entity_id": row.plant_entity_id,
+        "nickname": row.nickname,
+        "added_at": row.added_at.isoformat() if row.added_at else None,
+        "last_watered": row.last_watered.isoformat() if row.last_watered else None,
+        "care_notes": row.care_notes,
+        "tracked_watering": row.tracked_watering,
+        "primary_image_url": row.primary_image_url,
+        "updated_at": row.updated_at.isoformat()
+    }
+
+def get_garden_changes(user_id, since_token: str | None = None) -> dict:
+    """
+    Retorna {"full_sync", "upserts", "deletes", "guides", "next_token"}.
+    'guides' traz, por entity_id, o guia (via cache, na versão do banco ou
+    mais nova) das espécies novas ou alteradas no jardim; 'deletes' são ids
+    de plantas removidas.
+    """
+    config = current_app.config
+    now = datetime.utcnow()
+    next_token = encode_sync_token(now - timedelta(seconds=config.get('GARDEN_SYNC_OVERLAP_SECONDS', 5)))
+
+    since = decode_sync_token(since_token) if since_token else None
+    retention = timedelta(days=config.get('GARDEN_TOMBSTONE_RETENTION_DAYS', 30))
+    full_sync = since is None or since < now - retention
+
+    plants_query = db.session.query(
+        UserPlant.id,
+        UserPlant.plant_entity_id,
+        UserPlant.nickname,
+        UserPlant.added_at,
+        UserPlant.last_watered,
+        UserPlant.care_notes,
+        UserPlant.tracked_watering,
+        UserPlant.primary_image_url,
+        UserPlant.updated_at
+    ).filter(UserPlant.user_id == user_id)
+    if not full_sync:
+        plants_query = plants_query.filter(UserPlant.updated_at > since)
+    upserts = [_serialize_plant(row) for row in plants_query.order_by(UserPlant.updated_at)]
+
+    entity_ids = {plant["entity_id"] for plant in upserts}
+    deletes = []
+    if not full_sync:
+        # guias reescritos das espécies que o usuário já tinha
+        changed_guides = db.session.query(PlantGuide.entity_id).join(
+            UserPlant, UserPlant.plant_entity_id == PlantGuide.entity_id
+        ).filter(
+            UserPlant.user_id == user_id,
+            PlantGuide.updated_at > since
+        ).distinct()
+        entity_ids.update(row.entity_id for row in changed_guides)
+
+        deletes = [
+            row.plant_id for row in db.session.query(GardenTombstone.plant_id).filter(
+                GardenTombstone.user_id == user_id,
+                GardenTombstone.deleted_at > since
+            )
+        ]
+
+    # versão de cada guia no banco: o conteúdo vem do cache, mas nunca mais
+    # velho que ela (senão o token avançaria sem o app receber a reescrita)
+    guide_versions = dict(
+        db.session.query(PlantGuide.entity_id, PlantGuide.updated_at).filter(
+            PlantGuide.entity_id.in_(entity_ids)
+        )
+    ) if entity_ids else {}
+
+    return {
+        "full_sync": full_sync,
+        "upserts": upserts,
+        "deletes": deletes,
+        "guides": {
+            entity_id: get_guide_data_since(entity_id, guide_versions.get(entity_id))
+            for entity_id in sorted(entity_ids)
+        },
+        "next_token": next_token
+    }
+
+def prune_tombstones(older_than: datetime) -> int:
+    """Apaga os tombstones anteriores a older_than. NÃO FAZ COMMIT."""
+    return GardenTombstone.query.filter(
+        GardenTombstone.deleted_at < older_than
+    ).delete(synchronize_session=False)
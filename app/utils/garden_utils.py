@@ -0,0 +1,67 @@
+"""
+Inserção de uma planta identificada pelo Plant.id no jardim do usuário.
+Compartilhado entre o /identify síncrono e a task do modo assíncrono
+(process_identification_job), para que os dois caminhos gravem o mesmo.
+"""
+
+from app.extensions import db
+from app.models.database import User, PlantGuide, UserPlant
+from app.utils.achievement_utils import grant_achievement_if_not_exists
+
+
+def add_identified_plant_to_garden(user: User, identification: dict) -> dict:
+    """
+    Salva o guia global (se novo) e a planta no jardim, concedendo as
+    conquistas de quantidade. Retorna o corpo de resposta do /identify.
+    Adiciona ao db.session, mas NÃO FAZ COMMIT.
+    """
+    best_match = identification['result']['classification']['suggestions'][0]
+    entity_id = best_match['details']['entity_id']
+    scientific_name = best_match['name']
+
+    # Extrai a URL da imagem do Plant.id
+    image_url_from_plantid = identification.get('input', {}).get('images', [None])[0]
+
+    # Salva no Guia Global (se não existir)
+    guide_from_db = PlantGuide.query.get(entity_id)
+    if not guide_from_db:
+        guide_from_db = PlantGuide(
+            entity_id=entity_id,
+            scientific_name=scientific_name
+            # Caches 'details', 'nutritional', 'health' começam como NULL
+        )
+        db.session.add(guide_from_db)
+
+    # Salva no Jardim do Usuário
+    user_plant = UserPlant.query.filter_by(user_id=user.id, plant_entity_id=entity_id).first()
+    if not user_plant:
+        # --- LÓGICA DE CONQUISTA ---
+        # Verifica o número de plantas ANTES de adicionar a nova
+        plant_count = user.garden.count()
+        if plant_count == 0:
+            grant_achievement_if_not_exists(user, 'first_plant')
+        if plant_count == 9:
+            grant_achievement_if_not_exists(user, 'ten_plants')
+
+        user_plant = UserPlant(
+            user_id=user.id,
+            plant_entity_id=entity_id,
+            nickname=scientific_name,
+            primary_image_url=image_url_from_plantid
+        )
+        db.session.add(user_plant)
+    else:
+        # Se já tem a planta, atualiza a imagem principal
+        user_plant.primary_image_url = image_url_from_plantid
+
+    # garante o id da planta nova antes do commit do chamador
+    db.session.flush()
+
+    return {
+        "user_plant_id": user_plant.id,
+        "nickname": user_plant.nickname,
+        "scientific_name": scientific_name,
+        "tracked_watering": user_plant.tracked_watering,
+        "primary_image_url": user_plant.primary_image_url,
+        "identification_data": identification
+    }
@@ -0,0 +1,144 @@
+"""
+Stub local da API do Gemini (generateContent), usado apenas pelos
+benchmarks do terminal (`flask benchmark-gemini-modes`). Responde com
+JSON válido para o schema pedido e devolve um usageMetadata estimado
+(~4 caracteres por token), simulando a latência de geração.
+NUNCA é usado pelas rotas ou pelo celery.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_DETAILS = {
+    "popular_name": ["Costela-de-adão", "Monstera"],
+    "description": "Trepadeira tropical de folhas grandes e recortadas, muito usada em interiores.",
+    "taxonomy": {
+        "classe": "Liliopsida",
+        "genus": "Monstera",
+        "ordem": "Alismatales",
+        "familia": "Araceae",
+        "filo": "Tracheophyta"
+    },
+    "is_edible": True,
+    "water": "2 vezes por semana",
+    "watering_frequency_days": 4,
+    "season": "Primavera",
+    "sunlight": "Luz indireta brilhante",
+    "soil": "Substrato aerado, rico em matéria orgânica e bem drenado",
+    "origin": {
+        "country": "México",
+        "region": "América Central",
+        "habitat": "Florestas tropicais úmidas"
+    }
+}
+
+SAMPLE_NUTRITIONAL = {
+    "tea": ["Não é recomendada para chá."],
+    "food": {
+        "name": "Fruto maduro ao natural",
+        "ingredients": ["Fruto maduro de monstera"]
+    },
+    "heal": {
+        "how_to_use": "Não possui uso medicinal comprovado.",
+        "benefits": []
+    },
+    "seasoning": "Não é usada como tempero."
+}
+
+SAMPLE_DISEASE = {
+    "disease_name": "Mancha foliar",
+    "symptoms": ["Manchas marrons nas folhas"],
+    "treatment_plan": ["Remover folhas afetadas", "Reduzir a umidade das folhas"],
+    "recovery_time": "2 a 4 semanas"
+}
+
+
+def _schema_properties(generation_config: dict) -> set:
+    schema = generation_config.get("responseSchema") or generation_config.get("responseJsonSchema") or {}
+    return set((schema.get("properties") or {}).keys())
+
+def _sample_for(properties: set) -> dict:
+    if {"details", "nutritional"} <= properties:
+        return {"details": SAMPLE_DETAILS, "nutritional": SAMPLE_NUTRITIONAL}
+    if "tea" in properties:
+        return SAMPLE_NUTRITIONAL
+    if "disease_name" in properties:
+        return SAMPLE_DISEASE
+    return SAMPLE_DETAILS
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+class _GeminiStubHandler(BaseHTTPRequestHandler):
+    # keep-alive, como a API real (permite medir o reuso de conexões)
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request_body = json.loads(self.rfile.read(length) or b"{}")
+
+        prompt = " ".join(
+            part.get("text", "")
+            for content in request_body.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        answer = json.dumps(
+            _sample_for(_schema_properties(request_body.get("generationConfig", {}))),
+            ensure_ascii=False
+        )
+        prompt_tokens = _estimate_tokens(prompt)
+        output_tokens = _estimate_tokens(answer)
+
+        # latência fixa (rede + fila) + tempo proporcional aos tokens gerados
+        time.sleep(self.server.base_latency + output_tokens * self.server.per_token_latency)
+
+        payload = json.dumps({
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": answer}]},
+                "finishReason": "STOP"
+            }],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": output_tokens,
+                "totalTokenCount": prompt_tokens + output_tokens
+            }
+        }).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+class GeminiStubServer:
+    """
+    Sobe o stub numa porta livre em 127.0.0.1, numa thread.
+    Uso:
+        with GeminiStubServer(base_latency=0.5) as base_url:
+            GeminiService(api_key="stub", base_url=base_url)
+    """
+
+    def __init__(self, base_latency: float = 0.5, per_token_latency: float = 0.002):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _GeminiStubHandler)
+        self.server.daemon_threads = True
+        self.server.base_latency = base_latency
+        self.server.per_token_latency = per_token_latency
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> str:
+        self.thread.start()
+        return self.base_url
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,425 @@
+"""
+Leitura em camadas do guia botânico (nome científico, details, nutritional e
+o último plano de saúde) de uma espécie:
+memória do processo -> Redis (guide:{entity_id}) -> Postgres.
+
+Guias de espécies populares quase nunca mudam, então a primeira camada é um
+TTLCache limitado dentro de cada processo, que evita a ida ao Redis e
+a decodificação a cada leitura. Quando as tasks de enrich gravam dados
+novos, elas publicam o entity_id no canal GUIDE_INVALIDATION_CHANNEL e cada
+processo descarta a sua cópia local (thread ouvinte do pub/sub). O TTL
+local curto limita o atraso se alguma mensagem se perder.
+
+No Redis o valor é gravado com o codec de utils/cache_codec_utils
+(msgpack + compressão), pelo cliente binário do app, dentro de um envelope
+com expiração lógica. Contra o efeito manada quando muitas chaves expiram
+juntas: TTL com jitter, recomputação antecipada probabilística (XFetch) e
+um mutex curto por chave - só um processo vai ao Postgres, os demais
+servem o valor velho (ou esperam um pouco, se a chave sumiu).
+
+NUNCA CHAMA O GEMINI. Acertos por camada vão para o grupo de métricas
+'guide_cache' (`flask show-guide-cache`).
+"""
+
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from cachetools import TTLCache
+from flask import current_app
+from redis.exceptions import WatchError
+from app.models.database import PlantGuide
+from app.utils.metrics_utils import MetricsBuffer
+from app.utils.cache_codec_utils import encode_cache_value, decode_value
+
+GUIDE_CACHE_METRICS_GROUP = "guide_cache"
+GUIDE_INVALIDATION_CHANNEL = "guide:invalidate"
+# Valor publicado para limpar a camada local de todos os processos
+INVALIDATE_ALL = "*"
+# Campos do payload em cache; entradas sem algum deles são do formato
+# antigo (só details + nutritional) e são relidas do banco
+GUIDE_FIELDS = ("scientific_name", "details", "nutritional", "health", "updated_at")
+# Desfechos possíveis de uma leitura (somam o total de leituras)
+GUIDE_READ_OUTCOMES = ("local_hit", "redis_hit", "stale_hit", "refill_wait_hit", "db_hit", "miss")
+
+_guide_stats = MetricsBuffer(GUIDE_CACHE_METRICS_GROUP, 'GUIDE_CACHE_METRICS_FLUSH_EVERY', 100)
+_local_lock = threading.Lock()
+_local_cache = None
+# incrementado a cada invalidação recebida: uma leitura que começou antes
+# dela não pode gravar o valor (possivelmente velho) na camada local
+_invalidation_version = 0
+_listener_pid = None
+
+
+def _guide_key(entity_id: str) -> str:
+    return f"guide:{entity_id}"
+
+
+# =====================================================
+# CAMADA LOCAL (processo)
+# =====================================================
+def _get_local_cache() -> TTLCache:
+    global _local_cache
+    if _local_cache is None:
+        with _local_lock:
+            if _local_cache is None:
+                _local_cache = TTLCache(
+                    maxsize=current_app.config.get('GUIDE_LOCAL_CACHE_SIZE', 512),
+                    ttl=current_app.config.get('GUIDE_LOCAL_CACHE_TTL', 300)
+                )
+    return _local_cache
+
+def _local_get(entity_id: str) -> dict | None:
+    cache = _get_local_cache()
+    with _local_lock:
+        return cache.get(entity_id)
+
+def _local_set(entity_id: str, guide_data: dict, read_version: int) -> None:
+    cache = _get_local_cache()
+    with _local_lock:
+        if read_version == _invalidation_version:
+            cache[entity_id] = guide_data
+
+def _local_evict(entity_id: str) -> None:
+    global _invalidation_version
+    cache = _get_local_cache()
+    with _local_lock:
+        _invalidation_version += 1
+        if entity_id == INVALIDATE_ALL:
+            cache.clear()
+        else:
+            cache.pop(entity_id, None)
+
+def _reset_local_after_fork():
+    global _local_lock, _local_cache, _invalidation_version, _listener_pid
+    _local_lock = threading.Lock()
+    _local_cache = None
+    _invalidation_version = 0
+    _listener_pid = None
+    _guide_stats.reset()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_local_after_fork)
+
+
+# =====================================================
+# INVALIDAÇÃO (pub/sub)
+# =====================================================
+def _listen_for_invalidations(app) -> None:
+    """Loop da thread ouvinte; reconecta com backoff se o Redis cair."""
+    backoff = 1
+    while True:
+        try:
+            pubsub = app.redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(GUIDE_INVALIDATION_CHANNEL)
+            # mensagens publicadas enquanto estávamos desconectados se perderam
+            with app.app_context():
+                _local_evict(INVALIDATE_ALL)
+            backoff = 1
+
+            for message in pubsub.listen():
+                with app.app_context():
+                    _local_evict(message["data"])
+                    _guide_stats.incr("invalidations_received")
+        except Exception as e:
+            app.logger.warning(f"Ouvinte de invalidação do guia caiu, reconectando em {backoff}s: {e}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+def _ensure_listener() -> None:
+    """Sobe (uma vez por processo) a thread que ouve as invalidações."""
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _local_lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+
+    app = current_app._get_current_object()
+    threading.Thread(
+        target=_listen_for_invalidations,
+        args=(app,),
+        name="guide-cache-invalidation",
+        daemon=True
+    ).start()
+
+def publish_guide_invalidation(entity_id: str) -> None:
+    """Avisa todos os processos para descartarem a cópia local do guia."""
+    try:
+        current_app.redis_client.publish(GUIDE_INVALIDATION_CHANNEL, entity_id)
+    except Exception as e:
+        current_app.logger.warning(f"Falha ao publicar a invalidação do guia {entity_id}: {e}")
+
+
+# =====================================================
+# EXPIRAÇÃO (jitter + XFetch + mutex)
+# =====================================================
+# Custo de recomputar assumido quando o valor vem das tasks (sem medição)
+DEFAULT_RECOMPUTE_SECONDS = 0.05
+
+# Libera o mutex só se ele ainda pertencer a quem está liberando
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _refill_lock_key(entity_id: str) -> str:
+    return f"guide:refill:{entity_id}"
+
+def _guide_ttl(guide_data: dict) -> int:
+    """Guia ainda sem details/nutritional fica pouco tempo no Redis."""
+    if guide_data.get("details") and guide_data.get("nutritional"):
+        return current_app.config.get('GUIDE_CACHE_TTL', 60 * 60 * 24 * 7)
+    return current_app.config.get('GUIDE_PARTIAL_CACHE_TTL', 60)
+
+def _build_envelope(guide_data: dict, recompute_seconds: float) -> tuple[dict, int]:
+    """
+    Envelope gravado no Redis: o guia, a expiração lógica (com jitter, para
+    que chaves gravadas juntas não expirem juntas) e o custo de recomputar
+    (usado pelo XFetch). A chave física vive um pouco além da expiração
+    lógica, para que o valor velho possa ser servido enquanto um único
+    processo recarrega.
+    """
+    config = current_app.config
+    jitter = config.get('GUIDE_CACHE_TTL_JITTER', 0.1)
+    logical_ttl = _guide_ttl(guide_data) * random.uniform(1 - jitter, 1 + jitter)
+    stale_seconds = min(config.get('GUIDE_CACHE_STALE_SECONDS', 60 * 60), logical_ttl)
+
+    envelope = {
+        "guide": guide_data,
+        "expires_at": time.time() + logical_ttl,
+        "delta": recompute_seconds
+    }
+    return envelope, max(1, int(logical_ttl + stale_seconds))
+
+def _unwrap(cached) -> tuple[dict | None, float, float]:
+    """
+    (guia, expires_at, delta) de um valor do Redis. Entradas anteriores ao envelope
+    são servidas, mas tratadas como já expiradas; as do formato antigo
+    (sem os campos de GUIDE_FIELDS) não são servidas.
+    """
+    if isinstance(cached, dict) and "expires_at" in cached and "guide" in cached:
+        return cached["guide"], cached["expires_at"], cached.get("delta", DEFAULT_RECOMPUTE_SECONDS)
+    if isinstance(cached, dict) and all(field in cached for field in GUIDE_FIELDS):
+        return cached, 0.0, DEFAULT_RECOMPUTE_SECONDS
+    return None, 0.0, DEFAULT_RECOMPUTE_SECONDS
+
+def _should_refresh(expires_at: float, delta: float) -> bool:
+    """
+    XFetch (recomputação antecipada probabilística): quanto mais perto da
+    expiração e mais caro recomputar, maior a chance desta leitura recarregar
+    antes do prazo. GUIDE_XFETCH_BETA=0 só recarrega depois de expirar.
+    """
+    beta = current_app.config.get('GUIDE_XFETCH_BETA', 1.0)
+    # 1 - random() fica em (0, 1], evitando log(0)
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+def _acquire_refill_lock(entity_id: str) -> str | None:
+    """Mutex curto: só um processo recarrega a chave do banco por vez."""
+    lock_ms = current_app.config.get('GUIDE_REFILL_LOCK_MS', 5000)
+    if not lock_ms:
+        return ""
+    token = uuid.uuid4().hex
+    if current_app.redis_client.set(_refill_lock_key(entity_id), token, nx=True, px=lock_ms):
+        return token
+    return None
+
+def _release_refill_lock(entity_id: str, token: str) -> None:
+    if not token:
+        return
+    try:
+        current_app.redis_client.eval(_RELEASE_SCRIPT, 1, _refill_lock_key(entity_id), token)
+    except Exception as e:
+        # o mutex expira sozinho em GUIDE_REFILL_LOCK_MS
+        current_app.logger.warning(f"Falha ao liberar o mutex do guia {entity_id}: {e}")
+
+def _write_if_unchanged(entity_id: str, expected_raw: bytes | None, guide_data: dict, recompute_seconds: float) -> None:
+    """
+    Grava o guia recarregado só se a chave ainda tiver o valor que lemos
+    antes de ir ao banco: se uma task gravou algo novo nesse meio tempo,
+    o valor dela prevalece.
+    """
+    key = _guide_key(entity_id)
+    envelope, physical_ttl = _build_envelope(guide_data, recompute_seconds)
+    with current_app.redis_binary_client.pipeline() as pipe:
+        try:
+            pipe.watch(key)
+            if pipe.get(key) != expected_raw:
+                pipe.unwatch()
+                return
+            pipe.multi()
+            pipe.set(key, encode_cache_value(envelope), ex=physical_ttl)
+            pipe.execute()
+        except WatchError:
+            pass
+
+
+# =====================================================
+# LEITURA / ESCRITA
+# =====================================================
+def guide_payload(guide) -> dict:
+    """
+    Payload do cache a partir de um PlantGuide (ou linha com as mesmas colunas).
+    updated_at é a versão do guia no banco: quem precisa de uma versão mínima
+    (ETag, sync) compara com ela (ver get_guide_data_since).
+    """
+    return {
+        "scientific_name": guide.scientific_name,
+        "details": guide.details_cache,
+        "nutritional": guide.nutritional_cache,
+        "health": guide.health_cache,
+        "updated_at": guide.updated_at.isoformat() if guide.updated_at else None
+    }
+
+def guide_version(guide_data: dict | None) -> datetime | None:
+    """updated_at do guia em cache (None em entradas anteriores ao carimbo)."""
+    stamp = (guide_data or {}).get("updated_at")
+    return datetime.fromisoformat(stamp) if stamp else None
+
+def set_guide_cache(entity_id: str, guide_data: dict) -> None:
+    """
+    Grava o guia no Redis e invalida as cópias locais de todos os processos.
+    Chamar só depois do commit no Postgres.
+    """
+    try:
+        envelope, physical_ttl = _build_envelope(guide_data, DEFAULT_RECOMPUTE_SECONDS)
+        current_app.redis_binary_client.set(_guide_key(entity_id), encode_cache_value(envelope), ex=physical_ttl)
+    except Exception as e:
+        current_app.logger.error(f"Erro ao gravar o cache Redis do guia: {e}")
+    publish_guide_invalidation(entity_id)
+
+def _load_guide_from_db(entity_id: str) -> dict | None:
+    row = PlantGuide.query.with_entities(
+        PlantGuide.scientific_name,
+        PlantGuide.details_cache,
+        PlantGuide.nutritional_cache,
+        PlantGuide.health_cache,
+        PlantGuide.updated_at
+    ).filter(PlantGuide.entity_id == entity_id).first()
+    return guide_payload(row) if row else None
+
+def _refill_from_db(entity_id: str, expected_raw: bytes | None, write_back: bool = True) -> dict | None:
+    started = time.perf_counter()
+    guide_data = _load_guide_from_db(entity_id)
+    if guide_data is None:
+        _guide_stats.incr("miss")
+        return None
+
+    _guide_stats.incr("db_hit")
+    if write_back:
+        try:
+            _write_if_unchanged(entity_id, expected_raw, guide_data, time.perf_counter() - started)
+        except Exception as e:
+            current_app.logger.error(f"Erro ao repopular o cache Redis: {e}")
+    return guide_data
+
+def _wait_for_refill(entity_id: str) -> dict | None:
+    """Outro processo está recarregando a chave ausente: espera um pouco por ela."""
+    deadline = time.monotonic() + current_app.config.get('GUIDE_REFILL_WAIT_MS', 200) / 1000
+    while time.monotonic() < deadline:
+        time.sleep(0.02)
+        raw = current_app.redis_binary_client.get(_guide_key(entity_id))
+        if raw:
+            guide_data, _, _ = _unwrap(decode_value(raw))
+            if guide_data is not None:
+                return guide_data
+    return None
+
+def _get_from_redis_or_db(entity_id: str) -> tuple[dict | None, bool]:
+    """(guia, pode ir para a camada local). Valores velhos não vão."""
+    try:
+        raw = current_app.redis_binary_client.get(_guide_key(entity_id))
+        cached = decode_value(raw) if raw else None
+        guide_data, expires_at, delta = _unwrap(cached)
+
+        if guide_data is not None and not _should_refresh(expires_at, delta):
+            _guide_stats.incr("redis_hit")
+            return guide_data, True
+
+        token = _acquire_refill_lock(entity_id)
+        if token is None:
+            if guide_data is not None:
+                # outro processo já está recarregando: serve o valor velho
+                _guide_stats.incr("stale_hit")
+                return guide_data, False
+
+            guide_data = _wait_for_refill(entity_id)
+            if guide_data is not None:
+                _guide_stats.incr("refill_wait_hit")
+                return guide_data, True
+            # o dono do mutex demorou: lê do banco sem regravar
+            return _refill_from_db(entity_id, raw, write_back=False), True
+
+        try:
+            if guide_data is not None and time.time() < expires_at:
+                _guide_stats.incr("early_refresh")
+            return _refill_from_db(entity_id, raw), True
+        finally:
+            _release_refill_lock(entity_id, token)
+    except Exception as e:
+        current_app.logger.error(f"Erro ao acessar o cache Redis: {e}")
+        # Continua para o DB se o Redis falhar
+        return _refill_from_db(entity_id, None, write_back=False), True
+
+def get_guide_data(entity_id: str) -> dict | None:
+    """
+    Busca os dados do guia (memória -> Redis -> Postgres).
+    Os campos details/nutritional/health vêm None enquanto não forem gerados;
+    retorna None só se a espécie não tem guia.
+    """
+    use_local = current_app.config.get('GUIDE_LOCAL_CACHE_ENABLED', True)
+    read_version = _invalidation_version
+
+    if use_local:
+        _ensure_listener()
+        guide_data = _local_get(entity_id)
+        if guide_data is not None:
+            _guide_stats.incr("local_hit")
+            return guide_data
+
+    guide_data, cacheable = _get_from_redis_or_db(entity_id)
+    if guide_data is not None and use_local and cacheable:
+        _local_set(entity_id, guide_data, read_version)
+    return guide_data
+
+def get_guide_data_since(entity_id: str, min_updated_at: datetime | None) -> dict | None:
+    """
+    get_guide_data com versão mínima: min_updated_at é o PlantGuide.updated_at
+    lido no banco pelo chamador. Se a memória/Redis ainda têm uma versão
+    anterior (invalidação atrasada ou perdida), relê do Postgres, regrava o
+    Redis e invalida as cópias locais - o guia servido nunca é mais velho
+    que o carimbo que o chamador vai usar (ETag, token de sync).
+    """
+    guide_data = get_guide_data(entity_id)
+    if guide_data is None or min_updated_at is None:
+        return guide_data
+
+    cached_version = guide_version(guide_data)
+    if cached_version is not None and cached_version >= min_updated_at:
+        return guide_data
+
+    _guide_stats.incr("stale_version")
+    fresh = _load_guide_from_db(entity_id)
+    if fresh is not None:
+        _local_evict(entity_id)
+        set_guide_cache(entity_id, fresh)
+    return fresh
+
+def flush_guide_cache_stats() -> None:
+    _guide_stats.flush()
+
+def summarize_guide_cache_stats(metrics: dict) -> dict:
+    """Taxa de acerto de cada camada sobre o total de leituras."""
+    reads = sum(metrics.get(field, 0) for field in GUIDE_READ_OUTCOMES)
+    summary = dict(metrics)
+    summary["reads"] = reads
+    for field in GUIDE_READ_OUTCOMES:
+        summary[f"{field}_rate"] = round(metrics.get(field, 0) / reads, 3) if reads else None
+    return summary
@@ -0,0 +1,71 @@
+"""
+Estado das identificações assíncronas (/identify?async=1) no Redis.
+O job é um hash (identify_job:{job_id}) com status, dono e resultado; a
+imagem fica numa chave separada só até o worker consumi-la, para que a
+consulta de status nunca carregue o base64.
+"""
+
+import json
+import uuid
+from datetime import datetime
+from flask import current_app
+
+JOB_PENDING = "PENDING"
+JOB_RUNNING = "RUNNING"
+JOB_COMPLETED = "COMPLETED"
+JOB_FAILED = "FAILED"
+
+
+def _job_key(job_id: str) -> str:
+    return f"identify_job:{job_id}"
+
+def _image_key(job_id: str) -> str:
+    return f"identify_job:{job_id}:image"
+
+def _job_ttl() -> int:
+    return current_app.config.get('IDENTIFY_JOB_TTL', 60 * 60)
+
+def create_identify_job(user_id: str, image_b64: str, latitude, longitude) -> str:
+    """Guarda a imagem e cria o job como PENDING. Retorna o job_id."""
+    job_id = str(uuid.uuid4())
+    ttl = _job_ttl()
+
+    pipe = current_app.redis_client.pipeline(transaction=True)
+    pipe.set(_image_key(job_id), image_b64, ex=ttl)
+    pipe.hset(_job_key(job_id), mapping={
+        "status": JOB_PENDING,
+        "user_id": str(user_id),
+        "latitude": json.dumps(latitude),
+        "longitude": json.dumps(longitude),
+        "created_at": datetime.utcnow().isoformat()
+    })
+    pipe.expire(_job_key(job_id), ttl)
+    pipe.execute()
+    return job_id
+
+def get_identify_job(job_id: str) -> dict | None:
+    """Lê o job (sem a imagem). O resultado volta já decodificado."""
+    job = current_app.redis_client.hgetall(_job_key(job_id))
+    if not job:
+        return None
+    for field in ("latitude", "longitude", "result"):
+        if job.get(field) is not None:
+            job[field] = json.loads(job[field])
+    return job
+
+def get_identify_job_image(job_id: str) -> str | None:
+    return current_app.redis_client.get(_image_key(job_id))
+
+def update_identify_job(job_id: str, status: str, result: dict = None, error: str = None) -> None:
+    """Atualiza o status; ao terminar (COMPLETED/FAILED) descarta a imagem."""
+    fields = {"status": status, "updated_at": datetime.utcnow().isoformat()}
+    if result is not None:
+        fields["result"] = json.dumps(result, default=str)
+    if error is not None:
+        fields["error"] = error
+
+    pipe = current_app.redis_client.pipeline(transaction=True)
+    pipe.hset(_job_key(job_id), mapping=fields)
+    if status in (JOB_COMPLETED, JOB_FAILED):
+        pipe.delete(_image_key(job_id))
+    pipe.execute()
@@ -0,0 +1,160 @@
+"""
+Normalização das fotos antes do envio ao Plant.id: reduz para
+IMAGE_MAX_DIMENSION, corrige a orientação pelo EXIF, descarta os metadados
+e recomprime (JPEG/WebP). Celulares mandam fotos de vários MB e o Plant.id
+não precisa de tudo isso para identificar.
+
+O trabalho de CPU roda num pool de threads limitado (o Pillow libera o GIL
+no redimensionamento e na compressão). Se o pool estiver cheio (ou a
+normalização falhar), a imagem segue original em vez de enfileirar a
+requisição - mas, se for JPEG, sem os segmentos de metadados (EXIF/GPS),
+removidos direto nos bytes, sem recomprimir.
+
+Métricas no grupo 'image_normalize' (bytes economizados, tempo de
+normalização e latência das chamadas ao Plant.id com e sem normalização).
+"""
+
+import base64
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app.utils.metrics_utils import incr_metrics
+from app.utils.upload_utils import ImageUpload
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # sem Pillow a normalização é simplesmente desligada
+    Image = ImageOps = None
+
+IMAGE_METRICS_GROUP = "image_normalize"
+
+_executor = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers: int) -> tuple[ThreadPoolExecutor, threading.BoundedSemaphore]:
+    global _executor, _slots
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _slots = threading.BoundedSemaphore(workers * 2)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-normalize")
+    return _executor, _slots
+
+def _reset_executor_after_fork():
+    # as threads do pool não existem no processo filho
+    global _executor, _slots, _executor_lock
+    _executor = None
+    _slots = None
+    _executor_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_executor_after_fork)
+
+def _normalize_file(image_file, max_dimension: int, output_format: str, quality: int) -> bytes:
+    with Image.open(image_file) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        if output_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        output = io.BytesIO()
+        # sem o parâmetro exif o Pillow não copia os metadados (GPS, câmera...)
+        image.save(output, format=output_format, quality=quality, optimize=True)
+        return output.getvalue()
+
+def _strip_jpeg_metadata(data: bytes) -> bytes:
+    """
+    Remove os segmentos APP1-APP15 (EXIF, GPS, XMP...) e COM de um JPEG sem
+    decodificá-lo. Qualquer coisa que não seja um JPEG bem formado volta igual.
+    """
+    if data[:2] != b"\xff\xd8":
+        return data
+
+    output = bytearray(data[:2])
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return data
+        marker = data[position + 1]
+        if marker == 0xDA:  # início dos dados da imagem: o resto vai inteiro
+            output += data[position:]
+            return bytes(output)
+        length = int.from_bytes(data[position + 2:position + 4], "big")
+        segment_end = position + 2 + length
+        if length < 2 or segment_end > len(data):
+            return data
+        if not (0xE1 <= marker <= 0xEF or marker == 0xFE):
+            output += data[position:segment_end]
+        position = segment_end
+    return data
+
+def _original_b64(upload: ImageUpload) -> str:
+    """Imagem original para envio, sem os metadados quando for JPEG."""
+    return base64.b64encode(_strip_jpeg_metadata(upload.read_bytes())).decode("ascii")
+
+def normalize_image(upload: ImageUpload) -> tuple[str, bool]:
+    """
+    Retorna (base64 para envio, foi_normalizada). O base64 é gerado só aqui,
+    uma única vez. Em qualquer problema (Pillow ausente, imagem inválida,
+    pool cheio) envia a imagem original, sem os metadados quando for JPEG.
+    A versão normalizada vai mesmo se não ficar menor: é ela que não tem EXIF.
+    """
+    config = current_app.config
+    if Image is None or not config.get('IMAGE_NORMALIZE_ENABLED', True):
+        return _original_b64(upload), False
+
+    executor, slots = _get_executor(config.get('IMAGE_NORMALIZE_WORKERS', 2))
+    if not slots.acquire(blocking=False):
+        incr_metrics(IMAGE_METRICS_GROUP, {"skipped_busy": 1})
+        return _original_b64(upload), False
+
+    started = time.perf_counter()
+    try:
+        future = executor.submit(
+            _normalize_file,
+            upload.open(),
+            config.get('IMAGE_MAX_DIMENSION', 1500),
+            config.get('IMAGE_OUTPUT_FORMAT', 'JPEG').upper(),
+            config.get('IMAGE_QUALITY', 85)
+        )
+        # sem timeout: a thread lê o mesmo arquivo do upload, que só pode ser
+        # reaproveitado (fallback) depois que ela terminar
+        normalized = future.result()
+    except Exception as e:
+        current_app.logger.warning(f"Falha ao normalizar a imagem, enviando a original: {e}")
+        incr_metrics(IMAGE_METRICS_GROUP, {"failed": 1})
+        return _original_b64(upload), False
+    finally:
+        slots.release()
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    incr_metrics(IMAGE_METRICS_GROUP, {
+        "normalized": 1,
+        "not_smaller": int(len(normalized) >= upload.size),
+        "bytes_in": upload.size,
+        "bytes_out": len(normalized),
+        "bytes_saved": max(upload.size - len(normalized), 0),
+        "normalize_ms": elapsed_ms,
+    })
+    return base64.b64encode(normalized).decode("ascii"), True
+
+def call_with_normalized_image(upload: ImageUpload, call):
+    """
+    Normaliza a imagem e executa call(base64) (a chamada ao Plant.id),
+    registrando a latência separada por imagens normalizadas ou originais.
+    """
+    upload_b64, normalized = normalize_image(upload)
+    variant = "normalized" if normalized else "original"
+
+    started = time.perf_counter()
+    result = call(upload_b64)
+    incr_metrics(IMAGE_METRICS_GROUP, {
+        f"plant_id_calls_{variant}": 1,
+        f"plant_id_ms_{variant}": (time.perf_counter() - started) * 1000,
+    })
+    return result
@@ -0,0 +1,90 @@
+"""
+Contadores operacionais simples guardados no Redis (um hash por grupo,
+ex: 'metrics:singleflight'). Servem para acompanhar economia de chamadas,
+taxas de acerto de cache etc. pelo terminal (`flask show-metrics`).
+Falhas no Redis nunca devem quebrar a operação principal, então aqui
+tudo é tolerante a erro.
+"""
+
+import threading
+from flask import current_app, has_app_context
+
+METRICS_KEY_PREFIX = "metrics:"
+
+
+def incr_metrics(group: str, values: dict) -> None:
+    """Incrementa vários contadores de um grupo numa única ida ao Redis."""
+    if not values:
+        return
+    try:
+        pipe = current_app.redis_client.pipeline(transaction=False)
+        for field, amount in values.items():
+            if isinstance(amount, float):
+                pipe.hincrbyfloat(f"{METRICS_KEY_PREFIX}{group}", field, amount)
+            else:
+                pipe.hincrby(f"{METRICS_KEY_PREFIX}{group}", field, amount)
+        pipe.execute()
+    except Exception as e:
+        current_app.logger.warning(f"Falha ao registrar métricas '{group}': {e}")
+
+def incr_metric(group: str, field: str, amount: int | float = 1) -> None:
+    """Incrementa um único contador de um grupo."""
+    incr_metrics(group, {field: amount})
+
+def get_metrics(group: str) -> dict:
+    """Retorna todos os contadores de um grupo (valores numéricos)."""
+    raw = current_app.redis_client.hgetall(f"{METRICS_KEY_PREFIX}{group}")
+    metrics = {}
+    for field, value in raw.items():
+        try:
+            metrics[field] = int(value)
+        except ValueError:
+            metrics[field] = float(value)
+    return metrics
+
+def list_metric_groups() -> list[str]:
+    """Lista os grupos de métricas existentes."""
+    return sorted(
+        key[len(METRICS_KEY_PREFIX):]
+        for key in current_app.redis_client.scan_iter(match=f"{METRICS_KEY_PREFIX}*")
+    )
+
+def reset_metrics(group: str) -> None:
+    current_app.redis_client.delete(f"{METRICS_KEY_PREFIX}{group}")
+
+
+class MetricsBuffer:
+    """
+    Acumula contadores em memória e os envia ao Redis em lote, a cada
+    flush_every eventos, para contadores de caminhos quentes (ex: cada
+    leitura de cache ou requisição HTTP) não custarem uma ida ao Redis.
+    """
+
+    def __init__(self, group: str, flush_every_config_key: str, default_flush_every: int = 20):
+        self.group = group
+        self.flush_every_config_key = flush_every_config_key
+        self.default_flush_every = default_flush_every
+        self.reset()
+
+    def _flush_every(self) -> int:
+        return current_app.config.get(self.flush_every_config_key, self.default_flush_every)
+
+    def incr(self, field: str, amount: int | float = 1) -> None:
+        with self._lock:
+            self._pending[field] = self._pending.get(field, 0) + amount
+            self._events += 1
+            events = self._events
+
+        if has_app_context() and events >= self._flush_every():
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending, self._events = self._pending, {}, 0
+        incr_metrics(self.group, pending)
+
+    def reset(self) -> None:
+        """Descarta o acumulado (usado no processo filho depois de um fork)."""
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._events = 0
@@ -0,0 +1,164 @@
+"""
+Cache das respostas do Plant.id no Redis, endereçado pelo conteúdo da imagem.
+Apps costumam reenviar a mesma foto (retry, duplo toque), e cada chamada ao
+Plant.id é paga e demora segundos. A chave é o usuário + o sha256 dos bytes
+da imagem (calculado durante o upload, ver upload_utils) + as coordenadas
+arredondadas (2 casas, ~1km). O cache é por usuário: a resposta traz a URL
+da imagem enviada (vira a foto da planta no jardim) e o access_token da
+identificação, que nunca podem ir para outra pessoa.
+
+Opcionalmente (PLANT_ID_CACHE_PERCEPTUAL) também é calculado um dHash
+perceptual com o Pillow, para que a mesma foto recomprimida pelo celular
+(bytes diferentes, imagem igual) também acerte o cache. Recompressões mudam
+alguns bits do hash, então ele é dividido em 4 faixas de 16 bits: uma foto
+a até 3 bits de distância tem, com certeza, uma faixa idêntica, e só os
+candidatos dessas faixas são comparados pela distância de Hamming.
+Cada faixa é um ZSET (membro -> expiração), limpo dos vencidos e cortado em
+PLANT_ID_CACHE_BAND_MAX_MEMBERS a cada gravação. Imagens quase uniformes
+(hash com poucos ou muitos bits ligados) ficam de fora da busca perceptual,
+já que fotos diferentes sem textura geram praticamente o mesmo dHash.
+
+Falhas no Redis nunca impedem a chamada ao Plant.id.
+"""
+
+import json
+import time
+from flask import current_app
+from app.utils.metrics_utils import incr_metric
+from app.utils.upload_utils import ImageUpload
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow é opcional aqui: sem ele, só o hash exato é usado
+    Image = None
+
+PLANT_ID_CACHE_METRICS_GROUP = "plant_id_cache"
+PHASH_BANDS = 4
+# bits ligados mínimos (e, simetricamente, máximos) para o dHash valer
+PHASH_MIN_TEXTURE_BITS = 8
+
+
+def perceptual_hash(image_file, hash_size: int = 8) -> str | None:
+    """
+    dHash: reduz a imagem para (hash_size+1) x hash_size em tons de cinza e
+    compara cada pixel com o vizinho da direita. Recompressões e pequenos
+    redimensionamentos geram o mesmo hash. Retorna None sem o Pillow.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(image_file) as image:
+            pixels = list(
+                image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS).getdata()
+            )
+    except Exception:
+        return None
+
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+def _coordinates_suffix(latitude, longitude) -> str:
+    if latitude is None or longitude is None:
+        return "nogeo"
+    return f"{round(float(latitude), 2):.2f}:{round(float(longitude), 2):.2f}"
+
+def _content_key(kind: str, user_id, digest: str, coordinates: str) -> str:
+    return f"plantid:{kind}:{user_id}:sha:{digest}:{coordinates}"
+
+def _perceptual_band_keys(kind: str, user_id, phash: str, coordinates: str) -> list[str]:
+    width = len(phash) // PHASH_BANDS
+    return [
+        f"plantid:{kind}:{user_id}:phash:{band}:{phash[band * width:(band + 1) * width]}:{coordinates}"
+        for band in range(PHASH_BANDS)
+    ]
+
+def _has_texture(phash: str) -> bool:
+    total_bits = len(phash) * 4
+    set_bits = bin(int(phash, 16)).count("1")
+    return PHASH_MIN_TEXTURE_BITS <= set_bits <= total_bits - PHASH_MIN_TEXTURE_BITS
+
+def _hamming_distance(hash_a: str, hash_b: str) -> int:
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+def _find_similar_content_key(redis_client, band_keys: list[str], phash: str, max_distance: int) -> str | None:
+    """Procura, nas faixas do hash, a imagem já vista mais parecida."""
+    now = time.time()
+    pipe = redis_client.pipeline(transaction=False)
+    for band_key in band_keys:
+        pipe.zrangebyscore(band_key, now, "+inf")
+
+    best_key, best_distance = None, max_distance + 1
+    for members in pipe.execute():
+        for member in members:
+            candidate_hash, _, content_key = member.partition("|")
+            distance = _hamming_distance(phash, candidate_hash)
+            if distance < best_distance:
+                best_key, best_distance = content_key, distance
+    return best_key
+
+def cached_plant_id_call(kind: str, user_id, upload: ImageUpload, latitude, longitude, fetch) -> tuple[dict, bool]:
+    """
+    Busca a resposta do Plant.id no cache do usuário; se não houver, chama
+    fetch() e guarda o resultado. Retorna (resposta, veio_do_cache).
+    kind separa os tipos de chamada ('identify', 'health').
+    """
+    config = current_app.config
+    if not config.get('PLANT_ID_CACHE_ENABLED', True):
+        return fetch(), False
+
+    redis_client = current_app.redis_client
+    coordinates = _coordinates_suffix(latitude, longitude)
+    content_key = _content_key(kind, user_id, upload.digest, coordinates)
+    phash = perceptual_hash(upload.open()) if config.get('PLANT_ID_CACHE_PERCEPTUAL', False) else None
+    if phash and not _has_texture(phash):
+        phash = None
+    band_keys = _perceptual_band_keys(kind, user_id, phash, coordinates) if phash else None
+    # acima de PHASH_BANDS - 1 bits a busca por faixas deixa de ser garantida
+    max_distance = min(config.get('PLANT_ID_CACHE_PHASH_MAX_DISTANCE', 3), PHASH_BANDS - 1)
+
+    try:
+        cached = redis_client.get(content_key)
+        if cached:
+            incr_metric(PLANT_ID_CACHE_METRICS_GROUP, f"{kind}:hit")
+            return json.loads(cached), True
+
+        if band_keys:
+            similar_key = _find_similar_content_key(redis_client, band_keys, phash, max_distance)
+            cached = redis_client.get(similar_key) if similar_key else None
+            if cached:
+                incr_metric(PLANT_ID_CACHE_METRICS_GROUP, f"{kind}:hit_perceptual")
+                return json.loads(cached), True
+    except Exception as e:
+        current_app.logger.warning(f"Falha ao ler o cache do Plant.id: {e}")
+
+    incr_metric(PLANT_ID_CACHE_METRICS_GROUP, f"{kind}:miss")
+    response = fetch()
+
+    try:
+        payload = json.dumps(response)
+        if len(payload) > config.get('PLANT_ID_CACHE_MAX_BYTES', 256 * 1024):
+            incr_metric(PLANT_ID_CACHE_METRICS_GROUP, f"{kind}:too_large")
+            return response, False
+
+        ttl = config.get('PLANT_ID_CACHE_TTL', 60 * 60 * 24)
+        max_members = config.get('PLANT_ID_CACHE_BAND_MAX_MEMBERS', 64)
+        now = time.time()
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.set(content_key, payload, ex=ttl)
+        if band_keys:
+            for band_key in band_keys:
+                # cada membro expira junto com a sua resposta; a faixa guarda só os mais novos
+                pipe.zadd(band_key, {f"{phash}|{content_key}": now + ttl})
+                pipe.zremrangebyscore(band_key, "-inf", now)
+                pipe.zremrangebyrank(band_key, 0, -(max_members + 1))
+                pipe.expire(band_key, ttl)
+        pipe.execute()
+    except Exception as e:
+        current_app.logger.warning(f"Falha ao gravar o cache do Plant.id: {e}")
+
+    return response, False
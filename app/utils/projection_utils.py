@@ -0,0 +1,77 @@
+"""
+Projeção (recorte) das respostas grandes antes do jsonify.
+O payload do Plant.id traz imagens similares e todas as sugestões; o app
+só usa a melhor sugestão e poucos campos. A projeção mantém a mesma
+estrutura do JSON original, apenas sem os campos não pedidos, para que o
+cliente continue lendo os mesmos caminhos.
+
+Caminhos são pontilhados ("result.classification.suggestions.name") e,
+ao passar por uma lista, se aplicam a cada item dela.
+"""
+
+# Visão compacta padrão do /identify (o app lê estes caminhos)
+DEFAULT_IDENTIFICATION_FIELDS = (
+    "access_token",
+    "status",
+    "input.images",
+    "input.latitude",
+    "input.longitude",
+    "result.is_plant",
+    "result.classification.suggestions.id",
+    "result.classification.suggestions.name",
+    "result.classification.suggestions.probability",
+    "result.classification.suggestions.details",
+)
+
+
+def _build_tree(paths) -> dict:
+    tree = {}
+    for path in paths:
+        node = tree
+        for part in path.split("."):
+            node = node.setdefault(part, {})
+    return tree
+
+def _apply_tree(value, tree: dict):
+    # folha: o campo inteiro foi pedido
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_apply_tree(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {
+            key: _apply_tree(value[key], subtree)
+            for key, subtree in tree.items()
+            if key in value
+        }
+    return value
+
+def project(data, paths) -> dict:
+    """Mantém apenas os caminhos pedidos (mesma estrutura do original)."""
+    return _apply_tree(data, _build_tree(paths))
+
+def parse_fields_param(raw: str | None) -> list[str] | None:
+    """'a.b, c' -> ['a.b', 'c']; vazio/None -> None."""
+    if not raw:
+        return None
+    fields = [field.strip() for field in raw.split(",") if field.strip()]
+    return fields or None
+
+def project_identification(identification: dict, fields: list[str] | None = None,
+                           verbose: bool = False, top_n: int = 3) -> dict:
+    """
+    Recorta o payload do Plant.id:
+    - verbose: payload completo;
+    - fields: apenas os caminhos pedidos (sobre o payload completo);
+    - padrão: visão compacta com as top_n sugestões.
+    """
+    if verbose or not identification:
+        return identification
+    if fields:
+        return project(identification, fields)
+
+    compact = project(identification, DEFAULT_IDENTIFICATION_FIELDS)
+    suggestions = compact.get("result", {}).get("classification", {}).get("suggestions")
+    if isinstance(suggestions, list):
+        compact["result"]["classification"]["suggestions"] = suggestions[:top_n]
+    return compact
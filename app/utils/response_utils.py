@@ -1,17 +1,30 @@
 """
 Utilitário que facilita todos os retornos do sistema para
 que seja padronizado, garantindo mais eficiencia no resultado
-final e facilidade no tratamento posterior por app/site
+final e facilidade no tratamento posterior por app/site.
+
+Também concentra o GET condicional: ETags fortes montados a partir de
+carimbos de versão das linhas (updated_at, contagens), nunca do corpo
+renderizado, para que o 304 saia antes das consultas pesadas e da
+serialização.
 """
 
-from flask import jsonify
+import hashlib
+from flask import jsonify, make_response, request
 
-def make_success_response(data, message, status_code=200):
-    return jsonify({
+# sobe quando o formato de alguma resposta com ETag mudar (invalida os caches dos apps)
+ETAG_FORMAT_VERSION = "1"
+
+def make_success_response(data, message, status_code=200, meta=None):
+    body = {
         "status": "success",
         "data": data,
         "message": message
-    }), status_code
+    }
+    # meta (ex: next_cursor da paginação) só aparece quando existe
+    if meta is not None:
+        body["meta"] = meta
+    return jsonify(body), status_code
 
 def make_error_response(message, error_code, status_code):
     return jsonify({
@@ -19,4 +32,27 @@ def make_error_response(message, error_code, status_code):
         "data": None,
         "message": message,
         "error_code": error_code
-    }), status_code
\ No newline at end of file
+    }), status_code
+
+
+def make_etag(*version_parts) -> str:
+    """ETag forte a partir dos carimbos de versão (e da query string da requisição)."""
+    raw = "|".join([ETAG_FORMAT_VERSION, request.path, request.query_string.decode("latin-1"), *map(str, version_parts)])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def etag_matches(etag: str) -> bool:
+    """O cliente já tem essa versão (If-None-Match)?"""
+    return request.if_none_match.contains_weak(etag)
+
+def make_not_modified_response(etag: str, cache_control: str):
+    response = make_response("", 304)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+def with_cache_headers(response, etag: str, cache_control: str):
+    """Aplica ETag e Cache-Control a um retorno de make_success_response."""
+    body, status_code = response
+    body.set_etag(etag)
+    body.headers["Cache-Control"] = cache_control
+    return body, status_code
@@ -0,0 +1,141 @@
+"""
+Single-flight distribuído (Redis) para as gerações do Gemini.
+
+Quando vários workers querem gerar o mesmo conteúdo ao mesmo tempo
+(ex: dois usuários pedindo /analyze-deep da mesma espécie), apenas um
+deles - o "líder" - ganha a concessão (lease) e chama o Gemini. Os demais
+se registram como "espera" e são avisados pelo líder quando o resultado
+fica pronto, sem pagar por uma nova geração.
+
+Chaves usadas:
+- singleflight:{kind}:{chave}          -> lease do líder (SET NX EX)
+- singleflight:{kind}:{chave}:waiters  -> quem está esperando o resultado
+"""
+
+import uuid
+from flask import current_app
+from app.utils.metrics_utils import incr_metric
+
+DEFAULT_LEASE_SECONDS = 300
+
+# Libera a lease só se ela ainda pertencer a quem está liberando
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Libera a lease (se ainda for de quem conclui) e recolhe as esperas numa
+# operação só: um join_flight ou vê a lease e já está na lista, ou não vê
+# e tenta de novo - nunca fica órfão entre as duas etapas
+_COMPLETE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('del', KEYS[1])
+end
+local waiters = redis.call('smembers', KEYS[2])
+redis.call('del', KEYS[2])
+return waiters
+"""
+
+# Recolhe as esperas de uma geração abandonada, desde que nenhum outro
+# líder tenha assumido (senão elas são dele)
+_FAIL_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return {}
+end
+local waiters = redis.call('smembers', KEYS[2])
+redis.call('del', KEYS[2])
+return waiters
+"""
+
+
+class FlightUnavailableError(Exception):
+    """Não foi possível nem liderar nem entrar na espera; tentar de novo mais tarde."""
+
+def _flight_key(kind: str, key_parts: tuple) -> str:
+    normalized = ":".join(str(part).strip().lower() for part in key_parts)
+    return f"singleflight:{kind}:{normalized}"
+
+def _lease_seconds() -> int:
+    return current_app.config.get('SINGLEFLIGHT_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+
+def acquire_flight(kind: str, *key_parts) -> str | None:
+    """
+    Tenta se tornar o líder da geração (kind, *key_parts).
+    Retorna o token da lease se conseguiu, ou None se outro worker já é líder.
+    A lease expira sozinha caso o líder morra sem liberá-la.
+    """
+    token = uuid.uuid4().hex
+    acquired = current_app.redis_client.set(_flight_key(kind, key_parts), token, nx=True, ex=_lease_seconds())
+    if acquired:
+        incr_metric("singleflight", f"{kind}:leader")
+        return token
+    return None
+
+def join_flight(kind: str, *key_parts, waiter: str) -> bool:
+    """
+    Registra 'waiter' para ser avisado pelo líder atual.
+    Retorna False se a lease já não existe mais (líder terminou ou expirou
+    nesse meio tempo) - nesse caso o chamador deve tentar de novo.
+    """
+    key = _flight_key(kind, key_parts)
+    pipe = current_app.redis_client.pipeline()
+    pipe.sadd(f"{key}:waiters", waiter)
+    pipe.expire(f"{key}:waiters", _lease_seconds() * 2)
+    pipe.exists(key)
+    _, _, lease_exists = pipe.execute()
+
+    if lease_exists:
+        # cada espera é uma chamada ao Gemini que deixou de ser feita
+        incr_metric("singleflight", f"{kind}:joined")
+        return True
+    return False
+
+def complete_flight(kind: str, *key_parts, token: str) -> list[str]:
+    """
+    Finaliza a geração com sucesso: libera a lease e devolve (e limpa)
+    a lista de quem estava esperando o resultado, atomicamente.
+    """
+    key = _flight_key(kind, key_parts)
+    waiters = current_app.redis_client.eval(_COMPLETE_SCRIPT, 2, key, f"{key}:waiters", token)
+    return sorted(waiters)
+
+def fail_flight(kind: str, *key_parts) -> list[str]:
+    """
+    O líder desistiu (tentativas esgotadas) e a lease já foi liberada:
+    devolve (e limpa) as esperas para o chamador avisá-las da falha.
+    Se outro líder já assumiu, as esperas ficam com ele e a lista vem vazia.
+    """
+    key = _flight_key(kind, key_parts)
+    try:
+        return sorted(current_app.redis_client.eval(_FAIL_SCRIPT, 2, key, f"{key}:waiters"))
+    except Exception as e:
+        current_app.logger.error(f"Erro ao recolher esperas de single-flight: {e}")
+        return []
+
+def release_flight(kind: str, *key_parts, token: str) -> None:
+    """
+    Libera a lease sem concluir (ex: erro no Gemini). As esperas são mantidas
+    para o próximo líder (retry) avisá-las.
+    """
+    try:
+        current_app.redis_client.eval(_RELEASE_SCRIPT, 1, _flight_key(kind, key_parts), token)
+    except Exception as e:
+        current_app.logger.error(f"Erro ao liberar lease de single-flight: {e}")
+
+def acquire_or_join(kind: str, *key_parts, waiter: str, attempts: int = 3) -> str | None:
+    """
+    Atalho usado pelas tasks: vira líder (retorna o token) ou entra na
+    espera do líder atual (retorna None). Se o líder terminar entre as duas
+    operações, tenta de novo algumas vezes; se ainda assim não conseguir,
+    levanta FlightUnavailableError para a task fazer retry (o pedido não
+    pode ser descartado como se estivesse na espera).
+    """
+    for _ in range(attempts):
+        token = acquire_flight(kind, *key_parts)
+        if token:
+            return token
+        if join_flight(kind, *key_parts, waiter=waiter):
+            return None
+    raise FlightUnavailableError(f"Single-flight {kind} {key_parts}: nem lease nem espera após {attempts} tentativas.")
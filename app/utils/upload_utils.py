@@ -0,0 +1,134 @@
+"""
+Leitura das fotos enviadas ao /identify e ao /analyze-health.
+Aceita três formatos:
+- JSON com a imagem em base64 (formato original, campo 'image');
+- multipart/form-data com o arquivo no campo 'image';
+- corpo binário cru (Content-Type image/* ou application/octet-stream),
+  com latitude/longitude na query string.
+
+Em todos os casos a imagem vira um ImageUpload: os bytes ficam num arquivo
+temporário "spooled" (memória até UPLOAD_SPOOL_MAX_MEMORY, disco acima disso),
+o sha256 é calculado durante a cópia e o base64 só é gerado uma vez, logo
+antes da chamada ao Plant.id. O limite de tamanho (MAX_CONTENT_LENGTH) é
+aplicado pelo Flask antes de qualquer leitura do corpo.
+"""
+
+import base64
+import binascii
+import hashlib
+import shutil
+from tempfile import SpooledTemporaryFile
+from flask import current_app, request
+from werkzeug.exceptions import BadRequest
+
+_CHUNK_SIZE = 64 * 1024
+_RAW_CONTENT_TYPES = ("application/octet-stream",)
+
+
+class ImageUpload:
+    """Imagem recebida, guardada num SpooledTemporaryFile."""
+
+    def __init__(self, max_memory: int = None):
+        self._file = SpooledTemporaryFile(max_size=max_memory or current_app.config.get('UPLOAD_SPOOL_MAX_MEMORY', 1024 * 1024))
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self._sha256.update(chunk)
+        self.size += len(chunk)
+
+    @property
+    def digest(self) -> str:
+        return self._sha256.hexdigest()
+
+    def open(self):
+        """Arquivo rebobinado, pronto para leitura (ex: Image.open)."""
+        self._file.seek(0)
+        return self._file
+
+    def read_bytes(self) -> bytes:
+        return self.open().read()
+
+    def to_base64(self) -> str:
+        """Codifica em base64 (uma única vez, logo antes do envio)."""
+        return base64.b64encode(self.read_bytes()).decode("ascii")
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @classmethod
+    def from_stream(cls, stream, max_memory: int = None) -> "ImageUpload":
+        upload = cls(max_memory)
+        while True:
+            chunk = stream.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            upload.write(chunk)
+        return upload
+
+    @classmethod
+    def from_base64(cls, image_b64: str, max_memory: int = None) -> "ImageUpload":
+        """Aceita o prefixo 'data:image/...;base64,'. Levanta BadRequest se inválido."""
+        if image_b64.startswith("data:") and "," in image_b64:
+            image_b64 = image_b64.split(",", 1)[1]
+        try:
+            image_bytes = base64.b64decode(image_b64, validate=False)
+        except (binascii.Error, ValueError):
+            raise BadRequest("A imagem enviada não é um base64 válido.")
+
+        upload = cls(max_memory)
+        upload.write(image_bytes)
+        return upload
+
+
+def _parse_coordinate(value):
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise BadRequest("Latitude/longitude inválidas.")
+
+def read_image_upload(missing_message: str = "A imagem (em base64) é obrigatória.") -> tuple[ImageUpload, dict]:
+    """
+    Lê a imagem da requisição atual em qualquer um dos três formatos.
+    Retorna (upload, campos) - campos traz 'latitude' e 'longitude' (ou None).
+    O chamador deve fechar o upload (upload.close() ou with).
+    """
+    mimetype = request.mimetype or ""
+
+    if mimetype == "multipart/form-data":
+        file_storage = request.files.get('image')
+        if not file_storage:
+            raise BadRequest(missing_message)
+        upload = ImageUpload()
+        shutil.copyfileobj(file_storage.stream, upload, _CHUNK_SIZE)
+        fields = request.form
+
+    elif mimetype.startswith("image/") or mimetype in _RAW_CONTENT_TYPES:
+        upload = ImageUpload.from_stream(request.stream)
+        fields = request.args
+
+    else:
+        data = request.get_json(silent=True) or {}
+        image_b64 = data.get('image')
+        if not image_b64:
+            raise BadRequest(missing_message)
+        upload = ImageUpload.from_base64(image_b64)
+        fields = data
+
+    if upload.size == 0:
+        upload.close()
+        raise BadRequest(missing_message)
+
+    return upload, {
+        "latitude": _parse_coordinate(fields.get('latitude')),
+        "longitude": _parse_coordinate(fields.get('longitude')),
+    }
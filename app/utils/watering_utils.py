@@ -0,0 +1,198 @@
+"""
+Centraliza o cálculo da próxima rega (next_watering_due) das plantas
+do jardim. O valor fica salvo na própria UserPlant para que a verificação
+diária do celery só precise varrer as plantas que realmente estão vencidas,
+em vez de recalcular a data de todas as plantas monitoradas.
+"""
+
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from sqlalchemy import func, update
+from app.extensions import db
+from app.models.database import PlantGuide, UserPlant
+
+# Quantos dias cada unidade representa no texto livre do Gemini
+_UNIT_DAYS = {
+    'dia': 1,
+    'semana': 7,
+    'quinzena': 15,
+    'mes': 30,
+}
+
+_NUMBER_WORDS = {
+    'um': '1', 'uma': '1', 'dois': '2', 'duas': '2', 'tres': '3', 'quatro': '4',
+    'cinco': '5', 'seis': '6', 'sete': '7', 'oito': '8', 'dez': '10', 'quinze': '15',
+}
+
+# "a cada 3 dias", "a cada 7 a 10 dias", "a cada 2 semanas"
+_EVERY_N_PATTERN = re.compile(r'a cada (\d+(?:\.\d+)?)(?:\s*(?:a|-|ou)\s*(\d+(?:\.\d+)?))?\s*(dia|semana|quinzena|mes)')
+# "2 vezes por semana", "2-3x por semana", "1 vez ao dia"
+_TIMES_PER_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(?:\s*(?:a|-|ou)\s*(\d+(?:\.\d+)?))?\s*(?:x|vez|vezes)\s*(?:por|na|no|ao|a|em|cada)?\s*(dia|semana|quinzena|mes)')
+# Palavras-chave, da mais específica para a mais genérica
+_KEYWORD_DAYS = (
+    ('dia sim dia nao', 2),
+    ('todos os dias', 1),
+    ('diari', 1),
+    ('quinzena', 15),  # cobre 'quinzenal'
+    ('semanal', 7),
+    ('mensal', 30),
+)
+
+
+def _normalize_text(text: str) -> str:
+    """Minúsculas, sem acentos e com números por extenso trocados por dígitos."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r'\s+', ' ', re.sub(r'[,;]', ' ', text))
+    return re.sub(
+        r'\b(' + '|'.join(_NUMBER_WORDS) + r')\b',
+        lambda match: _NUMBER_WORDS[match.group(1)],
+        text
+    )
+
+def _average(low: str, high: str | None) -> float:
+    return (float(low) + float(high)) / 2 if high else float(low)
+
+def parse_watering_frequency_days(water_text) -> int | None:
+    """
+    Converte o texto livre do campo 'water' (guias antigos) em um
+    intervalo de rega em dias. Retorna None se não for possível entender.
+
+    Exemplos: "2 vezes por semana" -> 4, "a cada 10 dias" -> 10,
+    "semanalmente" -> 7, "3" (vezes por semana, formato antigo) -> 2.
+    """
+    if water_text is None:
+        return None
+
+    if isinstance(water_text, (int, float)):
+        # O schema antigo pedia "quantas vezes por semana"
+        return max(1, round(7 / water_text)) if water_text > 0 else None
+
+    text = _normalize_text(str(water_text))
+    if not text.strip():
+        return None
+
+    # Vale a frequência citada primeiro no texto: em "2 vezes por semana,
+    # a cada 3 dias no verão" a regra geral vem antes da sazonal
+    every_n = _EVERY_N_PATTERN.search(text)
+    times_per = _TIMES_PER_PATTERN.search(text)
+    if times_per and (not every_n or times_per.start() < every_n.start()):
+        times = _average(times_per.group(1), times_per.group(2))
+        if times > 0:
+            return max(1, round(_UNIT_DAYS[times_per.group(3)] / times))
+    if every_n:
+        days = _average(every_n.group(1), every_n.group(2)) * _UNIT_DAYS[every_n.group(3)]
+        return max(1, round(days))
+
+    for keyword, days in _KEYWORD_DAYS:
+        if keyword in text:
+            return days
+
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*', text)
+    if match and float(match.group(1)) > 0:
+        return max(1, round(7 / float(match.group(1))))
+
+    return None
+
+def extract_watering_frequency_days(details: dict | None) -> int | None:
+    """
+    Obtém o intervalo de rega de um details_cache: usa o campo numérico
+    (schema novo) e, se não existir, interpreta o texto livre de 'water'.
+    """
+    if not details or not isinstance(details, dict):
+        return None
+
+    structured = details.get('watering_frequency_days')
+    if isinstance(structured, (int, float)) and not isinstance(structured, bool) and structured > 0:
+        return max(1, round(structured))
+
+    return parse_watering_frequency_days(details.get('water'))
+
+def next_watering_due_sql():
+    """
+    Expressão SQL equivalente a compute_next_watering_due, usada nas
+    atualizações em massa (UPDATE ... FROM plant_guide).
+    """
+    base_date = func.date_trunc('day', func.coalesce(UserPlant.last_watered, UserPlant.added_at))
+    return base_date + func.make_interval(0, 0, 0, PlantGuide.watering_frequency_days)
+
+def compute_next_watering_due(last_watered: datetime | None, added_at: datetime | None, frequency_days: int | None) -> datetime | None:
+    """
+    Retorna a meia-noite (UTC) do dia em que a planta deve ser regada.
+    Sem frequência conhecida (guia ainda sem dados) retorna None.
+    """
+    base = last_watered or added_at
+    if base is None or frequency_days is None:
+        return None
+
+    base_midnight = datetime.combine(base.date(), datetime.min.time())
+    return base_midnight + timedelta(days=frequency_days)
+
+def get_watering_frequency_days(entity_id: str) -> int | None:
+    """Busca apenas a frequência de rega de um guia, sem carregar o JSONB."""
+    return db.session.query(PlantGuide.watering_frequency_days).filter(PlantGuide.entity_id == entity_id).scalar()
+
+def refresh_next_watering_due(user_plant: UserPlant) -> datetime | None:
+    """
+    Recalcula o next_watering_due de uma planta do jardim.
+    NÃO FAZ COMMIT - o chamador é responsável por isso.
+    """
+    frequency_days = get_watering_frequency_days(user_plant.plant_entity_id)
+    user_plant.next_watering_due = compute_next_watering_due(
+        user_plant.last_watered,
+        user_plant.added_at or datetime.utcnow(),
+        frequency_days
+    )
+    return user_plant.next_watering_due
+
+def refresh_next_watering_due_for_entity(entity_id: str) -> int:
+    """
+    Recalcula, num único UPDATE, o next_watering_due de todas as plantas
+    de uma espécie (ex: depois que o Gemini preencheu o guia).
+    NÃO FAZ COMMIT. Retorna o número de linhas atualizadas.
+    """
+    statement = (
+        update(UserPlant)
+        .where(UserPlant.plant_entity_id == PlantGuide.entity_id)
+        .where(PlantGuide.entity_id == entity_id)
+        .values(next_watering_due=next_watering_due_sql())
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(statement).rowcount
+
+def refresh_next_watering_due_for_ids(user_plant_ids: list) -> int:
+    """
+    Recalcula o next_watering_due de um lote de plantas (backfill / correção).
+    NÃO FAZ COMMIT. Retorna o número de linhas atualizadas.
+    """
+    if not user_plant_ids:
+        return 0
+
+    statement = (
+        update(UserPlant)
+        .where(UserPlant.plant_entity_id == PlantGuide.entity_id)
+        .where(UserPlant.id.in_(user_plant_ids))
+        .values(next_watering_due=next_watering_due_sql())
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(statement).rowcount
+
+def find_inconsistent_next_watering_due(limit: int | None = None):
+    """
+    Consulta as plantas cujo next_watering_due salvo difere do valor
+    calculado a partir do guia. Usada pelo verificador de consistência.
+    """
+    expected = next_watering_due_sql()
+    query = db.session.query(
+        UserPlant.id,
+        UserPlant.plant_entity_id,
+        UserPlant.next_watering_due,
+        expected.label('expected_next_watering_due')
+    ).join(PlantGuide, UserPlant.plant_entity_id == PlantGuide.entity_id
+    ).filter(UserPlant.next_watering_due.is_distinct_from(expected)
+    ).order_by(UserPlant.id)
+
+    if limit is not None:
+        query = query.limit(limit)
+    return query
@@ -26,6 +26,98 @@ class Config:
     PLANT_ID_API_KEY = os.getenv('PLANT_ID_API_KEY')
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
+    # modo da análise profunda: 'combined' (detalhes + nutrição numa única
+    # chamada, com fallback concorrente), 'concurrent' (duas chamadas ao mesmo
+    # tempo pelo cliente assíncrono) ou 'split' (duas chamadas em sequência).
+    GEMINI_DEEP_ANALYSIS_MODE = os.getenv('GEMINI_DEEP_ANALYSIS_MODE', 'combined')
+
+    # máximo de gerações do Gemini em voo ao mesmo tempo pelo AsyncGeminiService do processo
+    GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', 4))
+
+    # pools keep-alive dos clientes externos, um por processo (services/client_registry)
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 4))
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 10))
+    PLANT_ID_CONNECT_TIMEOUT = float(os.getenv('PLANT_ID_CONNECT_TIMEOUT', 5))
+    PLANT_ID_READ_TIMEOUT = float(os.getenv('PLANT_ID_READ_TIMEOUT', 60))
+    GEMINI_TIMEOUT_SECONDS = float(os.getenv('GEMINI_TIMEOUT_SECONDS', 120))
+    GEMINI_MAX_CONNECTIONS = int(os.getenv('GEMINI_MAX_CONNECTIONS', 10))
+    GEMINI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('GEMINI_MAX_KEEPALIVE_CONNECTIONS', 5))
+    GEMINI_KEEPALIVE_EXPIRY = float(os.getenv('GEMINI_KEEPALIVE_EXPIRY', 30))
+    # a cada quantos eventos (requisições/conexões) os contadores vão para o Redis
+    HTTP_CLIENT_METRICS_FLUSH_EVERY = int(os.getenv('HTTP_CLIENT_METRICS_FLUSH_EVERY', 20))
+
+    # cache das respostas do Plant.id por hash da imagem (utils/plant_id_cache_utils)
+    PLANT_ID_CACHE_ENABLED = os.getenv('PLANT_ID_CACHE_ENABLED', 'true').lower() == 'true'
+    PLANT_ID_CACHE_TTL = int(os.getenv('PLANT_ID_CACHE_TTL', 60 * 60 * 24))
+    PLANT_ID_CACHE_MAX_BYTES = int(os.getenv('PLANT_ID_CACHE_MAX_BYTES', 256 * 1024))
+    # dHash perceptual (requer Pillow): recompressões da mesma foto também acertam
+    PLANT_ID_CACHE_PERCEPTUAL = os.getenv('PLANT_ID_CACHE_PERCEPTUAL', 'false').lower() == 'true'
+    # bits diferentes tolerados entre os dHashes (máximo 3)
+    PLANT_ID_CACHE_PHASH_MAX_DISTANCE = int(os.getenv('PLANT_ID_CACHE_PHASH_MAX_DISTANCE', 3))
+    # imagens guardadas por faixa do dHash (as mais novas ficam)
+    PLANT_ID_CACHE_BAND_MAX_MEMBERS = int(os.getenv('PLANT_ID_CACHE_BAND_MAX_MEMBERS', 64))
+
+    # guia botânico (details + nutritional): TTL no Redis e camada em memória
+    # de cada processo, invalidada por pub/sub quando o guia é reescrito
+    GUIDE_CACHE_TTL = int(os.getenv('GUIDE_CACHE_TTL', 60 * 60 * 24 * 7))
+    # guia ainda sem details/nutritional: TTL curto no Redis
+    GUIDE_PARTIAL_CACHE_TTL = int(os.getenv('GUIDE_PARTIAL_CACHE_TTL', 60))
+    # proteção contra expiração em massa: jitter do TTL (fração), XFetch (beta; 0
+    # desliga), quanto tempo o valor velho pode ser servido, mutex de recarga
+    # (ms; 0 desliga) e quanto esperar pela recarga de uma chave ausente
+    GUIDE_CACHE_TTL_JITTER = float(os.getenv('GUIDE_CACHE_TTL_JITTER', 0.1))
+    GUIDE_XFETCH_BETA = float(os.getenv('GUIDE_XFETCH_BETA', 1.0))
+    GUIDE_CACHE_STALE_SECONDS = int(os.getenv('GUIDE_CACHE_STALE_SECONDS', 60 * 60))
+    GUIDE_REFILL_LOCK_MS = int(os.getenv('GUIDE_REFILL_LOCK_MS', 5000))
+    GUIDE_REFILL_WAIT_MS = int(os.getenv('GUIDE_REFILL_WAIT_MS', 200))
+    GUIDE_LOCAL_CACHE_ENABLED = os.getenv('GUIDE_LOCAL_CACHE_ENABLED', 'true').lower() == 'true'
+    GUIDE_LOCAL_CACHE_SIZE = int(os.getenv('GUIDE_LOCAL_CACHE_SIZE', 512))
+    GUIDE_LOCAL_CACHE_TTL = int(os.getenv('GUIDE_LOCAL_CACHE_TTL', 300))
+    GUIDE_CACHE_METRICS_FLUSH_EVERY = int(os.getenv('GUIDE_CACHE_METRICS_FLUSH_EVERY', 100))
+
+    # codec dos valores grandes do cache (guide:*): 'msgpack' ou 'json' (formato
+    # antigo); compressão 'zlib', 'zstd' (requer zstandard) ou 'none' acima do limite
+    CACHE_CODEC = os.getenv('CACHE_CODEC', 'msgpack')
+    CACHE_COMPRESSION = os.getenv('CACHE_COMPRESSION', 'zlib')
+    CACHE_COMPRESSION_MIN_BYTES = int(os.getenv('CACHE_COMPRESSION_MIN_BYTES', 1024))
+
+    # tempo de vida no Redis dos planos de tratamento por (espécie, doença)
+    DISEASE_PLAN_CACHE_TTL = int(os.getenv('DISEASE_PLAN_CACHE_TTL', 60 * 60 * 24 * 7))
+
+    # paginação da lista do jardim (GET /garden/plants?limit=&cursor=)
+    GARDEN_PAGE_DEFAULT_LIMIT = int(os.getenv('GARDEN_PAGE_DEFAULT_LIMIT', 50))
+    GARDEN_PAGE_MAX_LIMIT = int(os.getenv('GARDEN_PAGE_MAX_LIMIT', 200))
+
+    # sync incremental (GET /garden/changes): por quantos dias as remoções ficam
+    # registradas (tokens mais antigos recebem sync completo) e quanto o token
+    # recua para não perder transações que commitaram depois da leitura
+    GARDEN_TOMBSTONE_RETENTION_DAYS = int(os.getenv('GARDEN_TOMBSTONE_RETENTION_DAYS', 30))
+    GARDEN_SYNC_OVERLAP_SECONDS = int(os.getenv('GARDEN_SYNC_OVERLAP_SECONDS', 5))
+
+    # Cache-Control das leituras com ETag: o app revalida (If-None-Match) e
+    # recebe 304 quando nada mudou
+    GARDEN_LIST_CACHE_CONTROL = os.getenv('GARDEN_LIST_CACHE_CONTROL', 'private, no-cache')
+    PLANT_DETAILS_CACHE_CONTROL = os.getenv('PLANT_DETAILS_CACHE_CONTROL', 'private, no-cache')
+    PROFILE_CACHE_CONTROL = os.getenv('PROFILE_CACHE_CONTROL', 'private, max-age=60, must-revalidate')
+
+    # por quanto tempo um job de /identify?async=1 (status + imagem) fica no Redis
+    IDENTIFY_JOB_TTL = int(os.getenv('IDENTIFY_JOB_TTL', 60 * 60))
+
+    # limite do corpo das requisições (aplicado pelo Flask antes de ler o
+    # upload) e quanto de cada upload fica em memória antes de ir para o disco
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 15 * 1024 * 1024))
+    UPLOAD_SPOOL_MAX_MEMORY = int(os.getenv('UPLOAD_SPOOL_MAX_MEMORY', 1024 * 1024))
+
+    # sugestões do Plant.id mantidas na resposta compacta do /identify
+    IDENTIFY_TOP_SUGGESTIONS = int(os.getenv('IDENTIFY_TOP_SUGGESTIONS', 3))
+
+    # normalização das fotos antes do Plant.id (utils/image_utils)
+    IMAGE_NORMALIZE_ENABLED = os.getenv('IMAGE_NORMALIZE_ENABLED', 'true').lower() == 'true'
+    IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', 1500))
+    IMAGE_OUTPUT_FORMAT = os.getenv('IMAGE_OUTPUT_FORMAT', 'JPEG')  # 'JPEG' ou 'WEBP'
+    IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 85))
+    IMAGE_NORMALIZE_WORKERS = int(os.getenv('IMAGE_NORMALIZE_WORKERS', 2))
+
     # Itens específicos do banco de dados
     # estes compõem a database_url que o psycopg2 e sqlalchemy se conectam
     DB_USER = os.environ.get('DB_USER')
@@ -61,6 +153,31 @@ class Config:
     CELERY_RESULT_BACKEND = REDIS_URL
     CELERY_INCLUDE = ['app.tasks']
 
+    # tamanho de cada página (keyset) percorrida pela verificação diária de rega.
+    # mantém a memória do worker estável independente do número de plantas.
+    WATERING_SWEEP_CHUNK_SIZE = int(os.getenv('WATERING_SWEEP_CHUNK_SIZE', 500))
+
+    # quantas plantas são citadas pelo nome no resumo diário de rega
+    # (as demais aparecem como "e mais N plantas").
+    WATERING_DIGEST_MAX_NAMES = int(os.getenv('WATERING_DIGEST_MAX_NAMES', 3))
+
+    # tempo máximo (s) que um worker segura a geração de uma espécie no Gemini
+    # antes que outro possa assumir (single-flight do enrich).
+    SINGLEFLIGHT_LEASE_SECONDS = int(os.getenv('SINGLEFLIGHT_LEASE_SECONDS', 300))
+
+    # tokens FCM sem atualização há mais que isso são invalidados (semanalmente),
+    # em lotes de FCM_INVALIDATION_BATCH_SIZE usuários por UPDATE.
+    FCM_STALE_DAYS = int(os.getenv('FCM_STALE_DAYS', 60))
+    FCM_INVALIDATION_BATCH_SIZE = int(os.getenv('FCM_INVALIDATION_BATCH_SIZE', 1000))
+
+    # valida as notificações no Firebase sem entregá-las (testes/homologação)
+    FCM_DRY_RUN = os.getenv('FCM_DRY_RUN', 'false').lower() == 'true'
+
+    # fila de push: tentativas por notificação em falhas transitórias do FCM e
+    # tempo (s) sem sinal de vida até o lote de um worker voltar para a fila.
+    PUSH_MAX_ATTEMPTS = int(os.getenv('PUSH_MAX_ATTEMPTS', 5))
+    PUSH_PROCESSING_TIMEOUT_SECONDS = int(os.getenv('PUSH_PROCESSING_TIMEOUT_SECONDS', 300))
+
     # schedule é justamente de quanto em quanto tempo as notificações
     # são enviadas - por que é quando verificamos elas.
     CELERYBEAT_SCHEDULE = {
@@ -75,6 +192,14 @@ class Config:
         'check-user-longevity-daily': {
             'task': 'tasks.check_user_longevity',
             'schedule': crontab(hour=4, minute=0), # todo dia às 4h da manhã
+        },
+        'flush-push-queue': {
+            'task': 'tasks.flush_push_queue',
+            'schedule': crontab(minute='*/5'), # rede de segurança para a fila de push
+        },
+        'prune-garden-tombstones-daily': {
+            'task': 'tasks.prune_garden_tombstones',
+            'schedule': crontab(hour=5, minute=0), # todo dia às 5h da manhã
         }
     }
 
@@ -0,0 +1,29 @@
+"""Adiciona updated_at à tabela User
+
+Revision ID: 2f8c5a1e7b93
+Revises: 9e4a7b2c6d15
+Create Date: 2025-11-09 10:14:27.951306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f8c5a1e7b93'
+down_revision = '9e4a7b2c6d15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE users SET updated_at = coalesce(created_at, now() at time zone 'utc')")
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
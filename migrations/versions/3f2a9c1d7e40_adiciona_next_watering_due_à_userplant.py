@@ -0,0 +1,35 @@
+"""Adiciona next_watering_due à UserPlant
+
+Revision ID: 3f2a9c1d7e40
+Revises: 7bc9a382ac84
+Create Date: 2025-11-03 09:12:40.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7e40'
+down_revision = '7bc9a382ac84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_garden', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('next_watering_due', sa.DateTime(), nullable=True))
+        batch_op.create_index(
+            'ix_user_garden_next_watering_due',
+            ['next_watering_due', 'id'],
+            unique=False,
+            postgresql_where=sa.text('tracked_watering = true')
+        )
+
+    # Os valores existentes são preenchidos com `flask backfill-next-watering`
+
+
+def downgrade():
+    with op.batch_alter_table('user_garden', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_garden_next_watering_due', postgresql_where=sa.text('tracked_watering = true'))
+        batch_op.drop_column('next_watering_due')
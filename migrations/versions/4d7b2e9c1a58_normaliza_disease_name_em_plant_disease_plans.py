@@ -0,0 +1,42 @@
+"""Normaliza disease_name em plant_disease_plans
+
+Revision ID: 4d7b2e9c1a58
+Revises: 2f8c5a1e7b93
+Create Date: 2025-11-10 08:52:31.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d7b2e9c1a58'
+down_revision = '2f8c5a1e7b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Mantém só o plano mais recente de cada (espécie, nome sem espaços e em minúsculas)
+    op.execute("""
+        DELETE FROM plant_disease_plans p
+        USING plant_disease_plans newer
+        WHERE p.entity_id = newer.entity_id
+          AND lower(btrim(p.disease_name)) = lower(btrim(newer.disease_name))
+          AND (p.updated_at, p.id) < (newer.updated_at, newer.id)
+    """)
+    op.execute("UPDATE plant_disease_plans SET disease_name = btrim(disease_name) WHERE disease_name <> btrim(disease_name)")
+
+    with op.batch_alter_table('plant_disease_plans', schema=None) as batch_op:
+        batch_op.drop_constraint('_plant_disease_plan_uc', type_='unique')
+        batch_op.create_index(
+            'uq_plant_disease_plan_name',
+            ['entity_id', sa.text('lower(disease_name)')],
+            unique=True
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('plant_disease_plans', schema=None) as batch_op:
+        batch_op.drop_index('uq_plant_disease_plan_name')
+        batch_op.create_unique_constraint('_plant_disease_plan_uc', ['entity_id', 'disease_name'])
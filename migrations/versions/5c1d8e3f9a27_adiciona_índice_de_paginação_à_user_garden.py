@@ -0,0 +1,31 @@
+"""Adiciona índice de paginação à user_garden (added_at NOT NULL)
+
+Revision ID: 5c1d8e3f9a27
+Revises: e2b7d91f4a06
+Create Date: 2025-11-08 11:20:37.615094
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1d8e3f9a27'
+down_revision = 'e2b7d91f4a06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # added_at é a chave do cursor da lista: não pode ser nulo (NULLs vêm
+    # primeiro no DESC e nunca passam na comparação com o cursor)
+    op.execute("UPDATE user_garden SET added_at = coalesce(last_watered, now() at time zone 'utc') WHERE added_at IS NULL")
+    with op.batch_alter_table('user_garden', schema=None) as batch_op:
+        batch_op.alter_column('added_at', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index('ix_user_garden_user_added_at', ['user_id', 'added_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_garden', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_garden_user_added_at')
+        batch_op.alter_column('added_at', existing_type=sa.DateTime(), nullable=True)
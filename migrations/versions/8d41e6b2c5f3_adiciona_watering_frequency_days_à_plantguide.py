@@ -0,0 +1,28 @@
+"""Adiciona watering_frequency_days à PlantGuide
+
+Revision ID: 8d41e6b2c5f3
+Revises: 3f2a9c1d7e40
+Create Date: 2025-11-04 14:37:02.551873
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41e6b2c5f3'
+down_revision = '3f2a9c1d7e40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('plant_guide', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('watering_frequency_days', sa.Integer(), nullable=True))
+
+    # Os guias existentes são normalizados com `flask normalize-watering-frequency`
+
+
+def downgrade():
+    with op.batch_alter_table('plant_guide', schema=None) as batch_op:
+        batch_op.drop_column('watering_frequency_days')
@@ -0,0 +1,57 @@
+"""Adiciona updated_at e tabela garden_tombstones
+
+Revision ID: 9e4a7b2c6d15
+Revises: 5c1d8e3f9a27
+Create Date: 2025-11-08 15:02:44.380129
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4a7b2c6d15'
+down_revision = '5c1d8e3f9a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('garden_tombstones',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('plant_id', sa.UUID(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('garden_tombstones', schema=None) as batch_op:
+        batch_op.create_index('ix_garden_tombstones_user_deleted_at', ['user_id', 'deleted_at'], unique=False)
+
+    # Linhas existentes: usa a data que já temos (ou agora) como última alteração
+    with op.batch_alter_table('user_garden', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE user_garden SET updated_at = coalesce(added_at, now() at time zone 'utc')")
+    with op.batch_alter_table('user_garden', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', nullable=False)
+        batch_op.create_index('ix_user_garden_user_updated_at', ['user_id', 'updated_at'], unique=False)
+
+    with op.batch_alter_table('plant_guide', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE plant_guide SET updated_at = coalesce(last_gemini_update, now() at time zone 'utc')")
+    with op.batch_alter_table('plant_guide', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('plant_guide', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('user_garden', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_garden_user_updated_at')
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('garden_tombstones', schema=None) as batch_op:
+        batch_op.drop_index('ix_garden_tombstones_user_deleted_at')
+
+    op.drop_table('garden_tombstones')
@@ -0,0 +1,33 @@
+"""Adiciona índices de fcm_token à tabela User
+
+Revision ID: c6e0f4a2b918
+Revises: 8d41e6b2c5f3
+Create Date: 2025-11-06 10:02:51.884310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6e0f4a2b918'
+down_revision = '8d41e6b2c5f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_fcm_token', ['fcm_token'], unique=False, postgresql_using='hash')
+        batch_op.create_index(
+            'ix_users_fcm_token_updated_at',
+            ['fcm_token_updated_at'],
+            unique=False,
+            postgresql_where=sa.text('fcm_token IS NOT NULL')
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_fcm_token_updated_at', postgresql_where=sa.text('fcm_token IS NOT NULL'))
+        batch_op.drop_index('ix_users_fcm_token', postgresql_using='hash')
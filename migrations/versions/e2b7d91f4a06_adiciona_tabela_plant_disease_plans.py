@@ -0,0 +1,45 @@
+"""Adiciona tabela plant_disease_plans
+
+Revision ID: e2b7d91f4a06
+Revises: c6e0f4a2b918
+Create Date: 2025-11-07 09:41:12.204517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7d91f4a06'
+down_revision = 'c6e0f4a2b918'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('plant_disease_plans',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('entity_id', sa.String(length=50), nullable=False),
+    sa.Column('disease_name', sa.String(length=200), nullable=False),
+    sa.Column('plan', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['entity_id'], ['plant_guide.entity_id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('entity_id', 'disease_name', name='_plant_disease_plan_uc')
+    )
+
+    # Migra o plano que já estava salvo no health_cache de cada guia
+    op.execute("""
+        INSERT INTO plant_disease_plans (id, entity_id, disease_name, plan, created_at, updated_at)
+        SELECT gen_random_uuid(), entity_id, health_cache->>'disease_name', health_cache,
+               coalesce(last_gemini_update, now()), coalesce(last_gemini_update, now())
+        FROM plant_guide
+        WHERE health_cache IS NOT NULL AND health_cache->>'disease_name' IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """)
+
+
+def downgrade():
+    op.drop_table('plant_disease_plans')